@@ -0,0 +1,153 @@
+# aggregates.py
+# Precomputed rollups ("cubes") behind the dashboard's groupby tasks.
+import numpy as np
+import pandas as pd
+from config import CUBE_DIR
+from clean_data import country_from_place
+import geocode
+import storage
+
+# main cube grain
+DIMENSIONS = ["country", "continent", "year", "month", "depth_category", "magType", "net", "alert"]
+# time-of-day cube grain (Q8/Q9)
+TIME_DIMENSIONS = ["year", "weekday", "hour"]
+
+# additive measures: sums plus non-null counts, so means can be rebuilt after any merge
+SUM_MEASURES = ["mag", "depth_km", "tsunami", "rms", "gap"]
+# what the cubes and the tile pyramid are built from: diff_loads re-applies a row when any of these changed
+DIFF_COLUMNS = DIMENSIONS + SUM_MEASURES + ["time", "place", "latitude", "longitude"]
+
+
+def _dimension_frame(df):
+    # the dimension columns as plain strings/ints, with "unknown" for anything missing
+    dims = pd.DataFrame(index=df.index)
+    for col in DIMENSIONS:
+        if col in df.columns:
+            values = df[col]
+        elif col == "country" and "place" in df.columns:
+            values = country_from_place(df["place"])
+        elif col == "continent" and "latitude" in df.columns:
+            values = pd.Series(geocode.reverse_geocode(df["latitude"], df["longitude"])[1], index=df.index)
+        elif col in ("year", "month"):
+            values = getattr(df["time"].dt, col)
+        else:
+            values = pd.Series("unknown", index=df.index)
+        if col in ("year", "month"):
+            dims[col] = values.fillna(0).astype("int16")
+        else:
+            dims[col] = values.astype(object).fillna("unknown").astype(str)
+    return dims
+
+
+def build_cube(df):
+    """
+    Roll the cleaned events up to DIMENSIONS with additive measures:
+    events, <m>_sum and <m>_n (non-null count) for each of SUM_MEASURES.
+    """
+    frame = _dimension_frame(df)
+    frame["events"] = 1
+    for col in SUM_MEASURES:
+        values = pd.to_numeric(df[col], errors="coerce") if col in df.columns else pd.Series(np.nan, index=df.index)
+        frame[f"{col}_sum"] = values.fillna(0).astype("float64")
+        frame[f"{col}_n"] = values.notna().astype("int64")
+    return frame.groupby(DIMENSIONS, sort=True).sum().reset_index()
+
+
+def build_time_cube(df):
+    time = df["time"]
+    frame = pd.DataFrame({
+        "year": time.dt.year.fillna(0).astype("int16"),
+        "weekday": time.dt.day_name().fillna("unknown"),
+        "hour": time.dt.hour.fillna(-1).astype("int8"),
+        "events": 1,
+    })
+    return frame.groupby(TIME_DIMENSIONS, sort=True).sum().reset_index()
+
+
+def update_cube(cube, dims, added=None, removed=None, builder=build_cube):
+    """
+    Incrementally apply a data load to a cube: add the rollup of `added` rows and
+    subtract the rollup of `removed` rows (the previous versions of updated events).
+    """
+    parts = [cube.set_index(dims)]
+    if added is not None and len(added):
+        parts.append(builder(added).set_index(dims))
+    if removed is not None and len(removed):
+        parts.append(-builder(removed).set_index(dims))
+    if len(parts) == 1:
+        return cube
+    merged = pd.concat(parts).groupby(level=dims, sort=True).sum()
+    return merged[merged["events"] > 0].reset_index()
+
+
+def row_keys(df, columns=DIFF_COLUMNS):
+    """
+    One hash per row over its id and `columns` (by default every column the cubes
+    and tiles read), as stored after cleaning. Median fills follow the whole dataset,
+    so an event whose `updated` didn't change can still come out of a new load with other values.
+    """
+    values = {}
+    for col in ["id"] + [col for col in columns if col in df.columns and col != "id"]:
+        v = df[col]
+        # the same values hash alike whatever width the load downcast them to
+        if pd.api.types.is_datetime64_any_dtype(v):
+            v = v.astype("datetime64[ms]")
+        elif pd.api.types.is_numeric_dtype(v) and not pd.api.types.is_bool_dtype(v):
+            v = v.astype("float64")
+        values[col] = v
+    return pd.util.hash_pandas_object(pd.DataFrame(values), index=False)
+
+
+def diff_loads(previous, current):
+    # rows only in `current` (new, revised or re-filled) and rows only in `previous` (replaced/removed)
+    key_prev = row_keys(previous)
+    key_curr = row_keys(current)
+    added = current[~key_curr.isin(key_prev)]
+    removed = previous[~key_prev.isin(key_curr)]
+    return added, removed
+
+
+def save_cubes(cube, time_cube):
+    storage.save_table(cube, CUBE_DIR, "cube")
+    storage.save_table(time_cube, CUBE_DIR, "time_cube")
+
+
+def load_cubes():
+    # (cube, time_cube), or (None, None) if they haven't been built yet or predate a dimension
+    cube = storage.load_table(CUBE_DIR, "cube")
+    time_cube = storage.load_table(CUBE_DIR, "time_cube")
+    if cube is None or time_cube is None or not set(DIMENSIONS) <= set(cube.columns):
+        return None, None
+    return cube, time_cube
+
+
+def refresh_cubes(df_clean, previous=None):
+    """
+    Rebuild the cubes from the cleaned frame, or, when the previous cleaned load
+    and stored cubes are available, apply only the rows that changed between them.
+    """
+    cube, time_cube = load_cubes()
+    if previous is None or cube is None:
+        cube, time_cube = build_cube(df_clean), build_time_cube(df_clean)
+    else:
+        added, removed = diff_loads(previous, df_clean)
+        cube = update_cube(cube, DIMENSIONS, added, removed)
+        time_cube = update_cube(time_cube, TIME_DIMENSIONS, added, removed, builder=build_time_cube)
+    save_cubes(cube, time_cube)
+    return cube, time_cube
+
+
+def rollup(cube, by, where=None):
+    """
+    Re-aggregate a cube to the `by` columns (optionally after a boolean `where` mask)
+    and derive avg_<m> for the summed measures.
+    """
+    if where is not None:
+        cube = cube[where]
+    by = [by] if isinstance(by, str) else list(by)
+    measures = [col for col in cube.columns if col not in DIMENSIONS + TIME_DIMENSIONS]
+    out = cube.groupby(by, sort=False)[measures].sum().reset_index()
+    for col in SUM_MEASURES:
+        if f"{col}_sum" in out.columns:
+            out[f"avg_{col}"] = out[f"{col}_sum"] / out[f"{col}_n"].replace(0, np.nan)
+    return out
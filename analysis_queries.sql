@@ -21,7 +21,7 @@ WHERE depth_km < 50
   AND mag > 7.5
 ORDER BY mag DESC;
 
--- Q4: Average depth per continent (requires country_continent table)
+-- Q4: Average depth per continent (country_continent is filled by save_dataframe)
 SELECT cc.continent,
        AVG(e.depth_km) AS avg_depth_km,
        COUNT(*) AS events
@@ -39,14 +39,14 @@ ORDER BY avg_mag DESC;
 -- Q6: Year with most earthquakes
 SELECT YEAR(time) AS year, COUNT(*) AS quake_count
 FROM earthquakes
-GROUP BY year
+GROUP BY YEAR(time)
 ORDER BY quake_count DESC
 LIMIT 1;
 
 -- Q7: Month with highest number of earthquakes (overall)
 SELECT MONTH(time) AS month, COUNT(*) AS quake_count
 FROM earthquakes
-GROUP BY month
+GROUP BY MONTH(time)
 ORDER BY quake_count DESC
 LIMIT 1;
 
@@ -77,7 +77,7 @@ GROUP BY place, country
 ORDER BY total_casualties DESC
 LIMIT 5;
 
--- Q12: Total estimated economic loss per continent (requires country_continent)
+-- Q12: Total estimated economic loss per continent (country_continent is filled by save_dataframe)
 SELECT cc.continent,
        SUM(e.economic_loss) AS total_loss
 FROM earthquakes e
@@ -111,7 +111,7 @@ SELECT
   SUM(CASE WHEN types LIKE '%origin%' THEN 1 ELSE 0 END) AS origin_events
 FROM earthquakes;
 
--- Q17: Average RMS and gap per continent (requires country_continent)
+-- Q17: Average RMS and gap per continent (country_continent is filled by save_dataframe)
 SELECT cc.continent,
        AVG(e.rms) AS avg_rms,
        AVG(e.gap) AS avg_gap
@@ -120,17 +120,17 @@ LEFT JOIN country_continent cc ON e.country = cc.country
 GROUP BY cc.continent
 ORDER BY avg_rms DESC;
 
--- Q18: Events with high station coverage (nst > 100)
+-- Q18: Events with high station coverage (nst > 100; SET @nst_threshold to change it)
 SELECT id, time, place, country, nst
 FROM earthquakes
-WHERE nst > 100
+WHERE nst > COALESCE(@nst_threshold, 100)
 ORDER BY nst DESC;
 
 -- Q19: Number of tsunamis triggered per year
 SELECT YEAR(time) AS year,
        SUM(CASE WHEN tsunami = 1 THEN 1 ELSE 0 END) AS tsunami_events
 FROM earthquakes
-GROUP BY year
+GROUP BY YEAR(time)
 ORDER BY year;
 
 -- Q20: Count earthquakes by alert levels
@@ -224,38 +224,31 @@ FROM earthquakes
 ORDER BY error_score DESC
 LIMIT 100;
 
--- Q29: Pairs of consecutive earthquakes within 50 km and 1 hour (uses window functions & Haversine)
-WITH ordered AS (
+-- Q29: Pairs of earthquakes within 50 km and 1 hour (SET @max_km / @max_minutes to change them)
+-- every pair, not just consecutive events: a time-band self join (idx_earthquakes_time), a latitude band
+-- (1° of latitude is 111.195 km everywhere; 111.19 keeps the band a little wide) to drop most of those pairs
+-- before any trigonometry, then the Haversine distance
+WITH pairs AS (
   SELECT
-    id, time, latitude, longitude, place,
-    LAG(id) OVER (ORDER BY time) AS prev_id,
-    LAG(time) OVER (ORDER BY time) AS prev_time,
-    LAG(latitude) OVER (ORDER BY time) AS prev_lat,
-    LAG(longitude) OVER (ORDER BY time) AS prev_lon
-  FROM earthquakes
+    b.id, a.id AS prev_id, a.time AS prev_time, b.time, b.place,
+    TIMESTAMPDIFF(SECOND, a.time, b.time) / 60.0 AS minutes_diff,
+    (6371 * 2 * ASIN(
+        SQRT(
+          POWER(SIN(RADIANS((b.latitude - a.latitude)/2)),2)
+          + COS(RADIANS(a.latitude)) * COS(RADIANS(b.latitude))
+            * POWER(SIN(RADIANS((b.longitude - a.longitude)/2)),2)
+        )
+    )) AS distance_km
+  FROM earthquakes a
+  JOIN earthquakes b
+    ON b.time BETWEEN a.time AND a.time + INTERVAL (COALESCE(@max_minutes, 60) * 60) SECOND
+   AND (b.time > a.time OR b.id > a.id)
+   AND ABS(b.latitude - a.latitude) <= COALESCE(@max_km, 50) / 111.19
 )
-SELECT
-  id, prev_id,
-  TIMESTAMPDIFF(MINUTE, prev_time, time) AS minutes_diff,
-  (6371 * 2 * ASIN(
-      SQRT(
-        POWER(SIN(RADIANS((latitude - prev_lat)/2)),2)
-        + COS(RADIANS(prev_lat)) * COS(RADIANS(latitude))
-          * POWER(SIN(RADIANS((longitude - prev_lon)/2)),2)
-      )
-  )) AS distance_km,
-  place, prev_time, time
-FROM ordered
-WHERE prev_id IS NOT NULL
-  AND TIMESTAMPDIFF(MINUTE, prev_time, time) BETWEEN 0 AND 60
-  AND (6371 * 2 * ASIN(
-      SQRT(
-        POWER(SIN(RADIANS((latitude - prev_lat)/2)),2)
-        + COS(RADIANS(prev_lat)) * COS(RADIANS(latitude))
-          * POWER(SIN(RADIANS((longitude - prev_lon)/2)),2)
-      )
-  )) <= 50
-ORDER BY time DESC;
+SELECT id, prev_id, minutes_diff, distance_km, place, prev_time, time
+FROM pairs
+WHERE distance_km <= COALESCE(@max_km, 50)
+ORDER BY time DESC, prev_time DESC;
 
 -- Q30: Regions with highest frequency of deep-focus earthquakes (depth > 300 km)
 SELECT country, COUNT(*) AS deep_count
@@ -264,3 +257,34 @@ WHERE depth_km > 300
 GROUP BY country
 ORDER BY deep_count DESC
 LIMIT 20;
+
+-- Q31: Largest aftershock sequences (Gardner-Knopoff clusters labelled by decluster.py)
+WITH sequences AS (
+  SELECT c.cluster_id,
+         COUNT(*) - 1 AS aftershocks,
+         MAX(CASE WHEN c.mainshock = 0 THEN e.mag END) AS largest_aftershock,
+         MAX(e.time) AS last_event
+  FROM earthquake_clusters c
+  JOIN earthquakes e ON e.id = c.id
+  GROUP BY c.cluster_id
+  HAVING COUNT(*) > 1
+)
+SELECT m.id AS mainshock_id, m.time, m.place, m.country, m.mag,
+       s.aftershocks, s.largest_aftershock, s.last_event
+FROM sequences s
+JOIN earthquakes m ON m.id = s.cluster_id
+ORDER BY s.aftershocks DESC, m.mag DESC
+LIMIT 20;
+
+-- Q32: 3 most seismically active regions with aftershocks removed (Q24 over mainshocks only)
+SELECT e.place,
+       COUNT(*) AS freq,
+       AVG(e.mag) AS avg_mag,
+       (COUNT(*) * AVG(e.mag)) AS score
+FROM earthquakes e
+JOIN earthquake_clusters c ON c.id = e.id
+WHERE c.mainshock = 1
+GROUP BY e.place
+HAVING COUNT(*) >= 5
+ORDER BY score DESC
+LIMIT 3;
@@ -0,0 +1,619 @@
+# benchmark.py
+# Micro-benchmarks for the pipeline stages.
+# Run: python benchmark.py parse --rows 500000
+#      python benchmark.py clean --rows 1000000
+#      python benchmark.py storage --rows 1000000
+#      python benchmark.py pairs --rows 1000000
+#      python benchmark.py geocode --rows 5000000
+#      python benchmark.py db --rows 200000 [--db-url mysql+pymysql://user:pw@localhost/test]
+#      python benchmark.py suite --size 1M [--stages fetch,clean,queries] [--update-baseline]
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+import clean_data
+import decluster
+import fetch_api
+import geocode
+import instrument
+import proximity
+import query_engine
+import save_mysql
+import storage
+import stub_fdsn
+import synthetic
+from config import BENCH_DIR, BENCH_BASELINE, BENCH_TOLERANCE, BENCH_MIN_SECONDS, BENCH_MIN_MB
+from fetch_cache import WindowCache
+from instrument import RunReport
+
+
+def legacy_parse(path):
+    # the original fetch_simple() approach: decode everything, one dict per feature, then a frame
+    with open(path) as fh:
+        data = json.load(fh)
+    all_records = []
+    for feature in data.get("features", []):
+        props = feature["properties"]
+        geom = feature["geometry"]
+        record = {"id": feature["id"]}
+        for name, src, _ in fetch_api.FIELDS[1:]:
+            if isinstance(src, int):
+                record[name] = geom["coordinates"][src] if geom else None
+            else:
+                record[name] = props.get(src)
+        all_records.append(record)
+    return pd.DataFrame(all_records)
+
+
+def columnar_parse(path):
+    with open(path, "rb") as fh:
+        return fetch_api.parse_stream(fh).to_frame()
+
+
+def legacy_clean(df):
+    # the original basic_clean() body, minus the CSV write
+    df["time"] = pd.to_datetime(df["time"], unit="ms", errors="coerce")
+    df["updated"] = pd.to_datetime(df["updated"], unit="ms", errors="coerce")
+    for col in clean_data.NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    for col in clean_data.NUMERIC_COLS:
+        if col in df.columns:
+            median = df[col].median(skipna=True)
+            median = 0 if np.isnan(median) else median
+            df[col] = df[col].fillna(median)
+    for col in clean_data.STRING_COLS:
+        if col in df.columns:
+            df[col] = df[col].fillna("unknown")
+    df["year"] = df["time"].dt.year
+    df["month"] = df["time"].dt.month
+    df["depth_category"] = df["depth_km"].apply(
+        lambda d: "unknown" if pd.isna(d)
+        else "shallow" if d < 50
+        else "intermediate" if d <= 300
+        else "deep"
+    )
+    return df
+
+
+def bench_clean(rows=1_000_000):
+    raw = synthetic.raw_frame(rows)
+    results = {}
+    outputs = {}
+
+    # clean_frame() also geocodes (which legacy_clean never did): time that step on its own
+    # and hand clean_frame the same locations, so the comparison covers the same work
+    geocode.reverse_geocode(raw["latitude"], raw["longitude"])  # warm the geocoder's lookup grid
+    t = time.perf_counter()
+    location = geocode.reverse_geocode(raw["latitude"], raw["longitude"])
+    results["geocode"] = {"rows": rows, "seconds": round(time.perf_counter() - t, 3)}
+    reverse_geocode = geocode.reverse_geocode
+    geocode.reverse_geocode = lambda lat, lon: location
+    try:
+        for name, func in (("legacy_clean", legacy_clean), ("clean_frame", clean_data.clean_frame)):
+            df = raw.copy()
+            t = time.perf_counter()
+            outputs[name] = func(df)
+            elapsed = time.perf_counter() - t
+            results[name] = {
+                "rows": rows,
+                "seconds": round(elapsed, 3),
+                "rows_per_sec": round(rows / elapsed),
+                "frame_mb": round(float(outputs[name].memory_usage(deep=True).sum()) / 2**20, 1),
+            }
+    finally:
+        geocode.reverse_geocode = reverse_geocode
+
+    # same values as before: compare as plain objects/floats, ignoring the new dtypes
+    legacy, new = outputs["legacy_clean"], outputs["clean_frame"][list(outputs["legacy_clean"].columns)]
+    new = new.astype({c: "object" for c in new.columns if isinstance(new[c].dtype, pd.CategoricalDtype)})
+    pd.testing.assert_frame_equal(legacy, new, check_dtype=False)
+
+    # the per-row lambda on its own, against the vectorized binning
+    depth = raw["depth_km"]
+    t = time.perf_counter()
+    depth.apply(lambda d: "unknown" if pd.isna(d) else "shallow" if d < 50 else "intermediate" if d <= 300 else "deep")
+    apply_s = time.perf_counter() - t
+    t = time.perf_counter()
+    clean_data.depth_category(depth)
+    vector_s = time.perf_counter() - t
+    results["depth_bins"] = {"apply_s": round(apply_s, 3), "vectorized_s": round(vector_s, 4)}
+
+    speedup = results["legacy_clean"]["seconds"] / results["clean_frame"]["seconds"]
+    for name, res in results.items():
+        print(f"{name:15s} {res}")
+    print(f"speedup: {speedup:.2f}x excluding geocoding, {apply_s / vector_s:.0f}x on depth bins (outputs match)")
+    print(f"geocoding adds {results['geocode']['seconds']}s on top of clean_frame")
+    return results
+
+
+def _dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def bench_storage(rows=1_000_000):
+    clean = synthetic.clean_frame(rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "clean.csv")
+        clean.to_csv(csv_path, index=False)
+        t = time.perf_counter()
+        pd.read_csv(csv_path, parse_dates=["time", "updated"], low_memory=False)
+        results["csv"] = {"load_s": round(time.perf_counter() - t, 3), "size_mb": round(_dir_size(csv_path) / 2**20, 1)}
+
+        for fmt in ("parquet", "feather"):
+            path = os.path.join(tmp, f"clean_{fmt}")
+            storage.write_dataset(clean, path, fmt)
+            t = time.perf_counter()
+            storage.read_dataset(path, fmt)
+            load_s = time.perf_counter() - t
+            t = time.perf_counter()
+            storage.read_dataset(path, fmt, columns=["time", "mag", "country" if "country" in clean else "place"],
+                                 filters=[("year", "==", 2023)])
+            results[fmt] = {
+                "load_s": round(load_s, 3),
+                "projected_load_s": round(time.perf_counter() - t, 3),
+                "size_mb": round(_dir_size(path) / 2**20, 1),
+            }
+
+    for name, res in results.items():
+        print(f"{name:10s} {res}")
+    return results
+
+
+def legacy_pairs(df, max_km=50.0, max_minutes=60.0):
+    # the old Q29: consecutive events only, in time order
+    tmp = df.sort_values("time").reset_index(drop=True)
+    prev = tmp.shift(1)
+    minutes = (tmp["time"] - prev["time"]).dt.total_seconds() / 60.0
+    dist = proximity.haversine_km(prev["latitude"].values, prev["longitude"].values,
+                                  tmp["latitude"].values, tmp["longitude"].values)
+    return tmp[(minutes <= max_minutes) & (dist <= max_km)]
+
+
+def bench_pairs(rows=1_000_000, check_rows=3000):
+    clean = synthetic.clean_frame(rows)
+    t = time.perf_counter()
+    consecutive = legacy_pairs(clean)
+    legacy_s = time.perf_counter() - t
+    t = time.perf_counter()
+    pairs = proximity.find_pairs(clean)
+    index_s = time.perf_counter() - t
+
+    # brute-force O(n^2) cross-check on a sample, with wide thresholds so it has pairs to find
+    sample = clean.sort_values("time").head(check_rows)
+    got = set(zip(*proximity.find_pairs(sample, max_km=1000.0, max_minutes=1440.0)[["prev_id", "id"]].values.T))
+    i, j = np.triu_indices(len(sample), 1)
+    lat, lon = sample["latitude"].to_numpy(), sample["longitude"].to_numpy()
+    minutes = np.abs((sample["time"].to_numpy()[j] - sample["time"].to_numpy()[i]) / np.timedelta64(1, "m"))
+    close = (proximity.haversine_km(lat[i], lon[i], lat[j], lon[j]) <= 1000.0) & (minutes <= 1440.0)
+    assert len(got) == int(close.sum()), (len(got), int(close.sum()))
+
+    results = {
+        "consecutive": {"rows": rows, "seconds": round(legacy_s, 3), "pairs": len(consecutive)},
+        "grid_index": {"rows": rows, "seconds": round(index_s, 3), "pairs": len(pairs)},
+    }
+    for name, res in results.items():
+        print(f"{name:12s} {res}")
+    print(f"brute-force check on {len(sample)} rows: {len(got)} pairs match")
+    return results
+
+
+def bench_geocode(rows=5_000_000, seed=42):
+    rng = np.random.default_rng(seed)
+    lat, lon = rng.uniform(-75, 75, rows), rng.uniform(-180, 180, rows)
+    geocoder = geocode.get_geocoder()
+    results = {}
+    for name in ("cold", "warm"):
+        # cold resolves every distinct grid cell; warm is served from the cell memo
+        t = time.perf_counter()
+        geocode.reverse_geocode(lat, lon)
+        elapsed = time.perf_counter() - t
+        results[name] = {"rows": rows, "seconds": round(elapsed, 3), "rows_per_sec": round(rows / elapsed),
+                         "cells": len(geocoder.memo_cells)}
+    for name, res in results.items():
+        print(f"{name:5s} {res}")
+    return results
+
+
+def bench_db(rows=200_000, db_url=None):
+    """
+    Rows/sec for the legacy to_sql(replace) write against the upsert loader.
+    Uses a throwaway SQLite file unless `db_url` points at a MySQL/MariaDB test instance.
+    """
+    from sqlalchemy import create_engine, text
+
+    clean = synthetic.clean_frame(rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        url = db_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_engine(url)
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {save_mysql.TABLE_NAME}"))
+
+        t = time.perf_counter()
+        clean.to_sql(save_mysql.TABLE_NAME, engine, if_exists="replace", index=False, chunksize=1000)
+        elapsed = time.perf_counter() - t
+        results["to_sql_replace"] = {"rows": rows, "seconds": round(elapsed, 3), "rows_per_sec": round(rows / elapsed)}
+
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE {save_mysql.TABLE_NAME}"))
+        for label, frame in (("upsert_initial", clean), ("upsert_rerun", clean),
+                             ("upsert_1pct_changed", _touch(clean, 0.01))):
+            t = time.perf_counter()
+            written = save_mysql.save_dataframe(frame, engine=engine)
+            elapsed = time.perf_counter() - t
+            results[label] = {"rows_written": written, "seconds": round(elapsed, 3),
+                              "rows_per_sec": round(rows / elapsed)}
+        engine.dispose()
+
+    for name, res in results.items():
+        print(f"{name:20s} {res}")
+    return results
+
+
+def _touch(df, fraction):
+    # bump `updated` on a slice of rows, as an incremental refresh would
+    df = df.copy()
+    n = int(len(df) * fraction)
+    df.loc[df.index[:n], "updated"] = df["updated"].iloc[:n] + pd.Timedelta(minutes=5)
+    return df
+
+
+def _measure(func_name, path, queue):
+    # runs in a fresh process, with RSS sampled here: ru_maxrss would carry over the parent's high-water mark
+    func = globals()[func_name]
+    base = instrument.current_rss()
+    sampler = instrument.RssSampler()
+    sampler.start()
+    t = time.perf_counter()
+    df = func(path)
+    elapsed = time.perf_counter() - t
+    peak = sampler.stop()
+    queue.put({
+        "rows": len(df),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(len(df) / elapsed) if elapsed else None,
+        "peak_rss_mb": round(peak / 2**20, 1),
+        "parse_rss_mb": round((peak - base) / 2**20, 1),
+        "frame_mb": round(float(df.memory_usage(deep=True).sum()) / 2**20, 1),
+    })
+
+
+def run_isolated(func_name, path):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(func_name, path, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def bench_parse(rows=500_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payload.geojson")
+        synthetic.write_geojson(path, rows)
+        print(f"payload: {rows} features, {os.path.getsize(path) / 2**20:.1f} MB, "
+              f"ijson={'yes' if fetch_api.ijson else 'no'}")
+        results = {name: run_isolated(name, path) for name in ("legacy_parse", "columnar_parse")}
+
+    for name, res in results.items():
+        print(f"{name:15s} {res}")
+    return results
+
+
+SUITE_STAGES = ["fetch", "fetch_cached", "clean", "clean_chunked", "clean_parallel", "decluster", "load_data", "queries", "registry", "save"]
+
+
+def _suite_stage(stage, report, base_url=None, db_url=None):
+    # one suite stage; every measured step is a report.stage() record
+    fetch_args = {"concurrent": True, "url": f"{base_url}/query", "count_url": f"{base_url}/count",
+                  "rate": 0, "save": False}
+    if stage == "fetch":
+        with report.stage("fetch_simple") as rec:
+            rec["rows_out"] = len(fetch_api.fetch_simple(cache=False, **fetch_args))
+
+    elif stage == "fetch_cached":
+        # every window served from the window cache (filled by an unmeasured first run)
+        cache_dir = os.path.abspath("../fetch_cache")
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        fetch_api.fetch_simple(cache=WindowCache(directory=cache_dir), **fetch_args)
+        with report.stage("fetch_simple_cached") as rec:
+            rec["rows_out"] = len(fetch_api.fetch_simple(cache=WindowCache(directory=cache_dir), **fetch_args))
+
+    elif stage == "clean":
+        # load raw -> clean -> write, as basic_clean() runs on its own
+        with report.stage("basic_clean") as rec:
+            rec["rows_out"] = len(clean_data.basic_clean())
+
+    elif stage == "clean_chunked":
+        with report.stage("basic_clean_chunked") as rec:
+            rec["rows_out"] = clean_data.basic_clean(chunksize=200_000)
+
+    elif stage == "clean_parallel":
+        # year partitions in a process pool, one worker per core
+        with report.stage("basic_clean_parallel") as rec:
+            rec["workers"] = os.cpu_count()
+            rec["rows_out"] = clean_data.basic_clean(workers=0)
+
+    elif stage == "decluster":
+        # Gardner-Knopoff over the whole catalogue; the labels feed Q31/Q32 in the later stages
+        df = storage.load_clean(columns=["id", "time", "latitude", "longitude", "mag"])
+        with report.stage("decluster", rows_in=len(df)) as rec:
+            labels = decluster.refresh_clusters(df)
+            rec["rows_out"] = len(labels)
+            rec["aftershocks"] = int(len(labels) - labels["mainshock"].sum())
+
+    elif stage == "load_data":
+        # the dashboard's queries.Dataset with every column and token set loaded: the most it ever holds
+        import queries
+        with report.stage("queries.Dataset") as rec:
+            dataset = queries.Dataset()
+            frame = dataset.events(sorted(dataset.available))
+            for col in {col for query in queries.REGISTRY.values() for col in query.tokens}:
+                dataset.tokens(col)
+            rec["rows_out"] = len(frame)
+            rec["dataset_mb"] = round(dataset.memory_usage() / 2**20, 1)
+
+    elif stage == "queries":
+        if query_engine.duckdb is None:
+            with report.stage("queries") as rec:
+                rec["error"] = "duckdb not installed"
+            return
+        queries = query_engine.load_queries()
+        with report.stage("duckdb_connect"):
+            con = query_engine.get_connection()
+        con.execute("SET enable_progress_bar = false")
+        events = con.execute("SELECT COUNT(*) FROM earthquakes").fetchone()[0]
+        for qid in queries:
+            with report.stage(qid, rows_in=events) as rec:
+                try:
+                    rec["rows_out"] = len(query_engine.run_query(qid, queries=queries))
+                except query_engine.duckdb.Error as exc:
+                    # e.g. casualties/economic_loss are not in the USGS feed
+                    rec["error"] = str(exc).splitlines()[0]
+
+    elif stage == "registry":
+        # the registry's pandas path (what runs without duckdb): each query loads its columns into a fresh dataset, cold
+        import queries
+        dataset = queries.Dataset()
+        for qid in queries.REGISTRY:
+            with report.stage(f"registry.{qid}") as rec:
+                try:
+                    rec["rows_out"] = len(queries.run(qid, dataset=dataset, sql=False))
+                except queries.MissingColumns as exc:
+                    rec["error"] = str(exc)
+                # columns held so far: grows only when a query needs one not loaded yet
+                rec["dataset_mb"] = round(dataset.memory_usage() / 2**20, 1)
+
+    elif stage == "save":
+        from sqlalchemy import create_engine
+        path = os.path.abspath("../bench.db")
+        if db_url is None and os.path.exists(path):
+            os.remove(path)
+        engine = create_engine(db_url or f"sqlite:///{path}")
+        df = storage.load_clean()
+        with report.stage("save_dataframe", rows_in=len(df)) as rec:
+            rec["rows_out"] = save_mysql.save_dataframe(df, engine=engine)
+        # nothing changed: only the diff against the table runs
+        with report.stage("save_dataframe_rerun", rows_in=len(df)) as rec:
+            rec["rows_out"] = save_mysql.save_dataframe(df, engine=engine)
+        engine.dispose()
+
+
+def _suite_worker(stage, base_url, db_url, queue):
+    # fresh process per stage, so peak RSS belongs to this stage only
+    try:
+        with RunReport(name=f"bench-{stage}", profile=(), trace=()) as report:
+            # fetch_simple/basic_clean print progress per window/chunk
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                _suite_stage(stage, report, base_url, db_url)
+        queue.put(report.stages)
+    except Exception as exc:
+        queue.put(exc)
+        raise
+
+
+def run_stage(stage, base_url=None, db_url=None):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_suite_worker, args=(stage, base_url, db_url, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def _prepare(rows, seed):
+    # raw + cleaned synthetic datasets under ../data, generated once per size and seed
+    marker = os.path.abspath("../synthetic.json")
+    if storage.raw_exists() and storage.clean_exists() and os.path.exists(marker):
+        with open(marker) as fh:
+            if json.load(fh) == {"rows": rows, "seed": seed}:
+                return
+    print(f"Generating {rows} synthetic events (seed {seed})...")
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        synthetic.write_datasets(rows, seed)
+    with open(marker, "w") as fh:
+        json.dump({"rows": rows, "seed": seed}, fh)
+
+
+def _summary(record, rows):
+    # throughput over the rows a stage reads (queries: the whole catalogue), else the rows it produced
+    n = record.get("rows_in") or record.get("rows_out") or rows
+    out = {
+        "rows": n,
+        "rows_out": record.get("rows_out"),
+        "seconds": record["wall_s"],
+        "cpu_s": record["cpu_s"],
+        "rows_per_sec": round(n / record["wall_s"]) if record["wall_s"] and "error" not in record else None,
+        "peak_rss_mb": record["peak_rss_mb"],
+        "rss_sampled": record.get("rss_sampled", False),
+    }
+    if "http" in record:
+        out["requests"] = record["http"]["requests"]
+        out["mb_per_sec"] = round(record["http"]["bytes"] / 2**20 / record["wall_s"], 1) if record["wall_s"] else None
+    if "error" in record:
+        out["error"] = record["error"]
+    return out
+
+
+def machine():
+    # what a baseline's peak RSS depends on besides the code; RSS from another machine is not comparable
+    return {"host": platform.node(), "cpu_count": os.cpu_count()}
+
+
+def compare(results, baseline, tolerance=BENCH_TOLERANCE, min_seconds=BENCH_MIN_SECONDS, min_mb=BENCH_MIN_MB,
+            memory=True):
+    """
+    Status per benchmark against the baseline results for the same size:
+    "ok", "new" (no baseline), "slower" or "memory" (regressions).
+    Peak RSS is only compared with `memory` set and when both runs sampled it
+    per stage (rss_sampled); otherwise it is the process high-water mark.
+    """
+    status = {}
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            status[name] = "new"
+        elif (res["seconds"] > base["seconds"] * (1 + tolerance)
+              and res["seconds"] - base["seconds"] > min_seconds):
+            status[name] = "slower"
+        elif (memory and res.get("rss_sampled") and base.get("rss_sampled")
+              and res["peak_rss_mb"] is not None and base.get("peak_rss_mb") is not None
+              and res["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance)
+              and res["peak_rss_mb"] - base["peak_rss_mb"] > min_mb):
+            status[name] = "memory"
+        else:
+            status[name] = "ok"
+    return status
+
+
+def bench_suite(size="10k", stages=None, repeat=3, seed=42, update_baseline=False, db_url=None):
+    """
+    Every pipeline stage against a synthetic catalogue of `size` (synthetic.SIZES):
+    fetch_simple against the stub FDSN server (cold and from the window cache),
+    basic_clean (in memory, chunked and parallel), decluster, the dashboard's queries.Dataset load, each query
+    through the DuckDB engine and through the pandas registry, and save_dataframe (SQLite unless `db_url`).
+
+    Each stage runs `repeat` times in a fresh process and keeps its fastest run.
+    Results are compared with the stored baseline; returns 1 if anything regressed
+    against a baseline taken on this machine, or there is no baseline for `size`.
+    A baseline from another machine is only reported against.
+    """
+    rows = synthetic.SIZES[size]
+    stages = stages or SUITE_STAGES
+    baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), BENCH_BASELINE)
+    workdir = os.path.abspath(os.path.join(BENCH_DIR, size))
+    # config paths are relative ("../data/..."), so running from <size>/run keeps everything in <size>/data
+    os.makedirs(os.path.join(workdir, "run"), exist_ok=True)
+    os.chdir(os.path.join(workdir, "run"))
+    _prepare(rows, seed)
+
+    stub, base_url = None, None
+    if any(stage.startswith("fetch") for stage in stages):
+        stub, base_url = stub_fdsn.start(rows, seed)
+        # unmeasured pass: the stub renders (and keeps) its responses
+        run_stage("fetch", base_url)
+
+    results = {}
+    try:
+        for stage in stages:
+            print(f"▶️ {stage}")
+            for _ in range(repeat):
+                for record in run_stage(stage, base_url, db_url):
+                    res = _summary(record, rows)
+                    if record["stage"] not in results or res["seconds"] < results[record["stage"]]["seconds"]:
+                        results[record["stage"]] = res
+    finally:
+        if stub is not None:
+            stub.terminate()
+
+    baselines = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as fh:
+            baselines = json.load(fh)
+    # {size: {"machine": machine(), "results": {benchmark: summary}}}
+    baseline = baselines.get(size, {})
+    same_machine = baseline.get("machine") == machine()
+    status = compare(results, baseline.get("results", {}), memory=same_machine)
+    if baseline and not same_machine:
+        print(f"ℹ️ Timings and peak RSS are informational only: the {size} baseline was recorded on another "
+              f"machine ({baseline.get('machine') or 'not recorded'}); run with --update-baseline to store this one's")
+
+    print(f"\n{'benchmark':24s} {'rows':>9s} {'seconds':>9s} {'rows/s':>11s} {'peak MB':>9s} {'baseline s':>10s}  status")
+    for name, res in results.items():
+        base = baseline.get("results", {}).get(name, {})
+        mark = {"ok": "✅", "new": "🆕"}.get(status[name], "❌" if same_machine else "ℹ️")
+        note = res.get("error", "")
+        print(f"{name:24s} {res['rows']:>9} {res['seconds']:>9.3f} {res['rows_per_sec'] or '-':>11} "
+              f"{res['peak_rss_mb'] or 0:>9} {base.get('seconds', '-'):>10}  {mark} {status[name]} {note}")
+
+    path = os.path.join(workdir, f"results-{time.strftime('%Y%m%dT%H%M%S')}.json")
+    with open(path, "w") as fh:
+        json.dump({"size": size, "rows": rows, "seed": seed, "repeat": repeat, "machine": machine(),
+                   "results": results, "status": status}, fh, indent=2)
+    print("📊 Results:", path)
+
+    if update_baseline:
+        # stages left out of this run keep their baseline, unless it came from another machine
+        kept = baseline.get("results", {}) if same_machine else {}
+        baselines[size] = {"machine": machine(), "results": {**kept, **results}}
+        with open(baseline_path, "w") as fh:
+            json.dump(baselines, fh, indent=2, sort_keys=True)
+        print("💾 Baseline updated:", baseline_path)
+        return 0
+    # with nothing to compare against the run can't pass: regressions would go unnoticed
+    if size not in baselines:
+        print(f"❌ No {size} baseline in {baseline_path}: run with --update-baseline to store one")
+        return 1
+    regressions = [name for name, value in status.items() if value in ("slower", "memory")]
+    # another machine's (or an unknown machine's) seconds say nothing about this code
+    if regressions and same_machine:
+        print(f"❌ {len(regressions)} regression(s) over {BENCH_TOLERANCE:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline benchmarks")
+    parser.add_argument("bench", choices=["parse", "clean", "storage", "pairs", "geocode", "db", "suite"])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--db-url", default=None)
+    parser.add_argument("--size", choices=list(synthetic.SIZES), default="10k", help="suite catalogue size")
+    parser.add_argument("--stages", default=",".join(SUITE_STAGES), help="comma-separated suite stages")
+    parser.add_argument("--repeat", type=int, default=3, help="suite runs per stage (fastest is kept)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--update-baseline", action="store_true", help="store this suite run as the baseline")
+    args = parser.parse_args()
+
+    if args.bench == "parse":
+        bench_parse(args.rows)
+    elif args.bench == "clean":
+        bench_clean(args.rows)
+    elif args.bench == "storage":
+        bench_storage(args.rows)
+    elif args.bench == "pairs":
+        bench_pairs(args.rows)
+    elif args.bench == "geocode":
+        bench_geocode(args.rows)
+    elif args.bench == "db":
+        bench_db(args.rows, args.db_url)
+    elif args.bench == "suite":
+        sys.exit(bench_suite(args.size, args.stages.split(","), args.repeat, args.seed,
+                             args.update_baseline, args.db_url))
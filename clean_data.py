@@ -1,53 +1,345 @@
+import multiprocessing as mp
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
-from config import RAW_CSV, CLEAN_CSV
+from config import RAW_DATASET, CLEAN_DATASET, STORAGE_FORMAT, CLEAN_WORKERS
+import storage
+import geocode
+import decluster
 
-def basic_clean(df=None):
-    if df is None:
-        df = pd.read_csv(RAW_CSV)
+#  Numeric columns to clean
+NUMERIC_COLS = [
+    "mag", "tsunami", "sig", "nst", "dmin", "rms", "gap",
+    "magError", "depthError", "magNst", "felt", "cdi", "mmi",
+    "latitude", "longitude", "depth_km"
+]
+
+# String columns → fill with "unknown"
+STRING_COLS = [
+    "place", "type", "status", "magType", "alert",
+    "locationSource", "magSource", "types", "title", "sources", "ids", "net"
+]
+
+# counts/flags that are whole numbers once filled
+INTEGER_COLS = ["tsunami", "sig", "nst", "magNst", "felt"]
+
+# low-cardinality strings stored as pandas categoricals
+CATEGORY_COLS = ["type", "status", "magType", "alert", "locationSource", "magSource", "net"]
+
+DEPTH_BINS = ["shallow", "intermediate", "deep"]
+
+
+def depth_category(depth):
+    # shallow < 50 km, intermediate 50-300 km, deep > 300 km, unknown when missing
+    depth = pd.to_numeric(depth, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    # build the category codes directly (index into DEPTH_BINS + ["unknown"])
+    codes = np.select([np.isnan(depth), depth < 50, depth <= 300], [3, 0, 1], default=2)
+    return pd.Categorical.from_codes(codes.astype("int8"), categories=DEPTH_BINS + ["unknown"])
+
+
+def country_from_place(place):
+    # "12 km SSW of Town, Country" -> "Country"
+    return place.str.extract(r",\s*([^,]+)$", expand=False).fillna("unknown")
+
+
+def clean_frame(df, medians=None, downcast_floats=False):
+    """
+    Clean one frame (or one chunk) of raw events.
+
+    `medians` fills missing numerics; pass global medians when cleaning chunks so
+    every chunk is filled with the same values. Whole-number count columns are
+    downcast losslessly; floats stay float64 unless `downcast_floats` is set.
+    `country` and `continent` are geocoded from the coordinates (geocode.py).
+    """
+    # geocode from the raw coordinates, before missing ones are median-filled
+    if "latitude" in df.columns and "longitude" in df.columns:
+        location = geocode.reverse_geocode(df["latitude"], df["longitude"])
+    else:
+        location = None
 
     # Convert timestamps
     df["time"] = pd.to_datetime(df["time"], unit="ms", errors="coerce")
     df["updated"] = pd.to_datetime(df["updated"], unit="ms", errors="coerce")
 
-    #  Numeric columns to clean
-    numeric_cols = [
-        "mag", "tsunami", "sig", "nst", "dmin", "rms", "gap",
-        "magError", "depthError", "magNst", "felt", "cdi", "mmi",
-        "latitude", "longitude", "depth_km"
-    ]
-
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    #  Fill numeric missing values
-    for col in numeric_cols:
-        if col in df.columns:
-            median = df[col].median(skipna=True)
+    # one conversion per numeric column: parse, fill, downcast
+    for col in NUMERIC_COLS:
+        if col not in df.columns:
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        if medians is not None:
+            median = medians.get(col, 0)
+        else:
+            median = values.median(skipna=True)
             median = 0 if np.isnan(median) else median
-            df[col] = df[col].fillna(median)
+        values = values.fillna(median)
+        if col in INTEGER_COLS and (values == np.floor(values)).all():
+            values = pd.to_numeric(values, downcast="integer")
+        elif downcast_floats and values.dtype.kind == "f":
+            values = pd.to_numeric(values, downcast="float")
+        df[col] = values
 
-    # String columns → fill with "unknown"
-    string_cols = [
-        "place", "type", "status", "magType", "alert",
-        "locationSource", "magSource", "types", "title", "sources", "ids", "net"
-    ]
-
-    for col in string_cols:
-        if col in df.columns:
+    for col in STRING_COLS:
+        if col not in df.columns:
+            continue
+        if col in CATEGORY_COLS:
+            # categorize first so the fill only touches the small codes array
+            values = df[col].astype("category")
+            if values.isna().any():
+                if "unknown" not in values.cat.categories:
+                    values = values.cat.add_categories("unknown")
+                values = values.fillna("unknown")
+            df[col] = values
+        else:
             df[col] = df[col].fillna("unknown")
 
     # Derived columns
     df["year"] = df["time"].dt.year
     df["month"] = df["time"].dt.month
+    if not df["time"].isna().any():
+        df["year"] = df["year"].astype("int16")
+        df["month"] = df["month"].astype("int8")
+    df["depth_category"] = depth_category(df["depth_km"])
+    if location is not None:
+        df["country"], df["continent"] = location
+
+    return df
+
+
+def basic_clean(df=None, chunksize=None, downcast_floats=False, workers=None):
+    """
+    Clean the raw events and save them through the storage layer.
+
+    With `chunksize` (and no frame passed in) the raw dataset is processed in
+    bounded memory: medians come from a column-at-a-time pre-pass, then each
+    chunk is cleaned and appended. With `workers` other than 1 the year/month
+    partitions are cleaned in a process pool instead (see clean_parallel).
+    Both return the row count instead of a frame.
+    """
+    workers = CLEAN_WORKERS if workers is None else workers
+    if df is None and workers != 1 and STORAGE_FORMAT != "csv":
+        return clean_parallel(workers, downcast_floats=downcast_floats)
+    if df is None and chunksize:
+        return clean_chunked(chunksize, downcast_floats=downcast_floats)
+
+    if df is None:
+        df = storage.load_raw()
+
+    df = clean_frame(df, downcast_floats=downcast_floats)
+    storage.save_clean(df)
+    return df
+
+
+def raw_stats(downcast_floats=False, chunksize=200_000):
+    """
+    Global fill values and integer dtypes for the raw dataset. A columnar dataset
+    is read one numeric column at a time; a CSV, which can't skip to a column, in
+    one chunked pass over the numeric columns, a summary per chunk.
+    """
+    if STORAGE_FORMAT == "csv":
+        return merge_stats([{col: _column_counts(chunk[col]) for col in chunk.columns}
+                            for chunk in storage.iter_raw(chunksize, columns=NUMERIC_COLS)], downcast_floats)
+    summary = {}
+    for col in NUMERIC_COLS:
+        try:
+            values = storage.load_raw(columns=[col])[col]
+        except (KeyError, ValueError):
+            continue
+        summary[col] = _column_counts(values)
+    return merge_stats([summary], downcast_floats)
 
-    df["depth_category"] = df["depth_km"].apply(
-        lambda d: "unknown" if pd.isna(d)
-        else "shallow" if d < 50
-        else "intermediate" if d <= 300
-        else "deep"
-    )
 
-    df.to_csv(CLEAN_CSV, index=False)
+def clean_chunked(chunksize=200_000, downcast_floats=False):
+    # medians and integer dtypes are global, so compute them before cleaning any chunk:
+    # a chunk left to pick its own would append an int8 column to another chunk's int16
+    medians, dtypes = raw_stats(downcast_floats)
+
+    rows = 0
+    for chunk in storage.iter_raw(chunksize):
+        cleaned = cast_dtypes(clean_frame(chunk, medians=medians, downcast_floats=downcast_floats), dtypes)
+        storage.save_clean(cleaned, append=rows > 0)
+        rows += len(cleaned)
+    return rows
+
+
+def _read_partition(part):
+    # one year= directory of the raw dataset, without the partition keys (as load_raw returns it)
+    return storage.read_dataset(part, partitioning=None)
+
+
+def _value_counts(part):
+    # exact, mergeable summary of one raw partition: distinct values + counts per numeric column,
+    # and the distinct geocoder cells its coordinates fall in
+    df = _read_partition(part)
+    counts = {}
+    if "latitude" in df.columns and "longitude" in df.columns:
+        cells = geocode.get_geocoder().cells(df["latitude"], df["longitude"])
+        counts["cells"] = np.unique(cells[cells >= 0])
+    for col in NUMERIC_COLS:
+        if col in df.columns:
+            counts[col] = _column_counts(df[col])
+    return counts
+
+
+def _column_counts(values):
+    # (distinct present values, their counts, number missing) of one raw column
+    values = pd.to_numeric(values, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    present = values[~np.isnan(values)]
+    distinct, n = np.unique(present, return_counts=True)
+    return distinct, n, len(values) - len(present)
+
+
+def _median(distinct, counts):
+    # median of the multiset (distinct, counts), the same value Series.median() gives on the full column
+    total = int(counts.sum())
+    if not total:
+        return 0
+    cumulative = np.cumsum(counts)
+    lo, hi = np.searchsorted(cumulative, [(total - 1) // 2, total // 2], side="right")
+    return (distinct[lo] + distinct[hi]) / 2
+
+
+def merge_stats(summaries, downcast_floats=False):
+    """
+    Global medians and the dtype clean_frame() would pick for each INTEGER_COLS
+    column on the whole dataset, from per-partition _value_counts() summaries.
+    """
+    medians, dtypes = {}, {}
+    for col in NUMERIC_COLS:
+        parts = [summary[col] for summary in summaries if col in summary]
+        if not parts:
+            continue
+        distinct, inverse = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([p[1] for p in parts])).astype("int64")
+        missing = sum(p[2] for p in parts)
+        medians[col] = _median(distinct, counts)
+        if col not in INTEGER_COLS:
+            continue
+        # the filled column: the present values, plus the median wherever one was missing
+        filled = np.append(distinct, medians[col]) if missing else distinct
+        if len(filled) and (filled == np.floor(filled)).all():
+            dtypes[col] = pd.to_numeric(pd.Series([filled.min(), filled.max()]), downcast="integer").dtype
+        else:
+            dtypes[col] = np.dtype("float32" if downcast_floats else "float64")
+    return medians, dtypes
+
+
+def cast_dtypes(df, dtypes):
+    """
+    Cast the columns in `dtypes` (merge_stats' dataset-wide dtypes): one partition
+    or chunk may fit a narrower int, or be whole numbers where the dataset isn't.
+    Raises ValueError rather than wrapping values an integer dtype can't hold,
+    which only rows from outside the summarised data can have.
+    """
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype.kind in "iu" and len(df):
+            values = df[col].to_numpy(dtype="float64")
+            info = np.iinfo(dtype)
+            if (values != np.floor(values)).any() or values.min() < info.min or values.max() > info.max:
+                raise ValueError(f"{col} has values outside {dtype} ({values.min()}..{values.max()})")
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def _resolve_cells(cells):
+    return geocode.get_geocoder().resolve(cells)
+
+
+def _clean_partition(part, medians, dtypes, cells, codes, downcast_floats):
+    # `cells`/`codes`: this partition's geocoder cells, already resolved by the pool
+    geocode.get_geocoder().remember(cells, codes)
+    df = cast_dtypes(clean_frame(_read_partition(part), medians=medians, downcast_floats=downcast_floats), dtypes)
+    storage.write_dataset(df, CLEAN_DATASET, append=True)
+    return len(df)
+
+
+def clean_parallel(workers=CLEAN_WORKERS, downcast_floats=False):
+    """
+    Clean the raw dataset one year partition per task in a process pool
+    (a month of events is too little work to pay for a task).
+
+    A first pass over the partitions (also in the pool) collects exact value
+    counts per numeric column, which merge into the global medians and integer
+    dtypes, and the distinct geocoder cells, which are resolved once; the second
+    cleans every partition with them and writes it straight into the cleaned
+    dataset. The output matches basic_clean() on the whole frame.
+    Returns the row count.
+    """
+    parts = storage.partition_dirs(RAW_DATASET, depth=1)
+    workers = min(workers or os.cpu_count(), max(len(parts), 1))
+    if os.path.exists(CLEAN_DATASET):
+        shutil.rmtree(CLEAN_DATASET)
+
+    # spawn, not fork: pyarrow's thread pools don't survive a fork
+    with ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn")) as pool:
+        summaries = list(pool.map(_value_counts, parts))
+        medians, dtypes = merge_stats(summaries, downcast_floats)
+
+        # geocode every distinct cell once, split across the pool, instead of once per worker
+        part_cells = [summary.get("cells", np.empty(0, np.int64)) for summary in summaries]
+        cells = np.unique(np.concatenate(part_cells))
+        codes = np.empty(0, np.int16)
+        if len(cells):
+            codes = np.concatenate(list(pool.map(_resolve_cells, np.array_split(cells, workers * 4))))
+        part_codes = [codes[np.searchsorted(cells, own)] for own in part_cells]
+
+        n = len(parts)
+        rows = pool.map(_clean_partition, parts, [medians] * n, [dtypes] * n,
+                        part_cells, part_codes, [downcast_floats] * n)
+        return sum(rows)
+
+
+# columns load_clean_frame() derives when the cleaned data predates them, and what they're derived from
+DERIVED_FROM = {
+    "country": ["place"], "year": ["time"], "month": ["time"],
+    "depth_category": ["depth_km"], "continent": ["latitude", "longitude"],
+    # joined by id from the declustering labels (decluster.py), when they've been stored
+    "cluster_id": ["id"], "mainshock": ["id"],
+}
+
+
+def load_clean_frame(columns=None):
+    """
+    The cleaned dataset as the dashboard uses it: numeric columns as numbers,
+    country, continent, year, month and depth_category derived when the data
+    was cleaned before they existed, and the cluster_id / mainshock labels
+    joined by id once decluster.py has stored them. With `columns`, only those (and whatever a
+    missing one is derived from) are read; requested columns that don't exist
+    and can't be derived are left out.
+    """
+    # Parquet/Feather keep dtypes, so no date parsing here
+    if columns is None:
+        df = storage.load_clean()
+    else:
+        available = set(storage.clean_columns())
+        read = [col for col in columns if col in available]
+        for col in columns:
+            if col not in available:
+                read += [src for src in DERIVED_FROM.get(col, []) if src in available and src not in read]
+        df = storage.load_clean(columns=read)
+    wanted = (lambda col: True) if columns is None else (lambda col: col in columns)
+
+    for col in ["mag", "depth_km", "latitude", "longitude", "nst", "rms", "gap", "tsunami", "sig"]:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    if "country" not in df.columns and wanted("country"):
+        df["country"] = country_from_place(df["place"]) if "place" in df.columns else "unknown"
+    if "time" in df.columns:
+        if "year" not in df.columns and wanted("year"):
+            df["year"] = df["time"].dt.year
+        if "month" not in df.columns and wanted("month"):
+            df["month"] = df["time"].dt.month
+    if "depth_category" not in df.columns and "depth_km" in df.columns and wanted("depth_category"):
+        df["depth_category"] = depth_category(df["depth_km"])
+    if "continent" not in df.columns and "latitude" in df.columns and "longitude" in df.columns and wanted("continent"):
+        df["continent"] = geocode.reverse_geocode(df["latitude"], df["longitude"])[1]
+    labels = [col for col in decluster.CLUSTER_COLUMNS if col not in df.columns and wanted(col)]
+    if labels and "id" in df.columns and decluster.clusters_exist():
+        df = df.merge(decluster.load_clusters(["id"] + labels), on="id", how="left")
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns]]
     return df
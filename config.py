@@ -1,5 +1,6 @@
 
 USGS_URL = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+USGS_COUNT_URL = "https://earthquake.usgs.gov/fdsnws/event/1/count"
 MIN_MAGNITUDE = 4.5
 STARTTIME = "2021-01-01"
 ENDTIME = "2025-12-01"
@@ -7,6 +8,41 @@ ENDTIME = "2025-12-01"
 # output paths
 RAW_CSV = "../data/earthquakes_raw.csv"
 CLEAN_CSV = "../data/earthquakes_clean.csv"
+RAW_DATASET = "../data/earthquakes_raw"      # year=/month= partitioned directory
+CLEAN_DATASET = "../data/earthquakes_clean"
+STORAGE_FORMAT = "parquet"                   # "parquet", "feather" or "csv" (single-file CSVs above)
+CHECKPOINT_JSON = "../data/fetch_checkpoint.json"
+CUBE_DIR = "../data/cubes"                   # precomputed rollups for the dashboard
+FETCH_CACHE_DIR = "../data/fetch_cache"      # parsed API windows, reused across runs
+DUCKDB_TEMP_DIR = "../data/duckdb_tmp"       # query engine spill space
+REPORT_DIR = "../data/reports"               # JSON run reports (and .prof files) from run_all
+
+# per-stage profiling in run_all: stage names out of "fetch", "clean", "cubes", "tiles", "decluster", "save"
+PROFILE_STAGES = []          # cProfile (dumped next to the report)
+TRACE_STAGES = []            # tracemalloc peak + top allocation sites
+
+# cleaning: with more than one worker (0 = every core), basic_clean() cleans the year/month
+# partitions of the raw dataset in a process pool (parquet/feather only)
+CLEAN_WORKERS = 1
+
+# map & timeline tiles (tiles.py): Web Mercator quadkey pyramid built by run_all
+TILE_DIR = "../data/tiles"
+TILE_MAX_ZOOM = 8            # finest level (256 x 256 tiles); levels 0..8 are stored
+TILE_MAG_STEP = 0.5          # magnitude bin width, so "min magnitude" filters stay exact
+TILE_MAX_CELLS = 4096        # the map view picks the finest level with at most this many tiles
+
+# aftershock declustering (decluster.py): Gardner-Knopoff windows, labels stored per event id by run_all
+CLUSTER_DIR = "../data/clusters"
+DECLUSTER_MAG_STEP = 0.5     # magnitude bins searched largest first, each with its largest window
+
+# query registry (queries.py): results memoized per (dataset version, query, params), least recently used evicted
+QUERY_CACHE_ENTRIES = 64
+QUERY_REPORT_DIR = "../data/reports/queries"   # python queries.py: one CSV per result + summary.json
+
+# reverse geocoding (country/continent from lat/lon)
+COUNTRY_BOUNDARIES = "geodata/countries_110m.geojson"  # Natural Earth 1:110m, bundled
+GEOCODE_CELL_DEG = 0.1       # grid cell size; each distinct cell is geocoded once
+GEOCODE_OFFSHORE_KM = 200.0  # offshore events take the nearest country within this distance
 
 # MySQL credentials 
 MYSQL_USER = "root"
@@ -15,3 +51,51 @@ MYSQL_HOST = "localhost"
 MYSQL_PORT = 3306
 MYSQL_DB = "earthquake_db"
 TABLE_NAME = "earthquakes"
+CREATE_TABLE_SQL = "create_table.sql"
+ANALYSIS_SQL = "analysis_queries.sql"   # Q1..Q32, run by MySQL and by query_engine.py (DuckDB)
+MYSQL_POOL_SIZE = 5
+MYSQL_BATCH_ROWS = 10000     # rows per INSERT ... ON DUPLICATE KEY UPDATE transaction
+MYSQL_LOAD_METHOD = "upsert" # "upsert" or "infile" (LOAD DATA LOCAL INFILE, needs local_infile=1)
+
+# DuckDB query engine (None = DuckDB defaults: all cores, 80% of RAM)
+DUCKDB_THREADS = None
+DUCKDB_MEMORY_LIMIT = None   # e.g. "4GB"
+
+# fetch tuning
+FETCH_CONCURRENT = False
+FETCH_WORKERS = 4            # max windows in flight
+MAX_REQUESTS_PER_SEC = 5.0   # 0 disables the rate limit
+FETCH_RETRIES = 4
+FETCH_BACKOFF = 1.0          # seconds, doubled on every retry
+FETCH_TIMEOUT = 60
+
+# window cache (resumable fetch_simple)
+FETCH_CACHE = True
+FETCH_CACHE_MAX_MB = 2048    # least recently used windows are evicted above this
+FETCH_CACHE_TTL_HOURS = 12   # recent windows are revalidated (ETag/Last-Modified) after this
+FETCH_CACHE_SETTLE_DAYS = 30 # windows that ended longer ago are reused without asking
+
+# adaptive windowing (splits dense periods, merges quiet ones)
+FETCH_ADAPTIVE = False
+FDSN_MAX_EVENTS = 20000      # USGS per-query cap
+WINDOW_FILL = 0.5            # aim each window at this fraction of the cap
+
+# incremental fetch: the next run asks for events updated after (this run's start - margin), or the newest
+# `updated` seen if that is earlier, so events the server indexes late aren't skipped (overlap is merged by id)
+CHECKPOINT_MARGIN_MINUTES = 60
+
+# benchmark suite (python benchmark.py suite --size 10k|1M|10M)
+BENCH_DIR = "../data/bench"              # scratch data per size: <size>/data, run from <size>/run
+BENCH_BASELINE = "bench_baseline.json"   # next to benchmark.py; written with --update-baseline
+BENCH_TOLERANCE = 0.25       # slower, or higher peak RSS, than the baseline by more than this fails
+BENCH_MIN_SECONDS = 0.05     # timing differences below this are noise
+BENCH_MIN_MB = 32            # so are peak RSS differences below this
+
+# live ingest (python live_feed.py): polls a USGS summary feed, appends new events in micro-batches
+LIVE_FEED_URL = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/4.5_day.geojson"
+LIVE_POLL_SECONDS = 60       # the summary feeds are regenerated about once a minute
+LIVE_WINDOW_HOURS = 48       # events older than this (by event time) leave the live window
+LIVE_MAX_EVENTS = 20000      # and beyond this many the oldest are dropped
+LIVE_BATCH_ROWS = 1000       # new events are appended to storage once this many are queued
+LIVE_FLUSH_SECONDS = 300     # or once the oldest queued event has waited this long
+LIVE_DIR = "../data/live"    # window snapshot read by the dashboard
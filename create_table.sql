@@ -38,7 +38,24 @@ CREATE TABLE IF NOT EXISTS earthquakes (
     year INT,
     month INT,
     depth_category VARCHAR(30),
-    country VARCHAR(100)
+    country VARCHAR(100),
+    -- hash of the other columns as last written, so reruns only rewrite rows whose values changed
+    row_hash BIGINT
+);
+
+-- Q29's time-band self join (b.time BETWEEN a.time AND a.time + @max_minutes) seeks on it
+CREATE INDEX idx_earthquakes_time ON earthquakes (time);
+
+-- filled from geodata/countries_110m.geojson by save_mysql.save_dataframe (Q4, Q12, Q17)
+CREATE TABLE IF NOT EXISTS country_continent (
+    country VARCHAR(100) PRIMARY KEY,
+    continent VARCHAR(50)
+);
+-- aftershock cluster labels from decluster.py, filled by save_mysql.save_dataframe (Q31, Q32)
+CREATE TABLE IF NOT EXISTS earthquake_clusters (
+    id VARCHAR(100) PRIMARY KEY,
+    cluster_id VARCHAR(100),
+    mainshock TINYINT
 );
 select * from earthquakes;
 
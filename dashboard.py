@@ -1,77 +1,134 @@
 # queries_app.py
 import streamlit as st
+import pydeck as pdk
+import altair as alt
 import pandas as pd
 import numpy as np
-
+import query_engine
+import queries
+import live_feed
+import storage
+import tiles
+from config import LIVE_POLL_SECONDS, TILE_DIR, TILE_MAG_STEP
 
 
 # ---------- CONFIG ----------
-CLEAN_CSV = "../data/earthquakes_clean.csv"  # path to cleaned CSV
-
 st.set_page_config(layout="wide", page_title="Earthquake Analyst Queries")
 
-@st.cache_data
-def load_data(path=CLEAN_CSV):
-    df = pd.read_csv(path, parse_dates=["time", "updated"], low_memory=False)
-    # Ensure numeric types
-    for col in ["mag", "depth_km", "latitude", "longitude", "nst", "rms", "gap", "tsunami", "sig"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    # safe columns
-    if "country" not in df.columns:
-        # try extract country from place
-        if "place" in df.columns:
-            df["country"] = df["place"].str.extract(r",\s*([^,]+)$", expand=False).fillna("unknown")
-        else:
-            df["country"] = "unknown"
-    # derived
-    if "year" not in df.columns:
-        df["year"] = df["time"].dt.year
-    if "month" not in df.columns:
-        df["month"] = df["time"].dt.month
-    if "depth_category" not in df.columns and "depth_km" in df.columns:
-        df["depth_category"] = df["depth_km"].apply(
-            lambda d: "unknown" if pd.isna(d) else ("shallow" if d < 50 else ("intermediate" if d <= 300 else "deep"))
-        )
-    return df
-
-df = load_data()
+@st.cache_data(ttl=LIVE_POLL_SECONDS)
+def live_window():
+    # the recent-events snapshot written by live_feed.py (None if it isn't running)
+    return live_feed.load_window()
+
+@st.cache_resource(max_entries=1)
+def load_tile_pyramid(version):
+    # quadkey counts per zoom level from run_all; built from the cleaned data if missing.
+    # keyed by pyramid_version(), so a pyramid rebuilt by run_all replaces the cached one
+    pyramid = tiles.load_pyramid()
+    if pyramid is None:
+        pyramid = tiles.build_pyramid(queries.get_dataset().events(["latitude","longitude","time","mag"]))
+    return pyramid
+
+def pyramid_version():
+    # the stored tile files; before run_all has written them, the cleaned data the pyramid is built from
+    version = storage.path_version(TILE_DIR)
+    return version if version[0] else queries.dataset_version()
+
+def tile_map(cells, bbox):
+    # only the aggregated tiles go to the browser; colour by log count
+    weight = np.log1p(cells["events"].to_numpy())
+    weight = weight / max(weight.max(), 1.0) if len(weight) else weight
+    cells = cells.assign(color=[[255, int(200 * (1 - w)), 0, 170] for w in weight])
+    layer = pdk.Layer("QuadkeyLayer", cells, id="tiles", get_quadkey="quadkey", get_fill_color="color",
+                      pickable=True, stroked=False)
+    span = max(bbox[3] - bbox[2], 2 * (bbox[1] - bbox[0]), 1.0)
+    view = pdk.ViewState(latitude=(bbox[0] + bbox[1]) / 2, longitude=(bbox[2] + bbox[3]) / 2,
+                         zoom=float(np.clip(np.log2(360 / span), 0, 12)))
+    return pdk.Deck(layers=[layer], initial_view_state=view, tooltip={"text": "{events} events, avg M{avg_mag}"})
+
+def timeline(hist, selected):
+    # monthly bars with the map's months highlighted; dragging across them ("brush") picks the map's months
+    hist = hist.assign(date=pd.to_datetime(hist["month"]), shown=hist["period"].between(*selected))
+    brush = alt.selection_interval(name="brush", encodings=["x"])
+    return alt.Chart(hist).mark_bar().encode(
+        x=alt.X("date:T", title="month"), y=alt.Y("events:Q"),
+        color=alt.Color("shown:N", scale=alt.Scale(domain=[True, False], range=["#ff6400", "#bbbbbb"]), legend=None),
+        tooltip=["month", "events"],
+    ).add_params(brush)
+
+def brushed_months(state):
+    # (first, last) month of the timeline's brush at the last rerun, or None
+    value = ((state or {}).get("selection") or {}).get("brush", {}).get("date")
+    if not value:
+        return None
+    ends = [pd.to_datetime(v, unit="ms") if isinstance(v, (int, float)) else pd.to_datetime(v) for v in value]
+    first, last = tiles.period_of(ends)
+    return int(first), int(last)
+
+def picked_tiles(state):
+    # (x, y, zoom) of the tiles clicked on the map at the last rerun, or None
+    objects = ((state or {}).get("selection") or {}).get("objects", {}).get("tiles", [])
+    return tiles.quadkey_xy([obj["quadkey"] for obj in objects]) if objects else None
+
+ENGINE = query_engine.duckdb is not None
 
 st.title("Analyst Tasks – Select a Query")
-st.markdown("Choose any task from the dropdown. Results are computed from the cleaned CSV (Pandas).")
+if ENGINE:
+    st.markdown("Choose any task from the dropdown. Results come from analysis_queries.sql, run by DuckDB over the cleaned dataset.")
+else:
+    st.markdown("Choose any task from the dropdown. Results are computed from the cleaned dataset (Pandas; `pip install duckdb` to run the SQL instead).")
+
+if st.sidebar.checkbox("Show live feed"):
+    st.markdown("### Live feed")
+    live = live_window()
+    if live is None or live.empty:
+        st.info("No live events yet: start `python live_feed.py` to poll the USGS feed.")
+    else:
+        newest = live.iloc[0]
+        st.write({"events in window": len(live), "newest": f"M{newest['mag']:.1f} {newest['place']} ({newest['time']})"})
+        st.dataframe(live[["id","time","place","country","mag","depth_km","status"]].head(100))
+
+if st.sidebar.checkbox("Show map & timeline"):
+    st.markdown("### Map & timeline")
+    pyramid = load_tile_pyramid(pyramid_version())
+    months = tiles.periods(pyramid)
+    if not len(months):
+        st.info("No events with a time and location to map.")
+    else:
+        labels = tiles.period_label(months)
+        lat_range = st.sidebar.slider("Latitude", -90.0, 90.0, (-90.0, 90.0), step=1.0)
+        lon_range = st.sidebar.slider("Longitude", -180.0, 180.0, (-180.0, 180.0), step=1.0)
+        min_mag = st.sidebar.slider("Min magnitude", 0.0, 10.0, 0.0, step=TILE_MAG_STEP)
+        first, last = st.sidebar.select_slider("Months", options=labels, value=(labels[0], labels[-1]))
+        bbox = (lat_range[0], lat_range[1], lon_range[0], lon_range[1])
+        selected = (months[labels.index(first)], months[labels.index(last)])
+
+        # cross-filtering, from the selections made at the last rerun: a brush on the timeline replaces the
+        # months slider, tiles clicked on the map narrow the timeline. deck.gl doesn't send pan/zoom back,
+        # so the map's box stays the latitude/longitude sliders
+        brushed = brushed_months(st.session_state.get("timeline"))
+        picked = picked_tiles(st.session_state.get("tile_map"))
+        if brushed is not None:
+            selected = brushed
+
+        # the finest precomputed level that keeps the box under TILE_MAX_CELLS tiles
+        zoom = tiles.choose_zoom(bbox)
+        cells = tiles.tile_counts(pyramid[zoom], zoom, bbox, selected, min_mag)
+        st.write({"zoom": zoom, "tiles": len(cells), "events": int(cells["events"].sum()),
+                  "months": " – ".join(tiles.period_label(selected))})
+        st.pydeck_chart(tile_map(cells, bbox), on_select="rerun", selection_mode="multi-object", key="tile_map")
+
+        # the timeline follows the box and magnitude filter, or only the picked tiles (at their own zoom)
+        if picked is None:
+            hist = tiles.time_histogram(pyramid[zoom], zoom, bbox, min_mag)
+        else:
+            x, y, picked_zoom = picked
+            hist = tiles.time_histogram(pyramid[picked_zoom], picked_zoom, bbox, min_mag, cells=(x, y))
+            st.caption(f"Timeline of the {len(x)} tiles picked on the map (click an empty spot to clear).")
+        st.altair_chart(timeline(hist, selected), on_select="rerun", key="timeline", width="stretch")
 
-TASKS = [
-    "Q1 Top 10 strongest earthquakes (mag)",
-    "Q2 Top 10 deepest earthquakes (depth_km)",
-    "Q3 Shallow <50 km & mag > 7.5",
-    "Q4 Average depth per continent (needs mapping)",
-    "Q5 Average magnitude per magType",
-    "Q6 Year with most earthquakes",
-    "Q7 Month with highest number of earthquakes",
-    "Q8 Day of week with most earthquakes",
-    "Q9 Count of earthquakes per hour of day",
-    "Q10 Most active reporting network (net)",
-    "Q11 Top 5 places with highest casualties",
-    "Q12 Total estimated economic loss per continent (needs mapping)",
-    "Q13 Average economic loss by alert level",
-    "Q14 Count of reviewed vs automatic earthquakes (status)",
-    "Q15 Count by earthquake type (type)",
-    "Q16 Number of earthquakes by data type (types)",
-    "Q17 Average RMS and gap per continent (needs mapping)",
-    "Q18 Events with high station coverage (nst > 100)",
-    "Q19 Number of tsunamis triggered per year",
-    "Q20 Count earthquakes by alert levels",
-    "Q21 Top 5 countries with highest average magnitude (past 10 years)",
-    "Q22 Countries with both shallow and deep quakes in same month",
-    "Q23 Year-over-year growth rate in total earthquakes",
-    "Q24 3 most seismically active regions (freq * avg_mag)",
-    "Q25 Avg depth per country within ±5° latitude",
-    "Q26 Countries highest ratio shallow:deep",
-    "Q27 Avg magnitude difference tsunami vs no-tsunami",
-    "Q28 Events with lowest data reliability (rms+gap)",
-    "Q29 Pairs of consecutive quakes within 50 km & 1 hour (limited)",
-    "Q30 Regions with highest frequency of deep-focus quakes (>300 km)"
-]
+# the registered analyses (queries.py), in order
+TASKS = [f"{query.qid} {query.title}" for query in queries.REGISTRY.values()]
 
 choice = st.selectbox("Select an analyst task", TASKS)
 
@@ -80,244 +137,23 @@ def show_df(df_out):
     st.dataframe(df_out)
     st.download_button("Download CSV", df_out.to_csv(index=False).encode("utf-8"), file_name="query_result.csv")
 
-def haversine_km(lat1, lon1, lat2, lon2):
-    # vectorized haversine (inputs in degrees)
-    R = 6371.0
-    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = np.sin(dlat/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin(dlon/2)**2
-    return R * 2 * np.arcsin(np.sqrt(a))
-
 st.markdown("### Result")
-# perform selected task
-if choice.startswith("Q1"):
-    out = df[["id","time","place","country","mag","depth_km"]].sort_values("mag", ascending=False).head(10)
-    show_df(out)
-
-elif choice.startswith("Q2"):
-    out = df[["id","time","place","country","mag","depth_km"]].sort_values("depth_km", ascending=False).head(10)
-    show_df(out)
-
-elif choice.startswith("Q3"):
-    out = df[(df["depth_km"] < 50) & (df["mag"] > 7.5)][["id","time","place","country","mag","depth_km"]].sort_values("mag", ascending=False)
-    show_df(out)
-
-elif choice.startswith("Q4"):
-    st.info("Q4 needs a country->continent mapping table. If you don't have one, results will show grouped by country instead.")
-    if "country" in df.columns:
-        out = df.groupby("country", dropna=True)["depth_km"].mean().reset_index().rename(columns={"depth_km":"avg_depth_km"}).sort_values("avg_depth_km", ascending=False)
-        st.write("Showing average depth per country (use country_continent mapping for continents):")
-        show_df(out)
-    else:
-        st.warning("No country column present.")
-
-elif choice.startswith("Q5"):
-    if "magType" in df.columns:
-        out = df.groupby("magType")["mag"].agg(["count","mean"]).reset_index().rename(columns={"mean":"avg_mag","count":"cnt"}).sort_values("avg_mag", ascending=False)
-        show_df(out)
-    else:
-        st.warning("magType column not found.")
-
-elif choice.startswith("Q6"):
-    out = df.groupby(df["time"].dt.year)["id"].count().reset_index().rename(columns={"time":"year","id":"quake_count"}).sort_values("quake_count", ascending=False).head(1)
-    show_df(out)
-
-elif choice.startswith("Q7"):
-    out = df.groupby(df["time"].dt.month)["id"].count().reset_index().rename(columns={"time":"month","id":"quake_count"}).sort_values("quake_count", ascending=False).head(1)
-    show_df(out)
-
-elif choice.startswith("Q8"):
-    out = df.groupby(df["time"].dt.day_name())["id"].count().reset_index().rename(columns={"time":"day","id":"quake_count"}).sort_values("quake_count", ascending=False)
-    show_df(out)
-
-elif choice.startswith("Q9"):
-    out = df.groupby(df["time"].dt.hour)["id"].count().reset_index().rename(columns={"time":"hour","id":"quake_count"}).sort_values("hour")
-    show_df(out)
-
-elif choice.startswith("Q10"):
-    if "net" in df.columns:
-        out = df["net"].value_counts().reset_index().rename(columns={"index":"net","net":"count"}).head(10)
-        show_df(out)
-    else:
-        st.warning("net column not found.")
-
-elif choice.startswith("Q11"):
-    if "casualties" in df.columns:
-        out = df.groupby(["place","country"])["casualties"].sum().reset_index().sort_values("casualties", ascending=False).head(5)
-        show_df(out)
-    else:
-        st.warning("casualties column not present in dataset.")
-
-elif choice.startswith("Q12"):
-    st.info("Q12 needs country->continent mapping. Showing sum by country as fallback.")
-    if "economic_loss" in df.columns:
-        out = df.groupby("country")["economic_loss"].sum().reset_index().sort_values("economic_loss", ascending=False).head(20)
-        show_df(out)
-    else:
-        st.warning("economic_loss column not present.")
-
-elif choice.startswith("Q13"):
-    if "alert" in df.columns and "economic_loss" in df.columns:
-        out = df.groupby("alert")["economic_loss"].agg(["mean","count"]).reset_index().sort_values("mean", ascending=False)
-        show_df(out)
-    else:
-        st.warning("alert or economic_loss column missing.")
-
-elif choice.startswith("Q14"):
-    if "status" in df.columns:
-        out = df["status"].value_counts().reset_index().rename(columns={"index":"status","status":"count"})
-        show_df(out)
-    else:
-        st.warning("status column missing.")
-
-elif choice.startswith("Q15"):
-    if "type" in df.columns:
-        out = df["type"].value_counts().reset_index().rename(columns={"index":"type","type":"count"})
-        show_df(out)
-    else:
-        st.warning("type column missing.")
-
-elif choice.startswith("Q16"):
-    if "types" in df.columns:
-        # show counts for few common tokens
-        tokens = ["shakemap","dyfi","origin","phase-data","finite-fault"]
-        data = {}
-        for t in tokens:
-            data[t] = df["types"].str.contains(t, na=False).sum()
-        out = pd.DataFrame(list(data.items()), columns=["type_token","count"]).sort_values("count", ascending=False)
-        show_df(out)
-    else:
-        st.warning("types column missing.")
-
-elif choice.startswith("Q17"):
-    st.info("Q17 needs country->continent mapping. Showing avg RMS/gap by country as fallback.")
-    if "rms" in df.columns and "country" in df.columns:
-        out = df.groupby("country")[["rms","gap"]].mean().reset_index().sort_values("rms", ascending=False)
-        show_df(out)
-    else:
-        st.warning("rms or country column missing.")
-
-elif choice.startswith("Q18"):
-    if "nst" in df.columns:
-        threshold = st.sidebar.number_input("nst threshold", value=100, step=10)
-        out = df[df["nst"] > threshold].sort_values("nst", ascending=False)[["id","time","place","country","nst"]]
-        show_df(out)
-    else:
-        st.warning("nst column missing.")
-
-elif choice.startswith("Q19"):
-    if "tsunami" in df.columns:
-        out = df.groupby(df["time"].dt.year)["tsunami"].sum().reset_index().rename(columns={"time":"year","tsunami":"tsunami_events"})
-        show_df(out)
-    else:
-        st.warning("tsunami column missing.")
-
-elif choice.startswith("Q20"):
-    if "alert" in df.columns:
-        out = df["alert"].value_counts().reset_index().rename(columns={"index":"alert","alert":"count"})
-        show_df(out)
-    else:
-        st.warning("alert column missing.")
-
-elif choice.startswith("Q21"):
-    cutoff = (pd.Timestamp.now().year - 10)
-    out = df[df["time"].dt.year >= cutoff].groupby("country")["mag"].agg(["mean","count"]).reset_index().rename(columns={"mean":"avg_mag","count":"events"})
-    out = out[out["events"]>=10].sort_values("avg_mag", ascending=False).head(5)
-    show_df(out)
-
-elif choice.startswith("Q22"):
-    # countries that have both shallow (<50) and deep (>300) in same month
-    if "depth_km" in df.columns:
-        tmp = df.dropna(subset=["country","time","depth_km"]).copy()
-        tmp["year"] = tmp["time"].dt.year
-        tmp["month"] = tmp["time"].dt.month
-        grouped = tmp.groupby(["country","year","month"]).agg(
-            shallow = ("depth_km", lambda s: (s < 50).any()),
-            deep = ("depth_km", lambda s: (s > 300).any()),
-            count = ("depth_km","count")
-        ).reset_index()
-        out = grouped[(grouped["shallow"]) & (grouped["deep"])].sort_values(["country","year","month"])
-        show_df(out)
-    else:
-        st.warning("depth_km column missing.")
-
-elif choice.startswith("Q23"):
-    # year-over-year growth
-    yearly = df.groupby(df["time"].dt.year)["id"].count().reset_index().rename(columns={"time":"year","id":"cnt"}).sort_values("year")
-    yearly["prev"] = yearly["cnt"].shift(1)
-    yearly["growth_pct"] = ((yearly["cnt"] - yearly["prev"]) / yearly["prev"] * 100).round(2)
-    show_df(yearly.fillna(0))
-
-elif choice.startswith("Q24"):
-    # region by place score = count * avg mag
-    tmp = df.groupby("place").agg(freq=("id","count"), avg_mag=("mag","mean")).reset_index()
-    tmp["score"] = tmp["freq"] * tmp["avg_mag"]
-    out = tmp[tmp["freq"]>=5].sort_values("score", ascending=False).head(3)
-    show_df(out)
-
-elif choice.startswith("Q25"):
-    # avg depth per country within ±5° lat
-    if "latitude" in df.columns and "depth_km" in df.columns:
-        tmp = df[(df["latitude"].between(-5,5)) & (~df["country"].isna())]
-        out = tmp.groupby("country")["depth_km"].mean().reset_index().rename(columns={"depth_km":"avg_depth_km"}).sort_values("avg_depth_km", ascending=False)
-        show_df(out)
-    else:
-        st.warning("latitude or depth_km missing.")
-
-elif choice.startswith("Q26"):
-    # ratio shallow:deep per country
-    if "depth_km" in df.columns:
-        tmp = df.dropna(subset=["country","depth_km"])
-        agg = tmp.groupby("country").agg(
-            shallow = ("depth_km", lambda s: (s < 50).sum()),
-            deep = ("depth_km", lambda s: (s > 300).sum())
-        ).reset_index()
-        agg["ratio"] = agg.apply(lambda r: (r["shallow"]/r["deep"]) if r["deep"]>0 else np.nan, axis=1)
-        out = agg[agg["shallow"]+agg["deep"]>=5].sort_values("ratio", ascending=False).head(20)
-        show_df(out)
-    else:
-        st.warning("depth_km missing.")
-
-elif choice.startswith("Q27"):
-    if "tsunami" in df.columns and "mag" in df.columns:
-        avg_t = df[df["tsunami"]==1]["mag"].mean()
-        avg_nt = df[df["tsunami"]==0]["mag"].mean()
-        st.write({"avg_mag_tsunami": avg_t, "avg_mag_no_tsunami": avg_nt, "difference": (avg_t - avg_nt)})
-    else:
-        st.warning("tsunami or mag column missing.")
-
-elif choice.startswith("Q28"):
-    if "rms" in df.columns and "gap" in df.columns:
-        df["error_score"] = df["rms"].fillna(0) + df["gap"].fillna(0)
-        out = df.sort_values("error_score", ascending=False)[["id","time","place","country","rms","gap","error_score"]].head(100)
-        show_df(out)
-    else:
-        st.warning("rms or gap missing.")
-
-elif choice.startswith("Q29"):
-    st.info("Q29 uses a time-ordered consecutive-pair approach and checks distance. For big datasets this can be slow; we limit to most recent N rows.")
-    if ("latitude" in df.columns) and ("longitude" in df.columns):
-        N = st.number_input("Max rows to consider (most recent). Use 10000 for large data; 2000 is faster.", min_value=500, max_value=50000, value=5000, step=500)
-        tmp = df.sort_values("time", ascending=True).tail(N).reset_index(drop=True).copy()
-        tmp["prev_lat"] = tmp["latitude"].shift(1)
-        tmp["prev_lon"] = tmp["longitude"].shift(1)
-        tmp["prev_time"] = tmp["time"].shift(1)
-        # drop rows without prev
-        pairs = tmp.dropna(subset=["prev_lat","prev_lon","prev_time"]).copy()
-        pairs["minutes_diff"] = (pairs["time"] - pairs["prev_time"]).dt.total_seconds() / 60.0
-        pairs["distance_km"] = haversine_km(pairs["prev_lat"].values, pairs["prev_lon"].values, pairs["latitude"].values, pairs["longitude"].values)
-        out = pairs[(pairs["minutes_diff"] <= 60) & (pairs["distance_km"] <= 50)][["id","prev_time","time","minutes_diff","distance_km","place"]]
-        show_df(out.sort_values("time", ascending=False).head(500))
-    else:
-        st.warning("latitude/longitude not present.")
-
-elif choice.startswith("Q30"):
-    if "depth_km" in df.columns:
-        out = df[df["depth_km"] > 300].groupby("country")["id"].count().reset_index().rename(columns={"id":"deep_count"}).sort_values("deep_count", ascending=False).head(20)
-        show_df(out)
-    else:
-        st.warning("depth_km missing.")
-
+task = choice.split()[0]
+query = queries.REGISTRY[task]
+if query.note:
+    st.info(query.note)
+
+# sidebar parameters as the query declares them, passed to the SQL as @variables
+params = {p.name: st.sidebar.number_input(p.label, **p.widget_args()) for p in query.params}
+
+# the registry runs the query's SQL through DuckDB when it can, else its pandas version over only the
+# declared columns; results are memoized per dataset version (live_feed.py appends start a new one) and parameters
+try:
+    out = queries.run(task, params)
+except queries.MissingColumns as exc:
+    st.warning(str(exc))
 else:
-    st.write("Task not implemented.")
+    if task == "Q29":
+        st.write({"pairs": len(out)})
+        out = out.head(500)
+    show_df(out)
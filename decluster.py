@@ -0,0 +1,179 @@
+# decluster.py
+# Aftershock declustering over the full catalogue: Gardner-Knopoff space-time windows searched with
+# the proximity.py grid index, so every event is labelled with the mainshock of its cluster.
+# Run: python decluster.py              (label the cleaned data, stored under CLUSTER_DIR)
+#      python decluster.py --validate 100000   (against a synthetic catalogue's true parents)
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from config import CLUSTER_DIR, DECLUSTER_MAG_STEP
+import proximity
+import storage
+
+# the labels table: one row per event id (same name in DuckDB and MySQL, joined like country_continent)
+CLUSTER_TABLE = "earthquake_clusters"
+CLUSTER_COLUMNS = ["cluster_id", "mainshock"]
+DAY_S = 86_400.0
+
+
+def gk_window(mag):
+    # Gardner & Knopoff (1974) aftershock window of a magnitude-`mag` event: (km, days)
+    mag = np.asarray(mag, dtype="float64")
+    km = 10 ** (0.1238 * mag + 0.983)
+    days = np.where(mag >= 6.5, 10 ** (0.032 * mag + 2.7389), 10 ** (0.5409 * mag - 0.547))
+    return km, days
+
+
+def _priority(mag, time_s):
+    # processing order: largest first, the earlier of equal magnitudes first
+    order = np.lexsort((time_s, -mag))
+    rank = np.empty(len(mag), dtype=np.int64)
+    rank[order] = np.arange(len(mag))
+    return rank
+
+
+def _resolve(parent, i, j, members):
+    """
+    Settle the claims i -> j (sorted by j, then claimer priority) made by `members`,
+    one magnitude bin, whose own status may depend on each other. Each round, an
+    event goes to its first claimer that is still standing once that claimer is a
+    confirmed mainshock, and members nothing can claim any more become mainshocks.
+    """
+    while True:
+        # claimers that were themselves claimed drop out, as do targets already settled
+        live = ((parent[i] < 0) | (parent[i] == i)) & (parent[j] < 0)
+        i, j = i[live], j[live]
+        pending = members[parent[members] < 0]
+        if not len(pending) and not len(j):
+            return
+        if len(j):
+            first = np.r_[True, j[1:] != j[:-1]]
+            won = parent[i[first]] == i[first]
+            parent[j[first][won]] = i[first][won]
+        free = pending[~np.isin(pending, j)]
+        parent[free] = free
+
+
+def gardner_knopoff(lat, lon, time_s, mag, mag_step=DECLUSTER_MAG_STEP):
+    """
+    Row of every event's mainshock (its own row for mainshocks). Events are taken
+    in order of decreasing magnitude: one that no larger event has claimed becomes a
+    mainshock and claims every unclaimed event of at most its magnitude inside its
+    window after it (gk_window; foreshocks stay independent).
+
+    Magnitude bins of `mag_step` go largest first. Each bin probes the grid index
+    only from its own unclaimed events, against the events still unclaimed, so an
+    aftershock sequence claimed by its mainshock never generates pairs among its
+    own events: O(n log n) per bin plus the candidates inside the windows.
+    """
+    lat, lon, time_s, mag = (np.asarray(a, dtype="float64") for a in (lat, lon, time_s, mag))
+    parent = np.full(len(mag), -1, dtype=np.int64)
+    rank = _priority(mag, time_s)
+    km, days = gk_window(mag)
+    bins = np.floor(mag / mag_step).astype(np.int64)
+    for b in np.unique(bins)[::-1]:
+        open_rows = np.flatnonzero(parent < 0)
+        src = np.flatnonzero(bins[open_rows] == b)
+        if not len(src):
+            continue
+        members = open_rows[src]
+        i, j, dist, dt = proximity.neighbour_pairs(
+            lat[open_rows], lon[open_rows], time_s[open_rows],
+            max_km=km[members].max(), max_seconds=days[members].max() * DAY_S, sources=src
+        )
+        i, j = open_rows[i], open_rows[j]
+        keep = (rank[i] < rank[j]) & (dist <= km[i]) & (dt <= days[i] * DAY_S)
+        i, j = i[keep], j[keep]
+        order = np.lexsort((rank[i], j))
+        _resolve(parent, i[order], j[order], members)
+    return parent
+
+
+def decluster(df, mag_step=DECLUSTER_MAG_STEP):
+    """
+    Cluster labels for the cleaned events: id, cluster_id (the id of the event's
+    mainshock, its own for mainshocks and independent events) and mainshock (1/0).
+    Events without a time, location or magnitude stand alone.
+    """
+    n = len(df)
+    valid = (df["time"].notna() & df["latitude"].notna() & df["longitude"].notna() & df["mag"].notna()).to_numpy()
+    rows = np.flatnonzero(valid)
+    data = df[valid]
+    time_s = data["time"].astype("datetime64[ms]").astype("int64").to_numpy() / 1000.0
+    parent = np.arange(n)
+    parent[rows] = rows[gardner_knopoff(data["latitude"], data["longitude"], time_s, data["mag"], mag_step)]
+    ids = df["id"].to_numpy()
+    return pd.DataFrame({"id": ids, "cluster_id": ids[parent], "mainshock": (parent == np.arange(n)).astype("int8")})
+
+
+def save_clusters(labels):
+    storage.save_table(labels, CLUSTER_DIR, CLUSTER_TABLE)
+
+
+def load_clusters(columns=None):
+    # the stored labels, or None before the first run
+    labels = storage.load_table(CLUSTER_DIR, CLUSTER_TABLE)
+    return labels if labels is None or columns is None else labels[columns]
+
+
+def clusters_exist():
+    return os.path.exists(storage.table_path(CLUSTER_DIR, CLUSTER_TABLE))
+
+
+def refresh_clusters(df_clean):
+    """
+    Relabel the whole cleaned catalogue and store the labels. Always a full pass:
+    a new large event can claim events that an older, smaller mainshock held.
+    Events appended by live_feed.py stay unlabelled until the next run.
+    """
+    labels = decluster(df_clean)
+    save_clusters(labels)
+    return labels
+
+
+def validate(rows=100_000, seed=42):
+    """
+    Decluster a synthetic catalogue (synthetic.events) and score it against its
+    `parent` ground truth: aftershock recall/precision and how many found
+    aftershocks are tied to their true mainshock.
+    """
+    import synthetic
+
+    cat = synthetic.events(rows, seed)
+    started = time.perf_counter()
+    parent = gardner_knopoff(cat["latitude"], cat["longitude"], cat["time_ms"] / 1000.0, cat["mag"])
+    seconds = time.perf_counter() - started
+    truth = cat["parent"]
+    found = parent != np.arange(rows)
+    actual = truth >= 0
+    hits = found & actual
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "aftershocks": int(actual.sum()),
+        "found": int(found.sum()),
+        "recall": round(float(hits.sum() / max(actual.sum(), 1)), 4),
+        "precision": round(float(hits.sum() / max(found.sum(), 1)), 4),
+        "right_mainshock": round(float((parent[hits] == truth[hits]).sum() / max(hits.sum(), 1)), 4),
+        "clusters": int(len(np.unique(parent[found]))),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gardner-Knopoff aftershock declustering")
+    parser.add_argument("--validate", type=int, default=None, metavar="ROWS",
+                        help="score against a synthetic catalogue of ROWS events instead")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.validate:
+        print(f"🧪 {validate(args.validate, args.seed)}")
+    else:
+        started = time.perf_counter()
+        labels = refresh_clusters(storage.load_clean(columns=["id", "time", "latitude", "longitude", "mag"]))
+        print(f"✅ {len(labels)} events, {int(labels['mainshock'].sum())} mainshocks, "
+              f"{len(labels) - int(labels['mainshock'].sum())} aftershocks "
+              f"({time.perf_counter() - started:.1f}s) -> {CLUSTER_DIR}")
@@ -0,0 +1,93 @@
+# event_store.py
+# Compact in-memory form of the cleaned events for the dashboard's queries.Dataset: dictionary-encoded
+# strings, float32 coordinates, and comma-delimited token lists parsed once.
+import numpy as np
+import pandas as pd
+
+FLOAT32_COLS = ["latitude", "longitude"]
+TIME_COLS = ["time", "updated"]
+# string columns with at most this many distinct values per row are dictionary-encoded
+DICT_MAX_RATIO = 0.5
+MASK_BITS = 64
+
+
+class TokenSets:
+    """
+    One comma-delimited column, parsed once. Distinct strings are tokenized
+    once each; every row keeps only the code of its string.
+
+    With at most 64 distinct tokens (`types`), each string's tokens are a
+    uint64 bitmask; otherwise (`ids`, `sources`) a token table: CSR offsets
+    into token codes. contains() matches tokens like str.contains() matches
+    the whole string, as long as `needle` has no comma.
+    """
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(pd.Series(values).astype("object"), use_na_sentinel=True)
+        # every string distinct (`ids`): rows index the table directly, no codes or weights needed
+        distinct = len(uniques) == len(codes) and bool((codes == np.arange(len(codes))).all())
+        self.codes = None if distinct else codes.astype(np.int32)
+        vocab, lengths, indices = {}, [], []
+        for text in uniques:
+            tokens = [token for token in str(text).split(",") if token]
+            lengths.append(len(tokens))
+            indices.extend(vocab.setdefault(token, len(vocab)) for token in tokens)
+        # an Arrow-backed string array where pandas has one, not one Python object per token
+        self.tokens = pd.array(list(vocab), dtype="str")
+        self.indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        # rows per distinct string, so counts never touch the per-row codes again
+        self.weights = None if distinct else np.bincount(codes[codes >= 0], minlength=len(uniques)).astype(np.int32)
+        self.masks = None
+        if len(self.tokens) <= MASK_BITS:
+            bits = np.left_shift(np.uint64(1), self.indices.astype(np.uint64))
+            owner = np.repeat(np.arange(len(uniques)), lengths)
+            self.masks = np.zeros(len(uniques), dtype=np.uint64)
+            np.bitwise_or.at(self.masks, owner, bits)
+
+    def __len__(self):
+        return len(self.indptr) - 1 if self.codes is None else len(self.codes)
+
+    def _matches(self, needle):
+        # per distinct string: does any of its tokens contain `needle`
+        hits = np.flatnonzero(pd.Series(self.tokens).str.contains(needle, regex=False).to_numpy(dtype=bool))
+        if self.masks is not None:
+            wanted = np.bitwise_or.reduce(np.left_shift(np.uint64(1), hits.astype(np.uint64)), initial=np.uint64(0))
+            return (self.masks & wanted) != 0
+        found = np.isin(self.indices, hits).astype(np.int64)
+        return np.add.reduceat(np.append(found, 0), self.indptr[:-1]) * (np.diff(self.indptr) > 0) > 0
+
+    def contains(self, needle):
+        # boolean row mask, False for missing values
+        matches = self._matches(needle)
+        if self.codes is None:
+            return matches
+        return np.where(self.codes >= 0, matches[np.maximum(self.codes, 0)], False)
+
+    def count(self, needle):
+        matches = self._matches(needle)
+        return int(np.count_nonzero(matches) if self.weights is None else self.weights[matches].sum())
+
+    def nbytes(self):
+        arrays = [self.codes, self.indptr, self.indices, self.weights, self.masks]
+        return sum(a.nbytes for a in arrays if a is not None) + int(pd.Series(self.tokens).memory_usage(deep=True, index=False))
+
+
+def compact_frame(df):
+    """
+    The same events in less memory: low-cardinality strings as categoricals,
+    times as datetime64[ms] (int64 epoch milliseconds), coordinates as float32.
+    """
+    out = {}
+    for col in df.columns:
+        values = df[col]
+        if col in TIME_COLS and pd.api.types.is_datetime64_any_dtype(values):
+            values = values.astype("datetime64[ms]")
+        elif col in FLOAT32_COLS and pd.api.types.is_float_dtype(values):
+            values = values.astype("float32")
+        elif pd.api.types.is_string_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            if values.nunique(dropna=True) <= DICT_MAX_RATIO * len(values):
+                values = values.astype("category")
+        out[col] = values
+    return pd.DataFrame(out, index=df.index)
+
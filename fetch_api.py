@@ -1,76 +1,600 @@
+import codecs
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import requests
 import pandas as pd
-from datetime import datetime
+from array import array
+from datetime import datetime, timedelta, timezone
 from dateutil.relativedelta import relativedelta
-from config import USGS_URL, STARTTIME, ENDTIME, MIN_MAGNITUDE, RAW_CSV
+from requests.adapters import HTTPAdapter
+from config import (
+    USGS_URL, USGS_COUNT_URL, STARTTIME, ENDTIME, MIN_MAGNITUDE,
+    FETCH_CONCURRENT, FETCH_WORKERS, MAX_REQUESTS_PER_SEC,
+    FETCH_RETRIES, FETCH_BACKOFF, FETCH_TIMEOUT,
+    FETCH_ADAPTIVE, FDSN_MAX_EVENTS, WINDOW_FILL, CHECKPOINT_JSON, CHECKPOINT_MARGIN_MINUTES, FETCH_CACHE
+)
+import storage
+import instrument
+from fetch_cache import WindowCache
+
+try:
+    import ijson
+except ImportError:  # optional, enables incremental JSON parsing
+    ijson = None
+
+TIME_FMT = "%Y-%m-%dT%H:%M:%S"
+MIN_WINDOW = timedelta(minutes=1)
+STREAM_CHUNK = 1 << 20  # bytes read at a time by the stdlib streaming parser
+
+
+class RateLimiter:
+    """
+    Spaces out calls so that at most `rate` requests start per second (shared across threads).
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_at = 0.0
 
-def fetch_simple():
-    start = datetime.strptime(STARTTIME, "%Y-%m-%d")
-    end = datetime.strptime(ENDTIME, "%Y-%m-%d")
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            sleep_for = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if sleep_for > 0:
+            time.sleep(sleep_for)
 
-    all_records = []
 
-    print("\nFetching monthly earthquake data...\n")
+def make_session(pool_size=FETCH_WORKERS):
+    # keep-alive session with a connection pool sized for the worker count
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
+
+def month_windows(starttime=STARTTIME, endtime=ENDTIME):
+    start = datetime.strptime(starttime, "%Y-%m-%d")
+    end = datetime.strptime(endtime, "%Y-%m-%d")
+
+    windows = []
     while start <= end:
         month_start = start.strftime("%Y-%m-%d")
-        month_end = (start + relativedelta(months=1) - relativedelta(days=1)).strftime("%Y-%m-%d")
+        # a bare date means midnight to the API, so the end runs to the last millisecond of the month
+        month_end = (start + relativedelta(months=1) - relativedelta(days=1)).strftime("%Y-%m-%dT23:59:59.999")
+        windows.append((month_start, month_end))
+        start += relativedelta(months=1)
+    return windows
+
+
+# raw columns in output order: (name, source, kind)
+# source is "id", a properties key, or a geometry coordinate index
+FIELDS = [
+    ("id", "id", "str"),
+    ("time", "time", "int"),
+    ("updated", "updated", "int"),
+    ("mag", "mag", "float"),
+    ("magType", "magType", "str"),
+    ("place", "place", "str"),
+    ("type", "type", "str"),
+    ("status", "status", "str"),
+    ("tsunami", "tsunami", "int"),
+    ("sig", "sig", "int"),
+    ("net", "net", "str"),
+    ("nst", "nst", "int"),
+    ("dmin", "dmin", "float"),
+    ("rms", "rms", "float"),
+    ("gap", "gap", "float"),
+    ("magError", "magError", "float"),
+    ("depthError", "depthError", "float"),
+    ("magNst", "magNst", "int"),
+    ("locationSource", "locationSource", "str"),
+    ("magSource", "magSource", "str"),
+    ("types", "types", "str"),
+    ("ids", "ids", "str"),
+    ("sources", "sources", "str"),
+    ("latitude", 1, "float"),
+    ("longitude", 0, "float"),
+    ("depth_km", 2, "float"),
+]
+STR_PROPS = [name for name, src, kind in FIELDS if isinstance(src, str) and src != "id" and kind == "str"]
+NUM_PROPS = [name for name, src, kind in FIELDS if isinstance(src, str) and src != "id" and kind != "str"]
+COORD_FIELDS = [(name, src) for name, src, kind in FIELDS if isinstance(src, int)]
+NAN = float("nan")
+
+
+class FeatureColumns:
+    """
+    Column buffers for parsed GeoJSON features.
+
+    Numbers go straight into typed arrays (float64, NaN for missing) and strings
+    into plain lists, so no per-row dict is ever built. Integer fields become
+    int64 in to_frame() when nothing is missing, float64 otherwise (the same
+    inference pandas applies to a list of records).
+    """
+    def __init__(self):
+        self.cols = {name: ([] if kind == "str" else array("d")) for name, _, kind in FIELDS}
+        self.rows = 0
+
+    def __len__(self):
+        return self.rows
+
+    def add(self, feature):
+        cols = self.cols
+        props = feature["properties"]
+        geom = feature["geometry"]
+
+        cols["id"].append(feature["id"])
+        for name in STR_PROPS:
+            cols[name].append(props.get(name))
+        for name in NUM_PROPS:
+            value = props.get(name)
+            cols[name].append(NAN if value is None else value)
+
+        coords = geom["coordinates"] if geom else None
+        for name, idx in COORD_FIELDS:
+            value = coords[idx] if coords is not None and len(coords) > idx else None
+            cols[name].append(NAN if value is None else value)
+        self.rows += 1
+
+    def extend(self, other):
+        for name in self.cols:
+            self.cols[name].extend(other.cols[name])
+        self.rows += other.rows
+
+    def to_frame(self):
+        data = {}
+        for name, _, kind in FIELDS:
+            buf = self.cols[name]
+            if kind == "str":
+                # the dtype pandas infers for a list of records (Arrow-backed strings on pandas 3)
+                data[name] = pd.Series(buf, dtype="str")
+                continue
+            values = np.frombuffer(buf, dtype=np.float64) if len(buf) else np.empty(0)
+            if kind == "int" and len(values) and not np.isnan(values).any():
+                values = values.astype(np.int64)
+            data[name] = values
+        return pd.DataFrame(data)
 
-        print(f"Fetching {month_start} to {month_end} ...")
 
-        params = {
-            "format": "geojson",
-            "starttime": month_start,
-            "endtime": month_end,
-            "minmagnitude": MIN_MAGNITUDE
-        }
+def parse_features(data, into=None):
+    # decoded GeoJSON dict -> FeatureColumns
+    cols = into if into is not None else FeatureColumns()
+    for feature in data.get("features", []):
+        cols.add(feature)
+    return cols
 
-        resp = requests.get(USGS_URL, params=params)
 
-        if resp.status_code != 200:
-            print(f"❌ Failed for {month_start}: {resp.status_code}")
-            start += relativedelta(months=1)
+class _JsonReader:
+    # a byte stream decoded a chunk at a time, holding only what hasn't been consumed yet
+    def __init__(self, fh, chunk=STREAM_CHUNK):
+        self.fh, self.chunk = fh, chunk
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buf, self.pos, self.eof = "", 0, False
+
+    def _fill(self):
+        data = self.fh.read(self.chunk)
+        self.eof = not data
+        self.buf = self.buf[self.pos:] + self.utf8.decode(data, final=self.eof)
+        self.pos = 0
+
+    def peek(self):
+        # the next non-whitespace character ("" at the end of the stream)
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"malformed GeoJSON: expected {char!r} at {self.buf[self.pos:self.pos + 40]!r}")
+        self.pos += 1
+
+    def value(self):
+        # one complete JSON value; a value running into the end of the buffer may be cut short, so read more
+        while True:
+            self.peek()  # raw_decode doesn't skip leading whitespace
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            if end < len(self.buf) or self.eof:
+                self.pos = end
+                return value
+            self._fill()
+
+
+def iter_features(fh, chunk=STREAM_CHUNK):
+    """
+    The Feature dicts of a GeoJSON FeatureCollection byte stream, one at a time,
+    with the standard library only: the top-level members are walked, and
+    features are decoded one by one out of a buffer of about `chunk` bytes.
+    """
+    reader = _JsonReader(fh, chunk)
+    reader.expect("{")
+    while reader.peek() not in ("}", ""):
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        key = reader.value()
+        reader.expect(":")
+        if key != "features":
+            reader.value()  # type, metadata, bbox: small
             continue
+        reader.expect("[")
+        while reader.peek() != "]":
+            if reader.peek() == ",":
+                reader.pos += 1
+                continue
+            yield reader.value()
+        # nothing after the features array is needed
+        return
 
-        data = resp.json()
-
-        for feature in data.get("features", []):
-            props = feature["properties"]
-            geom = feature["geometry"]
-
-            all_records.append({
-                "id": feature["id"],
-                "time": props.get("time"),
-                "updated": props.get("updated"),
-                "mag": props.get("mag"),
-                "magType": props.get("magType"),
-                "place": props.get("place"),
-                "type": props.get("type"),
-                "status": props.get("status"),
-                "tsunami": props.get("tsunami"),
-                "sig": props.get("sig"),
-                "net": props.get("net"),
-                "nst": props.get("nst"),
-                "dmin": props.get("dmin"),
-                "rms": props.get("rms"),
-                "gap": props.get("gap"),
-                "magError": props.get("magError"),
-                "depthError": props.get("depthError"),
-                "magNst": props.get("magNst"),
-                "locationSource": props.get("locationSource"),
-                "magSource": props.get("magSource"),
-                "types": props.get("types"),
-                "ids": props.get("ids"),
-                "sources": props.get("sources"),
-                "latitude": geom["coordinates"][1] if geom else None,
-                "longitude": geom["coordinates"][0] if geom else None,
-                "depth_km": geom["coordinates"][2] if geom else None
-            })
 
-        start += relativedelta(months=1)
+def parse_stream(fh, into=None):
+    """
+    Parse a GeoJSON byte stream feature by feature, so the decoded payload never
+    sits in memory as a whole: with ijson when it is installed (faster), with the
+    stdlib iter_features() otherwise.
+    """
+    cols = into if into is not None else FeatureColumns()
+    features = iter_features(fh) if ijson is None else ijson.items(fh, "features.item", use_float=True)
+    for feature in features:
+        cols.add(feature)
+    return cols
+
+
+def get_with_retry(session, url, params, label, limiter=None,
+                   retries=FETCH_RETRIES, backoff=FETCH_BACKOFF, stream=False, headers=None):
+    """
+    GET with retries on network errors and non-200 responses, using exponential backoff.
+    Returns the response (200, or 304 for a conditional request), or None if every attempt failed.
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.wait()
+        started = time.perf_counter()
+        try:
+            resp = session.get(url, params=params, timeout=FETCH_TIMEOUT, stream=stream, headers=headers)
+            status = resp.status_code
+        except requests.RequestException as exc:
+            resp, status = None, exc.__class__.__name__
+        # time to response headers (body download is timed by the caller)
+        instrument.record_request(status, time.perf_counter() - started)
+
+        if resp is not None and (status == 200 or (status == 304 and headers)):
+            return resp
+        if resp is not None:
+            resp.close()
+        if resp is not None and 400 <= status < 500 and status != 429:
+            # client errors (e.g. too many matching events) won't succeed on retry
+            break
+
+        if attempt < retries:
+            delay = backoff * (2 ** attempt)
+            print(f"⚠️ Retry {attempt + 1}/{retries} for {label} ({status}), waiting {delay:.1f}s")
+            time.sleep(delay)
+
+    print(f"❌ Failed for {label}: {status}")
+    return None
+
+
+def query_params(start, end, extra=None):
+    params = {
+        "format": "geojson",
+        "starttime": start,
+        "endtime": end,
+        "minmagnitude": MIN_MAGNITUDE
+    }
+    if extra:
+        params.update(extra)
+    return params
+
+
+def fetch_window(session, start, end, url=USGS_URL, limiter=None,
+                 retries=FETCH_RETRIES, backoff=FETCH_BACKOFF, extra=None, cache=None):
+    """
+    Fetch and parse one window (None if every attempt failed).
+    With a WindowCache, a fresh entry is returned without any request, a stale
+    one is revalidated with ETag/Last-Modified, and a completed download is
+    stored before returning. Failed windows are never cached.
+    """
+    params = query_params(start, end, extra)
+    meta = cache.lookup(url, params) if cache is not None else None
+    if meta is not None and meta["fresh"]:
+        cols = cache.load(meta)
+        if cols is not None:
+            return cols
+        meta = None
+    headers = cache.conditional_headers(meta) if meta is not None else None
+
+    resp = get_with_retry(session, url, params, start, limiter=limiter, retries=retries,
+                          backoff=backoff, stream=True, headers=headers)
+    if resp is None:
+        return None
+    if resp.status_code == 304:
+        resp.close()
+        cols = cache.load(meta, revalidated=True)
+        if cols is not None:
+            return cols
+        # entry vanished (evicted) or unreadable between lookup and load: fetch it unconditionally
+        return fetch_window(session, start, end, url=url, limiter=limiter, retries=retries,
+                            backoff=backoff, extra=extra, cache=cache)
+    started = time.perf_counter()
+    try:
+        resp.raw.decode_content = True
+        cols = parse_stream(resp.raw)
+    finally:
+        # body download and parsing overlap when streaming, so they are timed together
+        instrument.record_body(resp.raw.tell(), time.perf_counter() - started)
+        resp.close()
+    if cache is not None:
+        cache.store(url, params, cols, resp.headers)
+    return cols
+
 
-    df = pd.DataFrame(all_records)
-    df.to_csv(RAW_CSV, index=False)
+def count_window(session, start, end, count_url=USGS_COUNT_URL, limiter=None, extra=None):
+    # FDSN count endpoint: {"count": n, "maxAllowed": 20000}
+    resp = get_with_retry(session, count_url, query_params(start, end, extra), f"count {start}", limiter=limiter)
+    if resp is None:
+        return None
+    instrument.record_body(len(resp.content))
+    return int(resp.json()["count"])
+
+
+def plan_windows(starttime=STARTTIME, endtime=ENDTIME, session=None, count_url=USGS_COUNT_URL,
+                 max_events=FDSN_MAX_EVENTS, fill=WINDOW_FILL, limiter=None, extra=None):
+    """
+    Build a window schedule that keeps every query under the FDSN event cap.
+
+    Starts from the whole range (so quiet months are merged into a single query)
+    and splits any window whose count exceeds `max_events` into pieces sized for
+    roughly `fill * max_events` events, re-counting each piece until it fits.
+    Returns a chronological list of (start, end, expected_count).
+    `extra` adds query filters (e.g. updatedafter) to every count request.
+    """
+    months = month_windows(starttime, endtime)
+    if not months:
+        return []
+    lo = datetime.strptime(months[0][0], "%Y-%m-%d")
+    hi = datetime.strptime(months[-1][0], "%Y-%m-%d") + relativedelta(months=1)
+
+    own_session = session is None
+    if own_session:
+        session = make_session()
+    target = max(1, int(max_events * fill))
+
+    def split(start, end):
+        n = count_window(session, start.strftime(TIME_FMT), end.strftime(TIME_FMT),
+                         count_url=count_url, limiter=limiter, extra=extra)
+        if n is None or n <= max_events or end - start <= MIN_WINDOW:
+            return [(start.strftime(TIME_FMT), end.strftime(TIME_FMT), n)]
+
+        pieces = max(2, math.ceil(n / target))
+        step = max((end - start) / pieces, MIN_WINDOW)
+        planned = []
+        piece_start = start
+        while piece_start < end:
+            piece_end = min(piece_start + step, end).replace(microsecond=0)
+            if piece_end <= piece_start:
+                piece_end = end
+            planned.extend(split(piece_start, piece_end))
+            piece_start = piece_end
+        return planned
+
+    plan = merge_quiet(split(lo, hi), target)
+    if own_session:
+        session.close()
+    if len(plan) == 1 and plan[0][2] is None:
+        # count endpoint unavailable: fall back to the fixed monthly schedule
+        return [(start, end, None) for start, end in months]
+    return plan
+
+
+def merge_quiet(plan, target):
+    # join neighbouring windows left small by a split, as long as the sum stays within target
+    merged = []
+    for start, end, n in plan:
+        if merged and n is not None and merged[-1][2] is not None and merged[-1][2] + n <= target:
+            merged[-1] = (merged[-1][0], end, merged[-1][2] + n)
+        else:
+            merged.append((start, end, n))
+    return merged
+
+
+def schedule_summary(plan):
+    counts = [n for _, _, n in plan if n is not None]
+    return {
+        "windows": len(plan),
+        "expected_events": sum(counts),
+        "max_window_events": max(counts) if counts else 0,
+        "unknown_windows": len(plan) - len(counts),
+    }
+
+
+def fetch_simple(concurrent=FETCH_CONCURRENT, workers=FETCH_WORKERS, url=USGS_URL,
+                 rate=MAX_REQUESTS_PER_SEC, save=True, adaptive=FETCH_ADAPTIVE,
+                 count_url=USGS_COUNT_URL, cache=FETCH_CACHE):
+    # cache: True for the configured WindowCache, False to always download, or a WindowCache
+    session = make_session(workers)
+    limiter = RateLimiter(rate)
+    if cache is True:
+        cache = WindowCache()
+    cache = cache or None
+
+    if adaptive:
+        plan = plan_windows(session=session, count_url=count_url, limiter=limiter)
+        print(f"\nPlanned {len(plan)} windows (adaptive)", schedule_summary(plan))
+        windows = [(start, end) for start, end, _ in plan]
+    else:
+        windows = month_windows()
+
+    all_cols = FeatureColumns()
+    failed = []
+
+    if concurrent:
+        print(f"\nFetching earthquake data ({workers} workers)...\n")
+
+        def task(window):
+            print(f"Fetching {window[0]} to {window[1]} ...")
+            return fetch_window(session, window[0], window[1], url=url, limiter=limiter, cache=cache)
+
+        # map() yields in submission order, so rows come out exactly as in the sequential path
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for window, cols in zip(windows, pool.map(task, windows)):
+                if cols is None:
+                    failed.append(window)
+                else:
+                    all_cols.extend(cols)
+    else:
+        print("\nFetching earthquake data...\n")
+
+        for start, end in windows:
+            print(f"Fetching {start} to {end} ...")
+            cols = fetch_window(session, start, end, url=url, limiter=limiter, cache=cache)
+            if cols is None:
+                failed.append((start, end))
+            else:
+                all_cols.extend(cols)
+
+    session.close()
+    if cache is not None:
+        evicted = cache.evict()
+        print(f"\n💾 Window cache: {cache.summary()}, evicted {evicted}")
+    if failed:
+        # saving the rest would replace the raw dataset with one missing these windows
+        raise RuntimeError(
+            f"{len(failed)} of {len(windows)} windows failed after every retry "
+            f"({', '.join(start for start, _ in failed)}); the raw dataset was left as it was. "
+            f"Rerun to fetch them (completed windows are reused from the window cache)."
+        )
+
+    df = all_cols.to_frame()
+    if adaptive and not df.empty:
+        # FDSN start/end are both inclusive, so an event exactly on a split boundary comes back twice
+        df = df.drop_duplicates(subset="id", keep="first").reset_index(drop=True)
+    if save:
+        storage.save_raw(df)
 
     print(f"\n🎉 Completed fetching. Total rows = {df.shape[0]}")
     return df
+
+
+def load_checkpoint(path=CHECKPOINT_JSON):
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def save_checkpoint(df, path=CHECKPOINT_JSON, previous=None, started=None):
+    # high-water mark on `updated` (epoch ms, server clock) plus the time this run started (UTC)
+    max_updated = pd.to_numeric(df["updated"], errors="coerce").max() if "updated" in df.columns else None
+    if pd.isna(max_updated) and previous:
+        max_updated = previous.get("max_updated")
+    checkpoint = {
+        "last_fetch": (started or datetime.now(timezone.utc)).strftime(TIME_FMT),
+        "max_updated": None if max_updated is None or pd.isna(max_updated) else int(max_updated),
+    }
+    with open(path, "w") as fh:
+        json.dump(checkpoint, fh, indent=2)
+    return checkpoint
+
+
+def resume_from(checkpoint, margin_minutes=CHECKPOINT_MARGIN_MINUTES):
+    """
+    The `updatedafter` time for the next incremental fetch: the last run's start
+    minus `margin_minutes`, or its newest `updated` if that is earlier. An event
+    can reach the API some time after its `updated` stamp, so starting from
+    max(updated) alone would skip the ones indexed late; merge_events drops
+    whatever the overlap fetches twice.
+    """
+    since = datetime.fromtimestamp(checkpoint["max_updated"] / 1000, tz=timezone.utc)
+    if checkpoint.get("last_fetch"):
+        started = datetime.strptime(checkpoint["last_fetch"], TIME_FMT).replace(tzinfo=timezone.utc)
+        since = min(since, started - timedelta(minutes=margin_minutes))
+    return since
+
+
+def merge_events(existing, delta):
+    """
+    Merge changed/new events into an existing raw frame by `id`, keeping the row
+    with the newest `updated`. Existing rows keep their position; new ids are appended.
+    """
+    if delta is None or delta.empty:
+        return existing
+    combined = pd.concat([existing, delta], ignore_index=True)
+    first_seen = combined.drop_duplicates(subset="id", keep="first")["id"]
+    position = pd.Series(range(len(first_seen)), index=first_seen.values)
+
+    combined["_updated"] = pd.to_numeric(combined["updated"], errors="coerce")
+    latest = combined.sort_values("_updated", kind="stable", na_position="first")
+    latest = latest.drop_duplicates(subset="id", keep="last")
+    latest["_pos"] = latest["id"].map(position)
+    latest = latest.sort_values("_pos").drop(columns=["_updated", "_pos"])
+    return latest.reset_index(drop=True)
+
+
+def fetch_incremental(url=USGS_URL, count_url=USGS_COUNT_URL, rate=MAX_REQUESTS_PER_SEC,
+                      checkpoint_path=CHECKPOINT_JSON):
+    """
+    Fetch only events updated since the last checkpoint and merge them into the raw dataset.
+    Falls back to a full fetch_simple() when there is no checkpoint or raw file yet.
+    The checkpoint only advances when every window arrived.
+    """
+    started = datetime.now(timezone.utc)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if not checkpoint or checkpoint.get("max_updated") is None or not storage.raw_exists():
+        print("\nNo checkpoint found, running full fetch...")
+        df = fetch_simple(url=url, count_url=count_url, rate=rate)
+        save_checkpoint(df, checkpoint_path, started=started)
+        return df
+
+    since = resume_from(checkpoint)
+    extra = {"updatedafter": since.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]}
+    print(f"\nFetching events updated after {extra['updatedafter']} ...")
+
+    session = make_session()
+    limiter = RateLimiter(rate)
+    # the delta is usually one window, but a long gap between runs can still exceed the cap
+    plan = plan_windows(session=session, count_url=count_url, limiter=limiter, extra=extra)
+    cols = FeatureColumns()
+    failed = []
+    for start, end, n in plan:
+        if n == 0:
+            continue
+        window_cols = fetch_window(session, start, end, url=url, limiter=limiter, extra=extra)
+        if window_cols is None:
+            failed.append(start)
+        else:
+            cols.extend(window_cols)
+    session.close()
+
+    delta = cols.to_frame()
+    existing = storage.load_raw()
+    df = merge_events(existing, delta)
+    storage.save_raw(df)
+    if failed:
+        # the windows that did arrive are merged, but the checkpoint stays put so the next run asks again
+        print(f"\n❌ {len(failed)} of {len(plan)} windows failed ({', '.join(failed)}): "
+              f"checkpoint kept, the next run asks again from {extra['updatedafter']}")
+    else:
+        save_checkpoint(df, checkpoint_path, previous=checkpoint, started=started)
+
+    print(f"\n🎉 Merged {len(delta)} changed events. Total rows = {df.shape[0]}")
+    return df
@@ -0,0 +1,160 @@
+# fetch_cache.py
+# On-disk cache of parsed API windows, so an interrupted or repeated fetch only downloads what changed.
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import FETCH_CACHE_DIR, FETCH_CACHE_MAX_MB, FETCH_CACHE_TTL_HOURS, FETCH_CACHE_SETTLE_DAYS
+
+
+class WindowCache:
+    """
+    One entry per (url, query params): the window's parsed column buffers
+    (<key>.pkl.gz) plus a JSON sidecar with the params, ETag/Last-Modified and
+    fetch time. Entries are written as soon as their window completes, via a
+    temp file + rename, so a crash never leaves a half-written entry behind.
+
+    Windows that ended more than `settle_days` ago are reused as they are.
+    More recent windows are still being revised upstream: they are reused for
+    `ttl_hours`, then revalidated with a conditional GET (304 keeps the entry).
+    evict() drops least recently used entries once the cache exceeds `max_mb`.
+    """
+
+    def __init__(self, directory=FETCH_CACHE_DIR, max_mb=FETCH_CACHE_MAX_MB,
+                 ttl_hours=FETCH_CACHE_TTL_HOURS, settle_days=FETCH_CACHE_SETTLE_DAYS):
+        self.directory = directory
+        self.max_bytes = max_mb * 2**20
+        self.ttl = ttl_hours * 3600
+        self.settle = timedelta(days=settle_days)
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "downloaded": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, url, params):
+        raw = json.dumps([url, sorted((k, str(v)) for k, v in params.items())])
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".pkl.gz", base + ".json"
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def settled(self, endtime, now=None):
+        # a window is final once its end is older than the settle period
+        end = datetime.fromisoformat(str(endtime))
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        return end < (now or datetime.now(timezone.utc)) - self.settle
+
+    def lookup(self, url, params):
+        """
+        The cached entry's metadata with "fresh" set (usable without a request),
+        or None on a miss.
+        """
+        key = self.key(url, params)
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(data_path):
+            return None
+        meta["key"] = key
+        meta["fresh"] = self.settled(params["endtime"]) or time.time() - meta["fetched_at"] < self.ttl
+        return meta
+
+    def conditional_headers(self, meta):
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def load(self, meta, revalidated=False):
+        # FeatureColumns for a lookup() hit; None (and the entry dropped) if the data file is unreadable
+        data_path, meta_path = self._paths(meta["key"])
+        try:
+            with gzip.open(data_path, "rb") as fh:
+                cols = pickle.load(fh)
+        except Exception:
+            # truncated or corrupt, or pickled by a version of the code whose classes have since changed
+            # (AttributeError, ImportError, TypeError, ...): a miss, so the window is downloaded again
+            self._remove(meta["key"])
+            return None
+        if revalidated:
+            # 304: same content, restart the TTL
+            meta = {k: v for k, v in meta.items() if k not in ("key", "fresh")}
+            meta["fetched_at"] = time.time()
+            self._write(meta_path, lambda fh: fh.write(json.dumps(meta).encode()))
+        # access time drives LRU eviction
+        os.utime(data_path)
+        self._count("revalidated" if revalidated else "hits")
+        return cols
+
+    def store(self, url, params, cols, headers=None):
+        headers = headers or {}
+        key = self.key(url, params)
+        data_path, meta_path = self._paths(key)
+        meta = {
+            "url": url,
+            "params": {k: str(v) for k, v in params.items()},
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "rows": len(cols),
+        }
+        # data first: a sidecar only ever points at a complete data file
+        self._write(data_path, lambda fh: self._dump(fh, cols))
+        self._write(meta_path, lambda fh: fh.write(json.dumps(meta).encode()))
+        self._count("downloaded")
+
+    @staticmethod
+    def _dump(fh, cols):
+        with gzip.GzipFile(fileobj=fh, mode="wb", compresslevel=3) as gz:
+            pickle.dump(cols, gz, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _write(self, path, writer):
+        # temp file + rename, so readers never see a partial file
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            writer(fh)
+        os.replace(tmp, path)
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits in max_mb.
+        Returns the number of entries removed.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl.gz"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, name[:-len(".pkl.gz")]))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            removed += 1
+        return removed
+
+    def summary(self):
+        return dict(self.stats)
@@ -0,0 +1,225 @@
+# geocode.py
+# Offline reverse geocoder, lat/lon -> country and continent, from the bundled
+# Natural Earth 1:110m boundaries (geodata/countries_110m.geojson, public domain).
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from config import COUNTRY_BOUNDARIES, GEOCODE_CELL_DEG, GEOCODE_OFFSHORE_KM
+import proximity
+
+OCEAN = "ocean"        # farther than GEOCODE_OFFSHORE_KM from any country
+UNKNOWN = "unknown"    # missing coordinates
+BAND_DEG = 1.0         # latitude band height of the polygon edge index
+VERTEX_STEP_DEG = 0.5  # coastline densification for the offshore lookup
+
+_GEOCODER = None
+
+
+class Geocoder:
+    """
+    Point-in-polygon lookups over country boundaries.
+
+    Polygon edges are bucketed into 1 degree latitude bands, so a point is only
+    ray-cast against the edges that cross its band. Results are memoized per
+    `cell_deg` grid cell (the cell centre is what gets geocoded), so a catalogue
+    of millions of events only resolves its distinct cells, once per process.
+    Points at sea take the nearest country within `offshore_km`, found through
+    proximity's sphere cells over the densified coastlines.
+    """
+
+    def __init__(self, path=COUNTRY_BOUNDARIES, cell_deg=GEOCODE_CELL_DEG, offshore_km=GEOCODE_OFFSHORE_KM):
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        with open(path) as fh:
+            features = json.load(fh)["features"]
+
+        self.cell_deg = cell_deg
+        self.offshore_km = offshore_km
+        self.rows = int(np.ceil(180 / cell_deg))
+        self.cols = int(np.ceil(360 / cell_deg))
+
+        # codes: 0..n-1 countries, then ocean, then unknown
+        countries = [f["properties"]["name"] for f in features]
+        continents = [f["properties"]["continent"] for f in features]
+        self.ocean = len(countries)
+        self.unknown = len(countries) + 1
+        self.countries = np.array(countries + [OCEAN, UNKNOWN], dtype=object)
+        self.continents = np.array(continents + [OCEAN, UNKNOWN], dtype=object)
+
+        edges, vertices = [], []
+        for code, feature in enumerate(features):
+            geometry = feature["geometry"]
+            polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+            for ring in (ring for polygon in polygons for ring in polygon):
+                ring = np.asarray(ring, dtype="float64")
+                x0, y0, x1, y1 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+                edges.append(np.column_stack((x0, y0, x1, y1, np.full(len(x0), code))))
+                vertices.append(self._densify(x0, y0, x1, y1, code))
+        self._index_edges(np.concatenate(edges))
+        self._index_vertices(np.concatenate(vertices))
+
+        # memo: sorted cell ids -> codes
+        self.memo_cells = np.empty(0, dtype=np.int64)
+        self.memo_codes = np.empty(0, dtype=np.int16)
+
+    @staticmethod
+    def _densify(x0, y0, x1, y1, code):
+        # points every VERTEX_STEP_DEG along each edge, so coast distance ~ nearest vertex
+        steps = np.maximum(np.ceil(np.hypot(x1 - x0, y1 - y0) / VERTEX_STEP_DEG), 1).astype(np.int64)
+        edge = np.repeat(np.arange(len(x0)), steps)
+        frac = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[edge]
+        lon = x0[edge] + frac * (x1 - x0)[edge]
+        lat = y0[edge] + frac * (y1 - y0)[edge]
+        return np.column_stack((lat, lon, np.full(len(lat), code)))
+
+    def _index_edges(self, edges):
+        # horizontal edges never cross a ray along the latitude line
+        edges = edges[edges[:, 1] != edges[:, 3]]
+        edges = edges[np.argsort(edges[:, 4], kind="stable")]
+        self.edges = edges
+        low = np.minimum(edges[:, 1], edges[:, 3])
+        high = np.maximum(edges[:, 1], edges[:, 3])
+        bands = int(180 / BAND_DEG)
+        self.band_edges = []
+        for band in range(bands):
+            lo, hi = -90 + band * BAND_DEG, -90 + (band + 1) * BAND_DEG
+            self.band_edges.append(np.flatnonzero((low <= hi) & (high >= lo)))
+
+    def _index_vertices(self, vertices):
+        keys = proximity.pack_cells(proximity.sphere_cells(vertices[:, 0], vertices[:, 1], self.offshore_km))
+        order = np.argsort(keys, kind="stable")
+        self.vertex_keys = keys[order]
+        self.vertices = vertices[order]
+
+    def _contains(self, lat, lon, chunk=4096):
+        # even-odd ray casting (eastwards), counted per country so holes and islands work
+        out = np.full(len(lat), -1, dtype=np.int64)
+        band = np.clip(((lat + 90) // BAND_DEG).astype(np.int64), 0, len(self.band_edges) - 1)
+        for b in np.unique(band):
+            idx = self.band_edges[b]
+            if not len(idx):
+                continue
+            x0, y0, x1, y1, code = (self.edges[idx, k] for k in range(5))
+            starts = np.flatnonzero(np.r_[True, code[1:] != code[:-1]])
+            members = np.flatnonzero(band == b)
+            for start in range(0, len(members), chunk):
+                pts = members[start:start + chunk]
+                py, px = lat[pts, None], lon[pts, None]
+                spans = (y0 > py) != (y1 > py)
+                xcross = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+                odd = np.add.reduceat(spans & (px < xcross), starts, axis=1, dtype=np.int32) % 2 == 1
+                inside = odd.any(axis=1)
+                out[pts[inside]] = code[starts][odd[inside].argmax(axis=1)]
+        return out
+
+    def _nearest(self, lat, lon):
+        # nearest coastline vertex within offshore_km, else ocean
+        out = np.full(len(lat), self.ocean, dtype=np.int64)
+        best = np.full(len(lat), np.inf)
+        # many grid cells share a sphere cell, so probe each distinct sphere cell once
+        cells = proximity.sphere_cells(lat, lon, self.offshore_km)
+        _, first, inverse = np.unique(proximity.pack_cells(cells), return_index=True, return_inverse=True)
+        cells, inverse = cells[first], inverse.ravel()
+        for offset in proximity.CELL_OFFSETS:
+            target = proximity.pack_cells(cells + offset)
+            lo = np.searchsorted(self.vertex_keys, target, side="left")[inverse]
+            counts = np.searchsorted(self.vertex_keys, target, side="right")[inverse] - lo
+            if not counts.sum():
+                continue
+            i = np.repeat(np.arange(len(lat)), counts)
+            v = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            dist = proximity.haversine_km(lat[i], lon[i], self.vertices[v, 0], self.vertices[v, 1])
+            # i is grouped already: closest candidate per point in this neighbour cell
+            starts = np.flatnonzero(np.r_[True, i[1:] != i[:-1]])
+            closest = np.minimum.reduceat(dist, starts)
+            at = np.flatnonzero(dist == np.repeat(closest, np.diff(np.r_[starts, len(i)])))
+            at = at[np.r_[True, i[at][1:] != i[at][:-1]]]
+            pts = i[at]
+            closer = (closest < best[pts]) & (closest <= self.offshore_km)
+            best[pts[closer]] = closest[closer]
+            out[pts[closer]] = self.vertices[v[at][closer], 2].astype(np.int64)
+        return out
+
+    def _resolve(self, cells):
+        # geocode the centres of grid cells not seen yet
+        lat = (cells // self.cols + 0.5) * self.cell_deg - 90
+        lon = (cells % self.cols + 0.5) * self.cell_deg - 180
+        codes = self._contains(lat, lon)
+        sea = codes < 0
+        if sea.any():
+            codes[sea] = self._nearest(lat[sea], lon[sea])
+        return codes.astype(np.int16)
+
+    def cells(self, lat, lon):
+        # grid cell id of every point, -1 where a coordinate is missing
+        lat = pd.to_numeric(pd.Series(lat), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        lon = pd.to_numeric(pd.Series(lon), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        out = np.full(len(lat), -1, dtype=np.int64)
+        valid = np.isfinite(lat) & np.isfinite(lon)
+        row = np.clip(((lat[valid] + 90) // self.cell_deg).astype(np.int64), 0, self.rows - 1)
+        col = (((lon[valid] + 180) // self.cell_deg).astype(np.int64)) % self.cols
+        out[valid] = row * self.cols + col
+        return out
+
+    def unresolved(self, cells):
+        # the distinct cells (ids from cells()) that aren't in the memo yet
+        uniq = np.unique(cells[cells >= 0])
+        pos = np.minimum(np.searchsorted(self.memo_cells, uniq), max(len(self.memo_cells) - 1, 0))
+        known = (self.memo_cells[pos] == uniq) if len(self.memo_cells) else np.zeros(len(uniq), bool)
+        return uniq[~known]
+
+    def resolve(self, cells):
+        # codes for distinct, unresolved cells; doesn't touch the memo (see remember)
+        return self._resolve(np.asarray(cells, dtype=np.int64))
+
+    def remember(self, cells, codes):
+        # add resolved cells to the memo, e.g. ones resolved by another process
+        new = ~np.isin(cells, self.memo_cells)
+        cells, codes = np.asarray(cells)[new], np.asarray(codes)[new]
+        cells = np.concatenate((self.memo_cells, cells))
+        codes = np.concatenate((self.memo_codes, np.asarray(codes, dtype=np.int16)))
+        order = np.argsort(cells, kind="stable")
+        self.memo_cells, self.memo_codes = cells[order], codes[order]
+
+    def codes(self, lat, lon):
+        cells = self.cells(lat, lon)
+        out = np.full(len(cells), self.unknown, dtype=np.int16)
+        valid = cells >= 0
+        if not valid.any():
+            return out
+
+        new = self.unresolved(cells)
+        if len(new):
+            self.remember(new, self._resolve(new))
+        uniq, inverse = np.unique(cells[valid], return_inverse=True)
+        found = self.memo_codes[np.searchsorted(self.memo_cells, uniq)]
+        out[valid] = found[inverse.ravel()]
+        return out
+
+
+def get_geocoder():
+    # one boundary index (and cell memo) per process
+    global _GEOCODER
+    if _GEOCODER is None:
+        _GEOCODER = Geocoder()
+    return _GEOCODER
+
+
+def reverse_geocode(lat, lon):
+    """
+    (country, continent) categoricals for every point. Missing coordinates give
+    "unknown"; points more than GEOCODE_OFFSHORE_KM from any country give "ocean".
+    """
+    geocoder = get_geocoder()
+    codes = geocoder.codes(lat, lon)
+    country = pd.Categorical.from_codes(codes, categories=geocoder.countries)
+    continent = pd.Categorical(geocoder.continents[codes], categories=pd.unique(geocoder.continents))
+    return country, continent
+
+
+def country_continent():
+    # the lookup table behind the SQL continent queries (Q4, Q12, Q17)
+    geocoder = get_geocoder()
+    return pd.DataFrame({"country": geocoder.countries, "continent": geocoder.continents})
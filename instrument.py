@@ -0,0 +1,229 @@
+# instrument.py
+# Per-stage wall/CPU time, memory and HTTP metrics for run_all, written out as a JSON run report.
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+from config import REPORT_DIR, PROFILE_STAGES, TRACE_STAGES
+
+try:
+    import psutil
+except ImportError:  # optional; without it RSS is read from /proc (Linux only)
+    psutil = None
+
+# upper bounds (seconds) of the per-request latency histogram
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+RSS_SAMPLE_S = 0.05
+
+# the report HTTP metrics go to; set while a RunReport is open
+_ACTIVE = None
+
+
+def _mb(value):
+    return None if value is None else round(value / 2**20, 1)
+
+
+def current_rss():
+    # bytes, or None when it can't be read
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def max_rss():
+    # process high-water mark in bytes (ru_maxrss is KB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler(threading.Thread):
+    # polls RSS in the background so each stage gets its own peak, not the process-wide one
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss() or 0
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(RSS_SAMPLE_S):
+            self.peak = max(self.peak, current_rss() or 0)
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        self.peak = max(self.peak, current_rss() or 0)
+        return self.peak
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies)
+    edges = LATENCY_BUCKETS + [np.inf]
+    counts = np.histogram(values, bins=[0.0] + edges)[0]
+    labels = [f"<={b:g}s" for b in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]:g}s"]
+    return {
+        "count": len(values),
+        "p50_s": round(float(np.percentile(values, 50)), 3),
+        "p95_s": round(float(np.percentile(values, 95)), 3),
+        "max_s": round(float(values.max()), 3),
+        "histogram": dict(zip(labels, counts.tolist())),
+    }
+
+
+class RunReport:
+    """
+    Collects one record per pipeline stage:
+    wall_s, cpu_s, rss at start/end, peak rss (rss_sampled says whether it is
+    the stage's own), rows_in/rows_out, plus whatever the stage adds. HTTP requests made while a stage is open are attached to it
+    (count, status codes, bytes downloaded, latency histogram, parse time).
+
+    Stages named in `profile` run under cProfile (calling thread only: the fetch
+    worker threads are not profiled) and stages in `trace` under tracemalloc.
+    Use as a context manager so fetch_api can find it; save() writes the JSON.
+    """
+
+    def __init__(self, name="run_all", profile=PROFILE_STAGES, trace=TRACE_STAGES, report_dir=REPORT_DIR):
+        self.name = name
+        self.profile = set(profile or ())
+        self.trace = set(trace or ())
+        self.report_dir = report_dir
+        self.started = datetime.now(timezone.utc)
+        self.run_id = self.started.strftime("%Y%m%dT%H%M%SZ")
+        self.stages = []
+        self.lock = threading.Lock()
+        self._http = None
+        self._t0 = time.perf_counter()
+
+    def __enter__(self):
+        global _ACTIVE
+        _ACTIVE = self
+        return self
+
+    def __exit__(self, *exc):
+        global _ACTIVE
+        _ACTIVE = None
+        return False
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None}
+        http = {"requests": 0, "failed": 0, "status": {}, "bytes": 0, "body_parse_s": 0.0, "latency": []}
+        self._http = http
+        # without psutil or /proc there is nothing to sample
+        sampler = RssSampler() if current_rss() is not None else None
+        if sampler is not None:
+            sampler.start()
+        profiler = cProfile.Profile() if name in self.profile else None
+        tracing = name in self.trace and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        rss_start = current_rss()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["wall_s"] = round(time.perf_counter() - wall, 3)
+            record["cpu_s"] = round(time.process_time() - cpu, 3)
+            record["rss_start_mb"] = _mb(rss_start)
+            record["rss_end_mb"] = _mb(current_rss())
+            # sampled stage peak, otherwise the process high-water mark so far (not this stage's own)
+            record["peak_rss_mb"] = _mb(sampler.stop() if sampler is not None else max_rss())
+            record["rss_sampled"] = sampler is not None
+            if tracing:
+                record["tracemalloc"] = self._trace_summary()
+            if profiler is not None:
+                record["profile"] = self._profile_summary(name, profiler)
+            self._http = None
+            if http["requests"]:
+                latency = http.pop("latency")
+                http["body_parse_s"] = round(http["body_parse_s"], 3)
+                http["latency"] = latency_summary(latency)
+                record["http"] = http
+            with self.lock:
+                self.stages.append(record)
+
+    def record_request(self, status, seconds):
+        http = self._http
+        if http is None:
+            return
+        with self.lock:
+            http["requests"] += 1
+            http["status"][str(status)] = http["status"].get(str(status), 0) + 1
+            if status not in (200, 304):
+                http["failed"] += 1
+            http["latency"].append(seconds)
+
+    def record_body(self, nbytes, parse_s=0.0):
+        http = self._http
+        if http is None:
+            return
+        with self.lock:
+            http["bytes"] += int(nbytes or 0)
+            http["body_parse_s"] += parse_s
+
+    def _trace_summary(self, top=10):
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().statistics("lineno")[:top]
+        tracemalloc.stop()
+        return {
+            "current_mb": _mb(current),
+            "peak_mb": _mb(peak),
+            "top": [{"where": str(stat.traceback[0]), "size_mb": _mb(stat.size), "count": stat.count}
+                    for stat in stats],
+        }
+
+    def _profile_summary(self, name, profiler, top=15):
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(self.report_dir, f"{self.run_id}-{name}.prof")
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        return {"file": path, "top_cumulative": out.getvalue().strip().splitlines()}
+
+    def to_dict(self):
+        return {
+            "run": self.name,
+            "run_id": self.run_id,
+            "started": self.started.isoformat(),
+            "wall_s": round(time.perf_counter() - self._t0, 3),
+            "max_rss_mb": _mb(max_rss()),
+            "cpu_count": os.cpu_count(),
+            "stages": self.stages,
+        }
+
+    def save(self):
+        # ../data/reports/<run_id>.json; returns the path
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(self.report_dir, f"{self.run_id}.json")
+        with open(path, "w") as fh:
+            json.dump(self.to_dict(), fh, indent=2, default=str)
+        return path
+
+
+def record_request(status, seconds):
+    # called by fetch_api for every HTTP attempt; no-op outside a run
+    if _ACTIVE is not None:
+        _ACTIVE.record_request(status, seconds)
+
+
+def record_body(nbytes, parse_s=0.0):
+    if _ACTIVE is not None:
+        _ACTIVE.record_body(nbytes, parse_s)
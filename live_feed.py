@@ -0,0 +1,279 @@
+# live_feed.py
+# Near-real-time ingest: polls a USGS summary feed and keeps a bounded window of recent events.
+# Run: python live_feed.py [--url .../summary/4.5_hour.geojson] [--interval 60] [--polls 10]
+import argparse
+import heapq
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+from config import (
+    LIVE_FEED_URL, LIVE_POLL_SECONDS, LIVE_WINDOW_HOURS, LIVE_MAX_EVENTS,
+    LIVE_BATCH_ROWS, LIVE_FLUSH_SECONDS, LIVE_DIR
+)
+import clean_data
+import fetch_api
+import instrument
+import storage
+
+WINDOW_TABLE = "live_window"
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+class EventWindow:
+    """
+    The recent events, deduplicated by `id` and bounded two ways:
+    events older than `hours` (by event time) are evicted, and beyond
+    `max_events` the oldest rows are dropped from the window.
+
+    `updated` remembers the newest version of every id inside the horizon
+    (even after a row was dropped for the cap), so a feed that still lists an
+    event never gets it appended twice. Both maps are evicted through min-heaps
+    keyed on event time, so each poll only pays for the rows that changed.
+    """
+
+    def __init__(self, hours=LIVE_WINDOW_HOURS, max_events=LIVE_MAX_EVENTS):
+        self.horizon_ms = int(hours * 3600 * 1000)
+        self.max_events = max_events
+        self.updated = {}    # id -> (updated ms, time ms), everything inside the horizon
+        self.rows = {}       # id -> cleaned row, at most max_events
+        self.seen_heap = []  # (time ms, id), for the horizon
+        self.row_heap = []   # (time ms, id), for the cap
+
+    def __len__(self):
+        return len(self.rows)
+
+    def changes(self, frame, now_ms=None):
+        """
+        Split raw feed rows into (new, revised): rows whose id hasn't been seen,
+        and rows with a newer `updated` than the version already seen. Rows
+        older than the horizon and unchanged rows are dropped.
+        """
+        cutoff = (now_ms or _now_ms()) - self.horizon_ms
+        frame = frame[pd.to_numeric(frame["time"], errors="coerce") >= cutoff]
+        known = frame["id"].map(lambda i: self.updated.get(i, (None,))[0])
+        new = known.isna()
+        revised = ~new & (pd.to_numeric(frame["updated"], errors="coerce") > known.astype("float64"))
+        return frame[new], frame[revised]
+
+    def add(self, raw, cleaned, now_ms=None):
+        # raw (epoch ms) and cleaned rows of the same events, in the same order
+        for event_id, updated, event_time, row in zip(raw["id"], raw["updated"], raw["time"],
+                                                      cleaned.to_dict("records")):
+            event_time = int(event_time)
+            previous = self.updated.get(event_id)
+            self.updated[event_id] = (int(updated), event_time)
+            self.rows[event_id] = row
+            if previous is None or previous[1] != event_time:
+                heapq.heappush(self.seen_heap, (event_time, event_id))
+                heapq.heappush(self.row_heap, (event_time, event_id))
+        self.evict(now_ms)
+
+    def evict(self, now_ms=None):
+        cutoff = (now_ms or _now_ms()) - self.horizon_ms
+        # heap entries go stale when a revision moves an event's time; skip those
+        while self.seen_heap and self.seen_heap[0][0] < cutoff:
+            event_time, event_id = heapq.heappop(self.seen_heap)
+            if self.updated.get(event_id, (None, None))[1] == event_time:
+                del self.updated[event_id]
+                self.rows.pop(event_id, None)
+        while len(self.rows) > self.max_events:
+            event_time, event_id = heapq.heappop(self.row_heap)
+            if event_id in self.rows and self.updated[event_id][1] == event_time:
+                del self.rows[event_id]
+        # drop stale heap entries once they outnumber the live ones
+        if len(self.seen_heap) > 2 * len(self.updated) + 1024:
+            self.seen_heap = [(t, i) for i, (_, t) in self.updated.items()]
+            heapq.heapify(self.seen_heap)
+        if len(self.row_heap) > 2 * len(self.rows) + 1024:
+            self.row_heap = [(self.updated[i][1], i) for i in self.rows]
+            heapq.heapify(self.row_heap)
+
+    def seed(self, raw):
+        # ids already in storage (e.g. after a restart) count as seen, so they aren't appended again
+        for event_id, updated, event_time in zip(raw["id"], raw["updated"], raw["time"]):
+            if event_id not in self.updated:
+                self.updated[event_id] = (int(updated), int(event_time))
+                heapq.heappush(self.seen_heap, (int(event_time), event_id))
+        self.evict()
+
+    def to_frame(self):
+        frame = pd.DataFrame(list(self.rows.values()))
+        return frame.sort_values("time", ascending=False).reset_index(drop=True) if len(frame) else frame
+
+
+class LiveFeed:
+    """
+    Polls one summary feed with conditional GET (ETag / Last-Modified), so an
+    unchanged feed costs a 304 and nothing else. New and revised events update
+    the EventWindow and its snapshot in LIVE_DIR (what the dashboard shows);
+    new events are also queued and appended to the raw and cleaned datasets in
+    micro-batches of LIVE_BATCH_ROWS, or after LIVE_FLUSH_SECONDS. A revision
+    that arrives while its event is still queued replaces the queued version.
+
+    Revisions of events that are already stored are not rewritten here: the
+    next run_all(incremental=True) merges them by id/updated.
+    """
+
+    def __init__(self, url=LIVE_FEED_URL, window=None, batch_rows=LIVE_BATCH_ROWS,
+                 flush_seconds=LIVE_FLUSH_SECONDS, snapshot_dir=LIVE_DIR):
+        self.url = url
+        self.window = window if window is not None else EventWindow()
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.snapshot_dir = snapshot_dir
+        self.session = fetch_api.make_session(1)
+        self.etag = self.last_modified = None
+        self.pending_raw, self.pending_clean = [], []
+        self.pending_ids = set()
+        self.pending_since = None
+        self.stats = {"polls": 0, "not_modified": 0, "failed": 0, "new": 0, "revised": 0, "stored": 0}
+        # fill values and integer dtypes for the micro-batches: the stored data's, not a handful of rows'
+        self.medians, self.dtypes = clean_data.raw_stats() if storage.raw_exists() else (None, {})
+        if storage.raw_exists():
+            self.window.seed(self._recent_raw())
+
+    def _recent_raw(self):
+        # only the partitions that can hold events inside the horizon
+        start = pd.Timestamp(_now_ms() - self.window.horizon_ms, unit="ms")
+        filters = [("year", ">=", start.year)] if storage.STORAGE_FORMAT != "csv" else None
+        raw = storage.load_raw(columns=["id", "time", "updated"], filters=filters)
+        return raw[pd.to_numeric(raw["time"], errors="coerce") >= start.value // 10**6]
+
+    def _conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def poll(self):
+        """
+        One conditional GET of the feed. Returns the number of new or revised events.
+        """
+        self.stats["polls"] += 1
+        resp = fetch_api.get_with_retry(self.session, self.url, None, "live feed", stream=True,
+                                        headers=self._conditional_headers() or None)
+        if resp is None:
+            self.stats["failed"] += 1
+            return 0
+        if resp.status_code == 304:
+            resp.close()
+            self.stats["not_modified"] += 1
+            self.window.evict()
+            return 0
+
+        started = time.perf_counter()
+        try:
+            resp.raw.decode_content = True
+            frame = fetch_api.parse_stream(resp.raw).to_frame()
+        finally:
+            instrument.record_body(resp.raw.tell(), time.perf_counter() - started)
+            resp.close()
+        self.etag = resp.headers.get("ETag")
+        self.last_modified = resp.headers.get("Last-Modified")
+
+        new, revised = self.window.changes(frame)
+        changed = pd.concat([new, revised], ignore_index=True)
+        if changed.empty:
+            self.window.evict()
+            return 0
+        cleaned = clean_data.clean_frame(changed.copy(), medians=self.medians)
+        self.window.add(changed, cleaned)
+        self.stats["new"] += len(new)
+        self.stats["revised"] += len(revised)
+
+        # new events are queued; a revision of one that is still queued replaces the queued version
+        queue = changed["id"].isin(self.pending_ids).to_numpy(copy=True)
+        queue[:len(new)] = True
+        if queue.any():
+            ids = set(changed["id"][queue])
+            self.pending_raw = [frame[~frame["id"].isin(ids)] for frame in self.pending_raw]
+            self.pending_clean = [frame[~frame["id"].isin(ids)] for frame in self.pending_clean]
+            self.pending_raw.append(changed[queue])
+            self.pending_clean.append(cleaned[queue])
+            self.pending_ids |= ids
+            self.pending_since = self.pending_since or time.monotonic()
+        self.save_snapshot()
+        return len(changed)
+
+    def pending(self):
+        return sum(len(frame) for frame in self.pending_raw)
+
+    def flush(self, force=False):
+        """
+        Append the queued new events to storage once the batch is full or old
+        enough (or `force`). Returns the number of rows written.
+        """
+        rows = self.pending()
+        if not rows:
+            return 0
+        due = rows >= self.batch_rows or time.monotonic() - self.pending_since >= self.flush_seconds
+        if not (force or due):
+            return 0
+        cleaned = pd.concat(self.pending_clean, ignore_index=True)
+        try:
+            # the batch picked its own integer widths; appended files must match the stored ones
+            cleaned = clean_data.cast_dtypes(cleaned, self.dtypes)
+        except ValueError as exc:
+            print(f"⚠️  Live batch doesn't fit the stored dtypes ({exc}); appended as is, rerun clean_data.py")
+        storage.save_raw(pd.concat(self.pending_raw, ignore_index=True), append=storage.raw_exists())
+        storage.save_clean(cleaned, append=storage.clean_exists())
+        self.pending_raw, self.pending_clean, self.pending_since = [], [], None
+        self.pending_ids = set()
+        self.stats["stored"] += rows
+        return rows
+
+    def save_snapshot(self):
+        storage.save_table(self.window.to_frame(), self.snapshot_dir, WINDOW_TABLE)
+
+    def close(self):
+        self.flush(force=True)
+        self.session.close()
+
+
+def load_window(snapshot_dir=LIVE_DIR):
+    # the latest window snapshot written by run_live(), or None
+    return storage.load_table(snapshot_dir, WINDOW_TABLE)
+
+
+def run_live(url=LIVE_FEED_URL, interval=LIVE_POLL_SECONDS, polls=None):
+    """
+    Poll `url` every `interval` seconds until interrupted (or for `polls` polls),
+    flushing micro-batches as they fill. Pending events are flushed on exit.
+    """
+    feed = LiveFeed(url)
+    print(f"\n📡 Live ingest from {url} every {interval}s "
+          f"(window {LIVE_WINDOW_HOURS}h / {LIVE_MAX_EVENTS} events)\n")
+    try:
+        while polls is None or feed.stats["polls"] < polls:
+            started = time.monotonic()
+            changed = feed.poll()
+            written = feed.flush()
+            stamp = datetime.now(timezone.utc).strftime("%H:%M:%S")
+            if changed or written:
+                print(f"{stamp} 🆕 {changed} new/revised, window {len(feed.window)}, "
+                      f"pending {feed.pending()}, stored {written}")
+            else:
+                print(f"{stamp} no change (window {len(feed.window)})")
+            if polls is None or feed.stats["polls"] < polls:
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        feed.close()
+    print(f"📡 Live ingest stats: {feed.stats}")
+    return feed.stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live USGS feed ingest")
+    parser.add_argument("--url", default=LIVE_FEED_URL)
+    parser.add_argument("--interval", type=float, default=LIVE_POLL_SECONDS)
+    parser.add_argument("--polls", type=int, default=None, help="stop after this many polls")
+    args = parser.parse_args()
+    run_live(args.url, args.interval, args.polls)
@@ -1,26 +1,79 @@
 
-from fetch_api import fetch_simple
+from fetch_api import fetch_simple, fetch_incremental
 from clean_data import basic_clean
 from save_mysql import save_dataframe
-from config import CLEAN_CSV
-import pandas as pd
-
-def run_all(save_to_db=False):
-    print("1) Fetching raw data from USGS...")
-    df_raw = fetch_simple()
-    print("Raw data shape:", df_raw.shape)
-
-    print("2) Cleaning data (basic)...")
-    df_clean = basic_clean(df_raw)
-    print("Cleaned data shape:", df_clean.shape)
-    print("Saved cleaned CSV to", CLEAN_CSV)
-
-    if save_to_db:
-        print("3) Saving to MySQL...")
-        # read cleaned to ensure consistent dtypes
-        df_to_save = pd.read_csv(CLEAN_CSV)
-        save_dataframe(df_to_save)
-        print("Saved to MySQL")
+from aggregates import refresh_cubes
+from tiles import refresh_tiles
+from decluster import refresh_clusters
+import storage
+from instrument import RunReport
+from config import CLEAN_DATASET, CLEAN_CSV, STORAGE_FORMAT, PROFILE_STAGES, TRACE_STAGES, CLEAN_WORKERS
+
+def run_all(save_to_db=False, incremental=False, profile=PROFILE_STAGES, trace=TRACE_STAGES):
+    """
+    Fetch -> clean -> cubes -> tiles -> decluster -> (MySQL), recording each stage in a JSON run report
+    under REPORT_DIR. `profile` / `trace` name the stages to run under cProfile / tracemalloc.
+    Returns the report path.
+    """
+    with RunReport(profile=profile, trace=trace) as report:
+        print("1) Fetching raw data from USGS...")
+        with report.stage("fetch") as stage:
+            # incremental: only pull events updated since the last checkpoint and merge by id
+            df_raw = fetch_incremental() if incremental else fetch_simple()
+            stage["rows_out"] = len(df_raw)
+            stage["incremental"] = incremental
+        print("Raw data shape:", df_raw.shape)
+
+        # keep the previous cleaned load so the rollups can be updated with just the changed rows
+        previous = None
+        if incremental and storage.clean_exists():
+            with report.stage("load_previous") as stage:
+                previous = storage.load_clean()
+                stage["rows_out"] = len(previous)
+
+        print("2) Cleaning data (basic)...")
+        with report.stage("clean", rows_in=len(df_raw)) as stage:
+            if CLEAN_WORKERS != 1 and STORAGE_FORMAT != "csv":
+                # the fetch saved the raw dataset: clean its partitions in a process pool, then load the result
+                basic_clean(workers=CLEAN_WORKERS)
+                df_clean = storage.load_clean()
+            else:
+                df_clean = basic_clean(df_raw)
+            stage["rows_out"] = len(df_clean)
+        print("Cleaned data shape:", df_clean.shape)
+        print("Saved cleaned data to", CLEAN_CSV if STORAGE_FORMAT == "csv" else CLEAN_DATASET)
+
+        with report.stage("cubes", rows_in=len(df_clean)) as stage:
+            cube, _ = refresh_cubes(df_clean, previous=previous)
+            stage["rows_out"] = len(cube)
+        print("Aggregate cube rows:", len(cube))
+
+        with report.stage("tiles", rows_in=len(df_clean)) as stage:
+            pyramid = refresh_tiles(df_clean, previous=previous)
+            stage["rows_out"] = sum(len(level) for level in pyramid.values())
+        print("Map tile rows (all zoom levels):", stage["rows_out"])
+
+        with report.stage("decluster", rows_in=len(df_clean)) as stage:
+            # labels the whole catalogue every run: a new event can claim events an older one held
+            labels = refresh_clusters(df_clean)
+            stage["rows_out"] = len(labels)
+            stage["aftershocks"] = int(len(labels) - labels["mainshock"].sum())
+        print("Aftershocks labelled:", stage["aftershocks"])
+
+        if save_to_db:
+            print("3) Saving to MySQL...")
+            with report.stage("save", rows_in=len(df_clean)) as stage:
+                # the cleaned frame already has its final dtypes, no need to re-read it from disk
+                written = save_dataframe(df_clean)
+                stage["rows_out"] = written
+            print(f"Saved to MySQL ({written} new/changed rows)")
+
+    path = report.save()
+    for record in report.stages:
+        print(f"⏱️ {record['stage']:13s} {record['wall_s']:8.2f}s wall {record['cpu_s']:8.2f}s cpu "
+              f"peak {record['peak_rss_mb']} MB")
+    print("📊 Run report:", path)
+    return path
 
 if __name__ == "__main__":
     # Change to True if you want to push to MySQL
@@ -0,0 +1,141 @@
+# proximity.py
+# Space-time neighbour search over the full catalogue (Q29 pairs, aftershock clustering).
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0
+CELL_OFFSETS = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)])
+CELL_BITS = 20  # per axis, enough for cells down to ~10 m
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # vectorized haversine (inputs in degrees)
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def pack_cells(cells):
+    # (n, 3) signed cell coordinates -> one int64 key
+    shifted = cells.astype(np.int64) + (1 << (CELL_BITS - 1))
+    return (shifted[:, 0] << (2 * CELL_BITS)) | (shifted[:, 1] << CELL_BITS) | shifted[:, 2]
+
+
+def sphere_cells(lat, lon, cell_km):
+    """
+    Cubic cells on the sphere's 3D embedding with edge = the chord for `cell_km`,
+    so anything within `cell_km` is in the same or one of the 27 neighbouring cells.
+    """
+    phi, lam = np.radians(lat), np.radians(lon)
+    xyz = EARTH_RADIUS_KM * np.column_stack((np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)))
+    chord = 2 * EARTH_RADIUS_KM * np.sin(min(cell_km, np.pi * EARTH_RADIUS_KM) / (2 * EARTH_RADIUS_KM))
+    # keep cell coordinates inside CELL_BITS even for tiny radii
+    return np.floor(xyz / max(chord, EARTH_RADIUS_KM / (1 << (CELL_BITS - 2)))).astype(np.int64)
+
+
+def neighbour_pairs(lat, lon, time_s, max_km, max_seconds, chunk=500_000, sources=None):
+    """
+    All pairs (i, j) with great-circle distance <= max_km and 0 <= t_j - t_i <= max_seconds.
+
+    Events are hashed into cubic cells on the sphere's 3D embedding (cell edge =
+    the chord for max_km), then sorted by (cell, time). For each event the 27
+    neighbouring cells are probed with binary searches over that sorted key, so
+    the cost is O(n log n) plus the number of candidates inside the space-time box.
+    `time_s` is float seconds. Returns (i, j, distance_km, seconds) arrays with i
+    the earlier event (ties broken by position).
+
+    With `sources` (row positions), only those rows are probed as i, and a
+    simultaneous j pairs with them whatever its position.
+    """
+    lat = np.asarray(lat, dtype="float64")
+    lon = np.asarray(lon, dtype="float64")
+    time_s = np.asarray(time_s, dtype="float64")
+    n = len(lat)
+    empty = (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0), np.empty(0))
+    if n < 2:
+        return empty
+
+    cells = sphere_cells(lat, lon, max_km)
+    keys = pack_cells(cells)
+
+    # rank of each cell, then one sortable composite = rank * span + whole seconds
+    t0 = np.floor(time_s.min())
+    t_int = np.floor(time_s - t0).astype(np.int64)
+    window = int(np.ceil(max_seconds))
+    span = int(t_int.max()) + window + 3
+    uniq, rank = np.unique(keys, return_inverse=True)
+    composite = rank.astype(np.int64) * span + t_int
+    order = np.argsort(composite, kind="stable")
+    sorted_comp = composite[order]
+
+    # every row as a source: each pair once, the later position as j among simultaneous events
+    one_way = sources is None
+    sources = np.arange(n) if one_way else np.asarray(sources, dtype=np.int64)
+    out_i, out_j = [], []
+    for start in range(0, len(sources), chunk):
+        idx = sources[start:start + chunk]
+        for offset in CELL_OFFSETS:
+            target = pack_cells(cells[idx] + offset)
+            pos = np.searchsorted(uniq, target)
+            pos = np.minimum(pos, len(uniq) - 1)
+            present = uniq[pos] == target
+            if not present.any():
+                continue
+            src = idx[present]
+            base = pos[present].astype(np.int64) * span
+            lo = np.searchsorted(sorted_comp, base + t_int[src], side="left")
+            hi = np.searchsorted(sorted_comp, base + t_int[src] + window + 1, side="right")
+            counts = hi - lo
+            if not counts.sum():
+                continue
+            i = np.repeat(src, counts)
+            # positions lo..hi-1 for every source, flattened
+            steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(lo, counts) + steps]
+            dt = time_s[j] - time_s[i]
+            tie = (j > i) if one_way else (j != i)
+            keep = ((dt > 0) | ((dt == 0) & tie)) & (dt <= max_seconds)
+            out_i.append(i[keep])
+            out_j.append(j[keep])
+
+    if not out_i:
+        return empty
+    i = np.concatenate(out_i)
+    j = np.concatenate(out_j)
+    dist = haversine_km(lat[i], lon[i], lat[j], lon[j])
+    keep = dist <= max_km
+    i, j, dist = i[keep], j[keep], dist[keep]
+    return i, j, dist, time_s[j] - time_s[i]
+
+
+def find_pairs(df, max_km=50.0, max_minutes=60.0):
+    """
+    Every pair of events within `max_km` and `max_minutes` of each other, over the
+    whole frame. One row per pair: the earlier event is prev_* (the smaller id
+    when both happened at once).
+    """
+    cols = ["id", "time", "latitude", "longitude"]
+    data = df.dropna(subset=cols)
+    time_s = data["time"].astype("datetime64[ms]").astype("int64").to_numpy() / 1000.0
+    i, j, dist, seconds = neighbour_pairs(
+        # float64 distances even when the frame holds float32 coordinates (event_store)
+        data["latitude"].to_numpy(dtype="float64"), data["longitude"].to_numpy(dtype="float64"), time_s,
+        max_km=max_km, max_seconds=max_minutes * 60.0
+    )
+    ids = data["id"].to_numpy()
+    # simultaneous events: the smaller id is prev_*, as in the SQL's (b.time > a.time OR b.id > a.id)
+    swap = (seconds == 0) & (ids[i] > ids[j])
+    i, j = np.where(swap, j, i), np.where(swap, i, j)
+    out = pd.DataFrame({
+        "prev_id": ids[i],
+        "id": ids[j],
+        "prev_time": data["time"].to_numpy()[i],
+        "time": data["time"].to_numpy()[j],
+        "minutes_diff": seconds / 60.0,
+        "distance_km": dist,
+    })
+    if "place" in data.columns:
+        out["place"] = data["place"].to_numpy()[j]
+    return out.sort_values(["time", "prev_time"]).reset_index(drop=True)
@@ -0,0 +1,507 @@
+# queries.py
+# The analyst queries (Q1..Q32) as a registry: each declares the columns and parameters it needs and a
+# pure compute function giving the same columns and rows as its analysis_queries.sql statement. The dashboard
+# and the headless report both go through run(), which runs that SQL with DuckDB when it can, except for the
+# queries whose compute reads a precomputed structure (cubes, token sets, the grid index, the cluster labels).
+# Run: python queries.py [--only Q1,Q18] [--param nst_threshold=50] [--out ../data/reports/queries]
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+from config import CLEAN_CSV, CLEAN_DATASET, CUBE_DIR, CLUSTER_DIR, STORAGE_FORMAT, QUERY_CACHE_ENTRIES, QUERY_REPORT_DIR
+import aggregates
+import clean_data
+import decluster
+import event_store
+import proximity
+import query_engine
+import storage
+
+# what compute functions receive: the declared event columns, the rollups, the parsed token columns
+Inputs = namedtuple("Inputs", ["events", "cube", "time_cube", "tokens"])
+
+# what the cubes are built from when run_all hasn't stored them
+CUBE_COLUMNS = aggregates.DIMENSIONS + aggregates.SUM_MEASURES + ["place", "time"]
+EVENT_COLS = ["id", "time", "place", "country", "mag", "depth_km"]
+
+REGISTRY = {}
+
+
+class MissingColumns(Exception):
+    # the data lacks a column a query needs; the message is what the dashboard shows
+    pass
+
+
+class Param:
+    """
+    One query parameter: its default (which also fixes the type) and how the
+    dashboard asks for it (a sidebar number input with `label`, `min`, `max`, `step`).
+    """
+
+    def __init__(self, name, label, default, min=None, max=None, step=None):
+        self.name, self.label, self.default = name, label, default
+        self.min, self.max, self.step = min, max, step
+
+    def widget_args(self):
+        args = {"value": self.default, "min_value": self.min, "max_value": self.max, "step": self.step}
+        return {key: value for key, value in args.items() if value is not None}
+
+    def cast(self, value):
+        return type(self.default)(value)
+
+
+class Query:
+    """
+    A registered analysis. `columns` are the event columns compute() receives,
+    `requires` columns that must exist but aren't read (the cube already has
+    them), `tokens` the comma-delimited columns it gets as TokenSets,
+    `cubes` whether it reads the rollups, and `indexed` whether compute() uses
+    another prebuilt structure that makes it faster than the SQL scan.
+    """
+
+    def __init__(self, qid, title, compute, columns=(), requires=(), tokens=(), cubes=False,
+                 indexed=False, params=(), missing=None, note=None):
+        self.qid, self.title, self.compute = qid, title, compute
+        self.columns, self.requires, self.tokens = list(columns), list(requires), list(tokens)
+        self.cubes = cubes
+        # the compute path beats DuckDB for these, so run() only takes the SQL when asked to
+        self.prefer_compute = cubes or bool(self.tokens) or indexed
+        self.params = list(params)
+        self.missing = missing
+        self.note = note
+
+    def bind(self, params=None):
+        # declared parameters only, defaults filled in, as a hashable key
+        params = params or {}
+        return tuple((p.name, p.cast(params.get(p.name, p.default))) for p in self.params)
+
+
+def register(qid, title, **options):
+    # decorator: @register("Q1", "Top 10 ...", columns=[...]) over compute(inputs, **params)
+    def wrap(compute):
+        REGISTRY[qid] = Query(qid, title, compute, **options)
+        return compute
+    return wrap
+
+
+def dataset_version(fmt=STORAGE_FORMAT):
+    # changes whenever the cleaned data, the stored cubes or the cluster labels are rewritten or appended to
+    return storage.path_version(CLEAN_CSV if fmt == "csv" else CLEAN_DATASET, CUBE_DIR, CLUSTER_DIR)
+
+
+class Dataset:
+    """
+    One version of the cleaned data, loaded a column at a time as queries ask for
+    them and kept compact (event_store.compact_frame / TokenSets). Shared read-only
+    by every caller; a new version gets a new Dataset.
+    """
+
+    def __init__(self, version=None):
+        self.version = dataset_version() if version is None else version
+        self.lock = threading.Lock()
+        self.columns = {}
+        self.token_sets = {}
+        self.cube = self.time_cube = None
+        on_disk = set(storage.clean_columns())
+        # what load_clean_frame() can return: the stored columns plus those it derives
+        self.available = on_disk | {"country"} | {
+            col for col, sources in clean_data.DERIVED_FROM.items() if set(sources) <= on_disk
+        }
+        if not decluster.clusters_exist():
+            self.available -= set(decluster.CLUSTER_COLUMNS) - on_disk
+
+    def events(self, columns):
+        # a frame of the requested (available) columns, loading the ones not seen yet
+        columns = [col for col in dict.fromkeys(columns) if col in self.available]
+        with self.lock:
+            todo = [col for col in columns if col not in self.columns]
+            if todo:
+                frame = event_store.compact_frame(clean_data.load_clean_frame(todo))
+                self.columns.update(frame.items())
+        return pd.DataFrame({col: self.columns[col] for col in columns})
+
+    def tokens(self, col):
+        with self.lock:
+            if col not in self.token_sets:
+                values = clean_data.load_clean_frame([col])[col]
+                self.token_sets[col] = event_store.TokenSets(values)
+            return self.token_sets[col]
+
+    def cubes(self):
+        # precomputed rollups from the pipeline; built once from the cleaned data if missing
+        if self.cube is None:
+            cube, time_cube = aggregates.load_cubes()
+            if cube is None:
+                data = self.events(CUBE_COLUMNS)
+                cube, time_cube = aggregates.build_cube(data), aggregates.build_time_cube(data)
+            self.cube, self.time_cube = cube, time_cube
+        return self.cube, self.time_cube
+
+    def memory_usage(self):
+        frame = sum(int(values.memory_usage(deep=True, index=False)) for values in self.columns.values())
+        return frame + sum(tokens.nbytes() for tokens in self.token_sets.values())
+
+
+_LOCK = threading.Lock()
+_DATASET = None
+# (dataset version, qid, params, sql) -> result, least recently used first
+_RESULTS = OrderedDict()
+
+
+def get_dataset():
+    # the Dataset for the data on disk now; replaced (and stale results dropped) when it changes
+    global _DATASET
+    version = dataset_version()
+    with _LOCK:
+        if _DATASET is None or _DATASET.version != version:
+            _DATASET = Dataset(version)
+            for key in [key for key in _RESULTS if key[0] != version]:
+                del _RESULTS[key]
+        return _DATASET
+
+
+def inputs(query, dataset):
+    missing = [col for col in query.columns + query.requires + query.tokens if col not in dataset.available]
+    if missing:
+        raise MissingColumns(query.missing or f"{', '.join(missing)} column missing.")
+    cube, time_cube = dataset.cubes() if query.cubes else (None, None)
+    tokens = {col: dataset.tokens(col) for col in query.tokens}
+    return Inputs(dataset.events(query.columns), cube, time_cube, tokens)
+
+
+def run(qid, params=None, dataset=None, sql=None):
+    """
+    The result of one registered query, a DataFrame. With `sql` the query's
+    analysis_queries.sql statement runs through query_engine; without it, or when
+    the SQL can't run on this data, compute() gets the declared columns. `sql`
+    defaults to whether duckdb is installed, except for queries that prefer
+    compute (cubes, token sets, indexed), which take the SQL only with sql=True. Memoized per (dataset version, qid, params, sql)
+    in an LRU of QUERY_CACHE_ENTRIES results. Raises MissingColumns when the data
+    can't answer it.
+    """
+    query = REGISTRY[qid]
+    dataset = dataset or get_dataset()
+    if sql is None:
+        sql = query_engine.duckdb is not None and not query.prefer_compute
+    bound = query.bind(params)
+    key = (dataset.version, qid, bound, sql)
+    with _LOCK:
+        if key in _RESULTS:
+            _RESULTS.move_to_end(key)
+            return _RESULTS[key]
+    result = None
+    if sql:
+        try:
+            result = query_engine.run_query(qid, dict(bound))
+        except query_engine.duckdb.Error:
+            # a column the SQL reads is missing (e.g. data cleaned before country/continent existed,
+            # no casualties/economic_loss): compute() below derives it or raises MissingColumns
+            pass
+    if result is None:
+        result = query.compute(inputs(query, dataset), **dict(bound))
+    with _LOCK:
+        _RESULTS[key] = result
+        while len(_RESULTS) > QUERY_CACHE_ENTRIES:
+            _RESULTS.popitem(last=False)
+    return result
+
+
+def report(qids=None, params=None, out_dir=QUERY_REPORT_DIR):
+    """
+    Run the registry headless: one CSV per query under out_dir and a
+    summary.json with every query's row count, timing, or the reason it was
+    skipped. Returns the summary path.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    dataset = get_dataset()
+    summary = {"version": list(dataset.version), "queries": {}}
+    for qid in qids or REGISTRY:
+        query = REGISTRY[qid]
+        entry = summary["queries"][qid] = {"title": query.title, "params": dict(query.bind(params))}
+        started = time.perf_counter()
+        try:
+            result = run(qid, params, dataset)
+        except MissingColumns as exc:
+            entry["skipped"] = str(exc)
+            print(f"⚠️  {qid}: {exc}")
+            continue
+        entry["seconds"] = round(time.perf_counter() - started, 4)
+        entry["rows"] = len(result)
+        result.to_csv(os.path.join(out_dir, f"{qid}.csv"), index=False)
+        print(f"✅ {qid} {query.title}: {len(result)} rows")
+    summary["memory_mb"] = round(dataset.memory_usage() / 2**20, 1)
+    path = os.path.join(out_dir, "summary.json")
+    with open(path, "w") as fh:
+        json.dump(summary, fh, indent=2)
+    return path
+
+
+# ---------- the queries ----------
+
+def _sql_round(values, digits):
+    # ROUND() as MySQL/DuckDB do it: halves away from zero (pandas/numpy round them to even)
+    scale = 10.0 ** digits
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+@register("Q1", "Top 10 strongest earthquakes (mag)", columns=EVENT_COLS)
+def q1(data):
+    return data.events.sort_values("mag", ascending=False).head(10)
+
+
+@register("Q2", "Top 10 deepest earthquakes (depth_km)", columns=EVENT_COLS)
+def q2(data):
+    return data.events.sort_values("depth_km", ascending=False).head(10)
+
+
+@register("Q3", "Shallow <50 km & mag > 7.5", columns=EVENT_COLS)
+def q3(data):
+    df = data.events
+    return df[(df["depth_km"] < 50) & (df["mag"] > 7.5)].sort_values("mag", ascending=False)
+
+
+@register("Q4", "Average depth per continent", requires=["continent"], cubes=True,
+          missing="No continent column present.")
+def q4(data):
+    return aggregates.rollup(data.cube, "continent")[["continent","avg_depth_km","events"]].sort_values("avg_depth_km", ascending=False)
+
+
+@register("Q5", "Average magnitude per magType", requires=["magType"], cubes=True,
+          missing="magType column not found.")
+def q5(data):
+    return aggregates.rollup(data.cube, "magType").rename(columns={"events":"cnt"})[["magType","cnt","avg_mag"]].sort_values("avg_mag", ascending=False)
+
+
+@register("Q6", "Year with most earthquakes", cubes=True)
+def q6(data):
+    return aggregates.rollup(data.cube, "year").rename(columns={"events":"quake_count"})[["year","quake_count"]].sort_values("quake_count", ascending=False).head(1)
+
+
+@register("Q7", "Month with highest number of earthquakes", cubes=True)
+def q7(data):
+    return aggregates.rollup(data.cube, "month").rename(columns={"events":"quake_count"})[["month","quake_count"]].sort_values("quake_count", ascending=False).head(1)
+
+
+@register("Q8", "Day of week with most earthquakes", cubes=True)
+def q8(data):
+    return aggregates.rollup(data.time_cube, "weekday").rename(columns={"weekday":"day_of_week","events":"quake_count"})[["day_of_week","quake_count"]].sort_values("quake_count", ascending=False)
+
+
+@register("Q9", "Count of earthquakes per hour of day", cubes=True)
+def q9(data):
+    return aggregates.rollup(data.time_cube, "hour").rename(columns={"events":"quake_count"})[["hour","quake_count"]].sort_values("hour")
+
+
+@register("Q10", "Most active reporting network (net)", requires=["net"], cubes=True,
+          missing="net column not found.")
+def q10(data):
+    return aggregates.rollup(data.cube, "net").rename(columns={"events":"quake_count"})[["net","quake_count"]].sort_values("quake_count", ascending=False).head(1)
+
+
+@register("Q11", "Top 5 places with highest casualties", columns=["place", "country", "casualties"],
+          missing="casualties column not present in dataset.")
+def q11(data):
+    df = data.events
+    df = df[df["casualties"] > 0]
+    out = df.groupby(["place","country"], observed=True)["casualties"].agg(total_casualties="sum", events="size").reset_index()
+    return out.sort_values("total_casualties", ascending=False).head(5)
+
+
+@register("Q12", "Total estimated economic loss per continent", columns=["continent", "economic_loss"],
+          missing="economic_loss column not present.")
+def q12(data):
+    df = data.events.dropna(subset=["economic_loss"])
+    return df.groupby("continent", observed=True)["economic_loss"].sum().rename("total_loss").reset_index().sort_values("total_loss", ascending=False)
+
+
+@register("Q13", "Average economic loss by alert level", columns=["alert", "economic_loss"],
+          missing="alert or economic_loss column missing.")
+def q13(data):
+    df = data.events.dropna(subset=["economic_loss"])
+    return df.groupby("alert", observed=True)["economic_loss"].agg(avg_loss="mean", events="size").reset_index().sort_values("avg_loss", ascending=False)
+
+
+@register("Q14", "Count of reviewed vs automatic earthquakes (status)", columns=["status"],
+          missing="status column missing.")
+def q14(data):
+    return data.events["status"].value_counts().rename_axis("status").reset_index(name="cnt")
+
+
+@register("Q15", "Count by earthquake type (type)", columns=["type"], missing="type column missing.")
+def q15(data):
+    return data.events["type"].value_counts().rename_axis("type").reset_index(name="cnt")
+
+
+@register("Q16", "Number of earthquakes by data type (types)", tokens=["types"], missing="types column missing.")
+def q16(data):
+    # events whose types contain each product (bitmask counts over the parsed types, like LIKE '%shakemap%')
+    types = data.tokens["types"]
+    return pd.DataFrame({f"{token}_events": [types.count(token)] for token in ["shakemap","dyfi","origin"]})
+
+
+@register("Q17", "Average RMS and gap per continent", requires=["rms", "continent"], cubes=True,
+          missing="rms or country column missing.")
+def q17(data):
+    return aggregates.rollup(data.cube, "continent")[["continent","avg_rms","avg_gap"]].sort_values("avg_rms", ascending=False)
+
+
+@register("Q18", "Events with high station coverage (nst > 100)", columns=["id", "time", "place", "country", "nst"],
+          params=[Param("nst_threshold", "nst threshold", 100, step=10)], missing="nst column missing.")
+def q18(data, nst_threshold):
+    df = data.events
+    return df[df["nst"] > nst_threshold].sort_values("nst", ascending=False)
+
+
+@register("Q19", "Number of tsunamis triggered per year", requires=["tsunami"], cubes=True,
+          missing="tsunami column missing.")
+def q19(data):
+    return aggregates.rollup(data.cube, "year").rename(columns={"tsunami_sum":"tsunami_events"})[["year","tsunami_events"]].sort_values("year")
+
+
+@register("Q20", "Count earthquakes by alert levels", requires=["alert"], cubes=True, missing="alert column missing.")
+def q20(data):
+    return aggregates.rollup(data.cube, "alert").rename(columns={"events":"cnt"})[["alert","cnt"]].sort_values("cnt", ascending=False)
+
+
+@register("Q21", "Top 5 countries with highest average magnitude (past 10 years)", cubes=True)
+def q21(data):
+    cube = data.cube
+    cutoff = (pd.Timestamp.now().year - 10)
+    out = aggregates.rollup(cube, "country", where=cube["year"] >= cutoff)[["country","avg_mag","events"]]
+    return out[out["events"]>=10].sort_values("avg_mag", ascending=False).head(5)
+
+
+def _shallow_deep(cube):
+    return cube.assign(
+        shallow = (cube["depth_category"] == "shallow") * cube["events"],
+        deep = (cube["depth_category"] == "deep") * cube["events"]
+    )
+
+
+@register("Q22", "Countries with both shallow and deep quakes in same month", requires=["depth_km"], cubes=True,
+          missing="depth_km column missing.")
+def q22(data):
+    # countries that have both shallow (<50) and deep (>300) in same month
+    tmp = _shallow_deep(data.cube)
+    grouped = aggregates.rollup(tmp[tmp["year"] > 0], ["country","year","month"])
+    both = grouped[(grouped["shallow"] > 0) & (grouped["deep"] > 0)]
+    return both[["country","year","month"]].sort_values(["country","year","month"])
+
+
+@register("Q23", "Year-over-year growth rate in total earthquakes", cubes=True)
+def q23(data):
+    yearly = aggregates.rollup(data.cube, "year").rename(columns={"year":"yr","events":"cnt"})[["yr","cnt"]].sort_values("yr")
+    yearly["prev_cnt"] = yearly["cnt"].shift(1)
+    yearly["growth_percent"] = _sql_round((yearly["cnt"] - yearly["prev_cnt"]) / yearly["prev_cnt"].replace(0, np.nan) * 100, 2)
+    return yearly
+
+
+@register("Q24", "3 most seismically active regions (freq * avg_mag)", columns=["place", "id", "mag"])
+def q24(data):
+    # region by place score = count * avg mag
+    tmp = data.events.groupby("place").agg(freq=("id","count"), avg_mag=("mag","mean")).reset_index()
+    tmp["score"] = tmp["freq"] * tmp["avg_mag"]
+    return tmp[tmp["freq"]>=5].sort_values("score", ascending=False).head(3)
+
+
+@register("Q25", "Avg depth per country within ±5° latitude", columns=["latitude", "depth_km", "country"],
+          missing="latitude or depth_km missing.")
+def q25(data):
+    df = data.events
+    tmp = df[(df["latitude"].between(-5,5)) & (~df["country"].isna())]
+    out = tmp.groupby("country", observed=True)["depth_km"].agg(avg_depth_km="mean", events="size").reset_index()
+    return out.sort_values("avg_depth_km", ascending=False)
+
+
+@register("Q26", "Countries highest ratio shallow:deep", requires=["depth_km"], cubes=True, missing="depth_km missing.")
+def q26(data):
+    agg = aggregates.rollup(_shallow_deep(data.cube), "country").rename(columns={"shallow":"shallow_cnt","deep":"deep_cnt"})
+    agg = agg[["country","shallow_cnt","deep_cnt"]]
+    agg["shallow_deep_ratio"] = _sql_round(agg["shallow_cnt"] / agg["deep_cnt"].where(agg["deep_cnt"] > 0), 2)
+    return agg[agg["shallow_cnt"]+agg["deep_cnt"]>=5].sort_values("shallow_deep_ratio", ascending=False).head(20)
+
+
+@register("Q27", "Avg magnitude difference tsunami vs no-tsunami", columns=["tsunami", "mag"],
+          missing="tsunami or mag column missing.")
+def q27(data):
+    df = data.events
+    avg_t = df[df["tsunami"]==1]["mag"].mean()
+    avg_nt = df[df["tsunami"]==0]["mag"].mean()
+    return pd.DataFrame({"avg_mag_tsunami": [_sql_round(avg_t, 3)], "avg_mag_no_tsunami": [_sql_round(avg_nt, 3)],
+                         "avg_diff": [_sql_round(avg_t - avg_nt, 3)]})
+
+
+@register("Q28", "Events with lowest data reliability (rms+gap)", columns=["id", "time", "place", "country", "rms", "gap"],
+          missing="rms or gap missing.")
+def q28(data):
+    df = data.events
+    scored = df.assign(error_score=df["rms"].fillna(0) + df["gap"].fillna(0))
+    return scored.sort_values("error_score", ascending=False).head(100)
+
+
+@register("Q29", "Pairs of quakes within 50 km & 1 hour", columns=["id", "time", "latitude", "longitude", "place"],
+          missing="latitude/longitude not present.", indexed=True,
+          note="Q29 searches the whole catalogue; pairs are not limited to consecutive events.",
+          params=[Param("max_km", "Max distance (km)", 50.0, 1.0, 500.0, 5.0),
+                  Param("max_minutes", "Max time apart (minutes)", 60.0, 1.0, 1440.0, 5.0)])
+def q29(data, max_km, max_minutes):
+    # space-time grid index (proximity.py); every pair, latest first
+    pairs = proximity.find_pairs(data.events, max_km, max_minutes)
+    # whole seconds apart, as TIMESTAMPDIFF(SECOND, ...) / 60.0
+    pairs["minutes_diff"] = ((pairs["time"] - pairs["prev_time"]) // pd.Timedelta(seconds=1)) / 60.0
+    out = pairs[["id","prev_id","minutes_diff","distance_km","place","prev_time","time"]]
+    return out.sort_values(["time","prev_time"], ascending=False).reset_index(drop=True)
+
+
+@register("Q30", "Regions with highest frequency of deep-focus quakes (>300 km)", requires=["depth_km"], cubes=True,
+          missing="depth_km missing.")
+def q30(data):
+    cube = data.cube
+    return aggregates.rollup(cube, "country", where=cube["depth_category"] == "deep").rename(columns={"events":"deep_count"})[["country","deep_count"]].sort_values("deep_count", ascending=False).head(20)
+
+
+@register("Q31", "Largest aftershock sequences (declustered)",
+          columns=["id", "time", "place", "country", "mag", "cluster_id", "mainshock"],
+          missing="No cluster labels yet: run `python decluster.py` (or run_all).", indexed=True)
+def q31(data):
+    # events appended since the last labelling have no cluster yet
+    df = data.events.dropna(subset=["cluster_id"])
+    df = df.assign(cluster_id=df["cluster_id"].astype("str"))
+    groups = df.groupby("cluster_id")
+    seq = pd.DataFrame({
+        "aftershocks": groups.size() - 1,
+        "largest_aftershock": df["mag"].where(df["mainshock"] == 0).groupby(df["cluster_id"]).max(),
+        "last_event": groups["time"].max(),
+    })
+    mains = df[df["mainshock"] == 1].set_index(df.loc[df["mainshock"] == 1, "id"].astype("str"))
+    out = seq[seq["aftershocks"] > 0].join(mains[["time","place","country","mag"]], how="inner")
+    out = out.rename_axis("mainshock_id").reset_index()
+    return out[["mainshock_id","time","place","country","mag","aftershocks","largest_aftershock","last_event"]].sort_values(["aftershocks","mag"], ascending=False).head(20)
+
+
+@register("Q32", "3 most seismically active regions without aftershocks (declustered Q24)",
+          columns=["place", "id", "mag", "mainshock"],
+          missing="No cluster labels yet: run `python decluster.py` (or run_all).", indexed=True)
+def q32(data):
+    df = data.events
+    return q24(data._replace(events=df[df["mainshock"] == 1]))
+
+
+def _parse_param(text):
+    name, _, value = text.partition("=")
+    return name, float(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the analyst queries headless and write a report")
+    parser.add_argument("--only", default=None, help="comma-separated query ids, e.g. Q1,Q18")
+    parser.add_argument("--param", action="append", default=[], type=_parse_param, help="name=value, e.g. nst_threshold=50")
+    parser.add_argument("--out", default=QUERY_REPORT_DIR)
+    args = parser.parse_args()
+    qids = args.only.split(",") if args.only else None
+    print(f"\n📝 Query report written to {report(qids, dict(args.param), args.out)}")
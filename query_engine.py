@@ -0,0 +1,148 @@
+# query_engine.py
+# Runs the analyst queries in analysis_queries.sql with DuckDB, straight over the cleaned columnar files.
+import os
+import re
+import threading
+
+from config import (
+    CLEAN_CSV, CLEAN_DATASET, CLUSTER_DIR, STORAGE_FORMAT, ANALYSIS_SQL,
+    DUCKDB_THREADS, DUCKDB_MEMORY_LIMIT, DUCKDB_TEMP_DIR
+)
+import decluster
+import geocode
+import storage
+
+try:
+    import duckdb
+except ImportError:  # optional; the dashboard falls back to pandas without it
+    duckdb = None
+
+try:
+    import pyarrow.dataset as ds
+except ImportError:
+    ds = None
+
+_LOCAL = threading.local()
+
+# MySQL spellings in analysis_queries.sql -> DuckDB
+MYSQL_COMPAT = [
+    (re.compile(r"\bCURDATE\(\)", re.I), "current_date"),
+    # TIMESTAMPDIFF counts whole units elapsed, like date_sub (date_diff counts boundaries crossed)
+    (re.compile(r"\bTIMESTAMPDIFF\(\s*(\w+)\s*,", re.I), r"date_sub('\1',"),
+    # @name user variables (NULL when unset in MySQL) become named parameters
+    (re.compile(r"@(\w+)"), r"$\1"),
+]
+PARAM = re.compile(r"@(\w+)")
+HEADER = re.compile(r"^--\s*(Q\d+):\s*(.*)$")
+
+
+def _module_path(path):
+    # bundled files (the .sql) live next to this module; data paths stay relative to the working dir
+    return path if os.path.isabs(path) else os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+
+def load_queries(path=ANALYSIS_SQL):
+    """
+    {"Q1": (title, sql), ...} from analysis_queries.sql, where every query starts
+    with a "-- Qn: title" comment and ends with ";".
+    """
+    queries, current, lines = {}, None, []
+    with open(_module_path(path)) as fh:
+        for line in fh:
+            header = HEADER.match(line.strip())
+            if header:
+                current, lines = header.groups(), []
+                continue
+            if current is None or line.lstrip().startswith("--"):
+                continue
+            lines.append(line.rstrip())
+            if line.rstrip().endswith(";"):
+                queries[current[0]] = (current[1], "\n".join(lines).rstrip(";").strip())
+                current = None
+    return queries
+
+
+def to_duckdb(sql):
+    for pattern, replacement in MYSQL_COMPAT:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def _source(fmt=STORAGE_FORMAT):
+    # a relation over the cleaned data that DuckDB scans lazily (projection + filter pushdown)
+    if fmt == "csv":
+        return f"read_csv_auto('{os.path.abspath(CLEAN_CSV)}')"
+    if fmt == "parquet":
+        return f"read_parquet('{os.path.abspath(CLEAN_DATASET)}/**/*.parquet', hive_partitioning = true, union_by_name = true)"
+    return None  # feather: scanned through a pyarrow dataset
+
+
+def connect(fmt=STORAGE_FORMAT):
+    """
+    A DuckDB connection with `earthquakes` (a view over the cleaned files),
+    `country_continent` and, once decluster.py has stored them, the
+    `earthquake_clusters` labels registered, as they are on disk now: the
+    feather dataset and the clusters view are fixed when it connects.
+    get_connection() hands out a new one whenever those files change.
+    """
+    if duckdb is None:
+        raise ImportError("the query engine needs duckdb (pip install duckdb)")
+    con = duckdb.connect()
+    if DUCKDB_THREADS:
+        con.execute(f"SET threads = {int(DUCKDB_THREADS)}")
+    if DUCKDB_MEMORY_LIMIT:
+        con.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}'")
+    # spill large sorts/joins/aggregates to disk instead of failing
+    os.makedirs(os.path.abspath(DUCKDB_TEMP_DIR), exist_ok=True)
+    con.execute(f"SET temp_directory = '{os.path.abspath(DUCKDB_TEMP_DIR)}'")
+
+    source = _source(fmt)
+    if source is None:
+        if ds is None:
+            raise ImportError("STORAGE_FORMAT='feather' needs pyarrow")
+        con.register("earthquakes_arrow", ds.dataset(os.path.abspath(CLEAN_DATASET), format="ipc", partitioning="hive"))
+        source = "earthquakes_arrow"
+    con.execute(f"CREATE VIEW earthquakes AS SELECT * FROM {source}")
+    con.register("country_continent", geocode.country_continent())
+    if decluster.clusters_exist():
+        path = os.path.abspath(storage.table_path(CLUSTER_DIR, decluster.CLUSTER_TABLE, fmt))
+        if fmt == "feather":
+            con.register(decluster.CLUSTER_TABLE, ds.dataset(path, format="ipc"))
+        else:
+            reader = "read_csv_auto" if fmt == "csv" else "read_parquet"
+            con.execute(f"CREATE VIEW {decluster.CLUSTER_TABLE} AS SELECT * FROM {reader}('{path}')")
+    return con
+
+
+def data_version(fmt=STORAGE_FORMAT):
+    # changes whenever the cleaned files or the cluster labels are rewritten or appended to
+    return storage.path_version(CLEAN_CSV if fmt == "csv" else CLEAN_DATASET, CLUSTER_DIR)
+
+
+def get_connection():
+    # one connection per thread (DuckDB connections aren't shared across threads; each is cheap),
+    # reconnected when the data changed, so no query reads fragments or labels from before
+    version = data_version()
+    con = getattr(_LOCAL, "con", None)
+    if con is None or _LOCAL.version != version:
+        if con is not None:
+            con.close()
+        con = _LOCAL.con = connect()
+        _LOCAL.version = version
+    return con
+
+
+def query(sql, params=None):
+    """
+    Run MySQL-flavoured SQL against the cleaned data and return a DataFrame.
+    `params` fills @name variables; unset ones are NULL, as in MySQL.
+    """
+    names = set(PARAM.findall(sql))
+    values = {name: (params or {}).get(name) for name in names}
+    return get_connection().execute(to_duckdb(sql), values or None).df()
+
+
+def run_query(qid, params=None, queries=None):
+    # one of Q1..Q32 from analysis_queries.sql
+    queries = queries or load_queries()
+    return query(queries[qid][1], params)
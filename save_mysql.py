@@ -1,18 +1,266 @@
 # save_mysql.py
-from sqlalchemy import create_engine, text
-from config import MYSQL_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB, TABLE_NAME
+import csv
+import os
+import re
+import tempfile
+
+from sqlalchemy import create_engine, inspect, text
+from config import (
+    MYSQL_USER, MYSQL_PASSWORD, MYSQL_HOST, MYSQL_PORT, MYSQL_DB, TABLE_NAME,
+    CREATE_TABLE_SQL, MYSQL_POOL_SIZE, MYSQL_BATCH_ROWS, MYSQL_LOAD_METHOD
+)
 import pandas as pd
+import storage
+import geocode
+import decluster
+import aggregates
+
+_ENGINE = None
+# per-row hash of the written values (aggregates.row_keys), kept next to them
+ROW_HASH = "row_hash"
+
 
 def get_engine():
-    url = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
-    engine = create_engine(url)
-    return engine
+    # one pooled engine per process; local_infile lets LOAD DATA LOCAL INFILE stream from the client
+    global _ENGINE
+    if _ENGINE is None:
+        url = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB}"
+        _ENGINE = create_engine(
+            url, pool_size=MYSQL_POOL_SIZE, pool_pre_ping=True, pool_recycle=3600,
+            connect_args={"local_infile": True}
+        )
+    return _ENGINE
+
+
+def ensure_schema(engine, sql_path=CREATE_TABLE_SQL):
+    """
+    Run the CREATE TABLE statements from create_table.sql, so the table keeps its
+    `id` PRIMARY KEY and column types, then check an existing table really has
+    that key (ensure_primary_key), the row_hash column changed_rows() reads and
+    the script's indexes (ensure_indexes).
+    """
+    with engine.begin() as conn:
+        for stmt in create_statements(sql_path):
+            conn.execute(text(stmt))
+    ensure_primary_key(engine, sql_path=sql_path)
+    if ROW_HASH not in table_columns(engine):
+        # tables from before row hashes: every row counts as changed once, then only real changes do
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {TABLE_NAME} ADD COLUMN {ROW_HASH} BIGINT"))
+    ensure_indexes(engine, sql_path=sql_path)
+
+
+def ensure_indexes(engine, sql_path=CREATE_TABLE_SQL):
+    # create_table.sql's CREATE INDEX statements whose index doesn't exist yet (MySQL has no IF NOT EXISTS for them)
+    pattern = re.compile(r"^CREATE INDEX\s+`?(\w+)`?\s+ON\s+`?(\w+)`?", re.IGNORECASE)
+    for stmt in create_statements(sql_path, kind="CREATE INDEX"):
+        name, table = pattern.match(stmt).groups()
+        if name not in {index["name"] for index in inspect(engine).get_indexes(table)}:
+            with engine.begin() as conn:
+                conn.execute(text(stmt))
+
+
+def create_statements(sql_path=CREATE_TABLE_SQL, kind="CREATE TABLE"):
+    # the CREATE TABLE (or `kind`) statements of create_table.sql
+    if not os.path.isabs(sql_path):
+        sql_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), sql_path)
+    with open(sql_path) as fh:
+        # drop whole-line "--" comments so a commented CREATE TABLE is still recognised
+        script = "".join(line for line in fh if not line.lstrip().startswith("--"))
+    statements = [stmt.strip() for stmt in script.split(";")]
+    return [stmt for stmt in statements if stmt.upper().startswith(kind)]
 
-def save_dataframe(df):
+
+def table_definition(table, name, sql_path=CREATE_TABLE_SQL):
+    # create_table.sql's CREATE TABLE for `table`, creating it as `name` instead
+    pattern = re.compile(rf"^CREATE TABLE\s+(IF NOT EXISTS\s+)?`?{table}`?(?=[\s(])", re.IGNORECASE)
+    for stmt in create_statements(sql_path):
+        if pattern.match(stmt):
+            return pattern.sub(f"CREATE TABLE {name}", stmt, count=1)
+    raise RuntimeError(f"{sql_path} has no CREATE TABLE for {table}")
+
+
+def ensure_primary_key(engine, table=TABLE_NAME, key="id", sql_path=CREATE_TABLE_SQL):
     """
-    Save DataFrame to MySQL table. Creates db/table if not exists (simple approach).
+    A table created earlier by to_sql(replace) has no PRIMARY KEY, so
+    ON DUPLICATE KEY UPDATE (and LOAD DATA ... REPLACE) would append a second copy
+    of every changed event. On MySQL such a table is migrated once: its rows,
+    de-duplicated by `key` keeping the most recently updated, go into a copy
+    created from create_table.sql (key and column types included), which replaces
+    it in one RENAME TABLE. If anything fails before that, the copy is dropped and
+    the table is left as it was. Other databases get an error before anything is written.
+    Returns True if the table was migrated.
     """
-    engine = get_engine()
-    # to_sql will create table if not exists; use if_exists='replace' or 'append' as needed
-    df.to_sql(TABLE_NAME, engine, if_exists="replace", index=False, chunksize=1000)
+    primary = inspect(engine).get_pk_constraint(table).get("constrained_columns") or []
+    if primary == [key]:
+        return False
+    if primary or engine.dialect.name != "mysql":
+        raise RuntimeError(
+            f"table {table} has PRIMARY KEY {primary or 'none'}, not ({key}): upserts would insert duplicates. "
+            f"Recreate it from {CREATE_TABLE_SQL} (or add PRIMARY KEY ({key})) and rerun."
+        )
+    keyed, old = f"{table}_keyed", f"{table}_unkeyed"
+    # MySQL commits every DDL statement on its own, so no transaction can undo a half-done migration
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {keyed}"))
+        conn.execute(text(table_definition(table, keyed, sql_path)))
+    try:
+        present = set(table_columns(engine, table))
+        cols = ", ".join(col for col in table_columns(engine, keyed) if col in present)
+        with engine.begin() as conn:
+            # INSERT IGNORE keeps the first row per id, and the newest version comes first
+            conn.execute(text(f"INSERT IGNORE INTO {keyed} ({cols}) SELECT {cols} FROM {table} "
+                              f"WHERE {key} IS NOT NULL ORDER BY updated DESC"))
+            # one statement: `table` is the old table or the keyed copy, never missing
+            conn.execute(text(f"RENAME TABLE {table} TO {old}, {keyed} TO {table}"))
+    except Exception:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {keyed}"))
+        raise
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {old}"))
+    print(f"🔑 {table} had no PRIMARY KEY ({key}): de-duplicated and keyed")
     return True
+
+
+def table_columns(engine, table=TABLE_NAME):
+    with engine.connect() as conn:
+        result = conn.execute(text(f"SELECT * FROM {table} WHERE 1 = 0"))
+        return list(result.keys())
+
+
+def with_row_hash(df):
+    # the frame plus the hash of its other columns, as a signed BIGINT
+    keys = aggregates.row_keys(df, [col for col in df.columns if col != ROW_HASH])
+    return df.assign(**{ROW_HASH: keys.to_numpy().view("int64")})
+
+
+def changed_rows(engine, df):
+    """
+    Keep only rows that are new or whose values differ from the stored version,
+    by row_hash. A changed `updated` is not enough to go by: cleaning rewrites
+    values of unchanged events too (median fills, geocoded country).
+    """
+    with engine.connect() as conn:
+        # nullable ints: a float64 column would round the 64-bit hashes
+        existing = pd.read_sql(text(f"SELECT id, {ROW_HASH} FROM {TABLE_NAME}"), conn, dtype_backend="numpy_nullable")
+    if existing.empty:
+        return df
+    stored = pd.Series(existing[ROW_HASH].to_numpy(), index=existing["id"].astype(object).to_numpy())
+    before = stored.reindex(df["id"].to_numpy()).array
+    same = (before == df[ROW_HASH].to_numpy()).fillna(False)
+    return df[~same.to_numpy(dtype=bool)]
+
+
+def _rows(chunk):
+    # DB-API parameters: NaN/NaT -> None, categoricals -> str, Timestamps -> datetime
+    out = chunk.astype(object).where(chunk.notna(), None)
+    for col in chunk.columns:
+        if pd.api.types.is_datetime64_any_dtype(chunk[col]):
+            out[col] = pd.Series([None if value is None else value.to_pydatetime() for value in out[col]],
+                                 index=out.index, dtype=object)
+    return list(out.itertuples(index=False, name=None))
+
+
+def upsert_sql(dialect, columns, paramstyle="format", table=TABLE_NAME, key="id"):
+    cols = ", ".join(columns)
+    params = ", ".join(["?" if paramstyle == "qmark" else "%s"] * len(columns))
+    updates = [col for col in columns if col != key]
+    if dialect == "mysql":
+        assign = ", ".join(f"{col} = VALUES({col})" for col in updates)
+        return f"INSERT INTO {table} ({cols}) VALUES ({params}) ON DUPLICATE KEY UPDATE {assign}"
+    # sqlite / postgres stand-ins
+    assign = ", ".join(f"{col} = excluded.{col}" for col in updates)
+    return f"INSERT INTO {table} ({cols}) VALUES ({params}) ON CONFLICT ({key}) DO UPDATE SET {assign}"
+
+
+def upsert_batches(engine, df, batch_rows=MYSQL_BATCH_ROWS, table=TABLE_NAME, key="id"):
+    # positional executemany: pymysql rewrites each batch into multi-row INSERT statements
+    stmt = upsert_sql(engine.dialect.name, list(df.columns), engine.dialect.paramstyle, table=table, key=key)
+    for start in range(0, len(df), batch_rows):
+        chunk = df.iloc[start:start + batch_rows]
+        with engine.begin() as conn:
+            conn.exec_driver_sql(stmt, _rows(chunk))
+
+
+def save_country_continent(engine):
+    # the lookup behind the continent queries; the same names the cleaning stage writes to `country`
+    mapping = geocode.country_continent()
+    stmt = upsert_sql(engine.dialect.name, list(mapping.columns), engine.dialect.paramstyle,
+                      table="country_continent", key="country")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(stmt, list(mapping.itertuples(index=False, name=None)))
+
+
+def save_clusters(engine, labels=None):
+    """
+    The declustering labels behind Q31/Q32 (decluster.py's stored ones unless
+    given). Labels move whenever a new event claims older ones, so only rows
+    whose label differs from the stored one are written. Returns that count.
+    """
+    labels = decluster.load_clusters() if labels is None else labels
+    if labels is None:
+        return 0
+    with engine.connect() as conn:
+        stored = pd.read_sql(text(f"SELECT id, cluster_id, mainshock FROM {decluster.CLUSTER_TABLE}"), conn)
+    if len(stored):
+        merged = labels.merge(stored, on="id", how="left", suffixes=("", "_stored"))
+        changed = (merged["cluster_id"] != merged["cluster_id_stored"]) | (merged["mainshock"] != merged["mainshock_stored"])
+        labels = labels[changed.to_numpy()]
+    upsert_batches(engine, labels, table=decluster.CLUSTER_TABLE)
+    return len(labels)
+
+
+def load_infile(engine, df, batch_rows=MYSQL_BATCH_ROWS * 10):
+    # REPLACE keeps the primary key semantics: a changed row overwrites the stored one
+    columns = list(df.columns)
+    for start in range(0, len(df), batch_rows):
+        chunk = df.iloc[start:start + batch_rows]
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="") as fh:
+            chunk.to_csv(fh, index=False, header=False, na_rep="\\N", quoting=csv.QUOTE_MINIMAL,
+                         date_format="%Y-%m-%d %H:%M:%S")
+            path = fh.name
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"LOAD DATA LOCAL INFILE '{path}' REPLACE INTO TABLE {TABLE_NAME} "
+                    "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                    f"LINES TERMINATED BY '\\n' ({', '.join(columns)})"
+                ))
+        finally:
+            os.remove(path)
+
+
+def save_dataframe(df=None, engine=None, method=MYSQL_LOAD_METHOD, only_changed=True):
+    """
+    Upsert the cleaned events into the MySQL table defined in create_table.sql.
+
+    Only rows that are new or whose values differ from the stored ones (by
+    row_hash) are written (set `only_changed=False` to push everything).
+    `method` picks batched INSERT ... ON DUPLICATE KEY UPDATE ("upsert") or
+    LOAD DATA LOCAL INFILE ("infile").
+    Any SQLAlchemy engine works for "upsert", e.g. sqlite for local testing.
+    The country_continent lookup table is refreshed on every call, and the
+    earthquake_clusters labels wherever they changed.
+    Returns the number of rows written.
+    """
+    if df is None:
+        df = storage.load_clean()
+    engine = engine or get_engine()
+    ensure_schema(engine)
+    save_country_continent(engine)
+    save_clusters(engine)
+
+    # only columns the table knows about, in table order, plus the hash of their values
+    columns = [col for col in table_columns(engine) if col in df.columns and col != ROW_HASH]
+    df = with_row_hash(df[columns])
+    if only_changed:
+        df = changed_rows(engine, df)
+    if df.empty:
+        return 0
+
+    if method == "infile" and engine.dialect.name == "mysql":
+        load_infile(engine, df)
+    else:
+        upsert_batches(engine, df)
+    return len(df)
@@ -0,0 +1,220 @@
+# storage.py
+# Columnar storage for the raw and cleaned datasets (Parquet or Feather, partitioned by year/month).
+import os
+import shutil
+import uuid
+
+import pandas as pd
+from config import RAW_CSV, CLEAN_CSV, RAW_DATASET, CLEAN_DATASET, STORAGE_FORMAT
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # only the "csv" format works without pyarrow
+    pa = ds = pq = None
+
+PARTITION_COLS = ["year", "month"]
+EXTENSIONS = {"parquet": "parquet", "feather": "arrow"}
+
+
+def _require_arrow(fmt):
+    if pa is None:
+        raise ImportError(f"STORAGE_FORMAT={fmt!r} needs pyarrow (pip install pyarrow), or set it to 'csv'")
+
+
+def _with_partitions(df):
+    # raw events carry epoch-ms times and no year/month columns yet
+    if all(col in df.columns for col in PARTITION_COLS):
+        return df
+    time = df["time"]
+    if not pd.api.types.is_datetime64_any_dtype(time):
+        time = pd.to_datetime(pd.to_numeric(time, errors="coerce"), unit="ms")
+    return df.assign(year=time.dt.year, month=time.dt.month)
+
+
+def _apply_filters(df, filters):
+    # CSV fallback for the (column, op, value) filters that pyarrow pushes down
+    ops = {
+        "==": lambda s, v: s == v, "=": lambda s, v: s == v, "!=": lambda s, v: s != v,
+        "<": lambda s, v: s < v, "<=": lambda s, v: s <= v,
+        ">": lambda s, v: s > v, ">=": lambda s, v: s >= v,
+        "in": lambda s, v: s.isin(v), "not in": lambda s, v: ~s.isin(v),
+    }
+    for col, op, value in filters:
+        df = df[ops[op](df[col], value)]
+    return df
+
+
+def write_dataset(df, path, fmt=STORAGE_FORMAT, append=False):
+    """
+    Write `df` as a hive-partitioned (year=/month=) dataset.
+    Replaces whatever is at `path` unless `append` is set.
+    """
+    _require_arrow(fmt)
+    if not append and os.path.exists(path):
+        shutil.rmtree(path)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(
+        table, path,
+        format="ipc" if fmt == "feather" else fmt,
+        partitioning=PARTITION_COLS,
+        partitioning_flavor="hive",
+        basename_template=f"part-{uuid.uuid4().hex[:12]}-{{i}}.{EXTENSIONS[fmt]}",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def read_dataset(path, fmt=STORAGE_FORMAT, columns=None, filters=None, partitioning="hive"):
+    """
+    Read a partitioned dataset, loading only `columns` and only the rows/partitions
+    matching `filters` (list of (column, op, value) tuples, ANDed together).
+    `partitioning=None` reads every file under `path` without the partition keys.
+    """
+    _require_arrow(fmt)
+    dataset = ds.dataset(path, format="ipc" if fmt == "feather" else fmt, partitioning=partitioning)
+    expr = pq.filters_to_expression(filters) if filters else None
+    df = dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+    # partition keys are appended last on read; restore the column order that was written
+    meta = dataset.schema.pandas_metadata or {}
+    written = [col["name"] for col in meta.get("columns", []) if col["name"] in df.columns]
+    if columns is None and len(written) == len(df.columns):
+        df = df[written]
+
+    # hive partition values come back as int32
+    if "year" in df.columns and not df["year"].isna().any():
+        df["year"] = df["year"].astype("int16")
+    if "month" in df.columns and not df["month"].isna().any():
+        df["month"] = df["month"].astype("int8")
+    return df
+
+
+def save_raw(df, append=False, fmt=STORAGE_FORMAT):
+    if fmt == "csv":
+        df.to_csv(RAW_CSV, mode="a" if append else "w", header=not append, index=False)
+        return
+    write_dataset(_with_partitions(df), RAW_DATASET, fmt, append=append)
+
+
+def load_raw(columns=None, filters=None, fmt=STORAGE_FORMAT):
+    if fmt == "csv":
+        # only parse the requested columns plus what the filters read
+        wanted = set(columns or []) | {f[0] for f in filters or []}
+        df = pd.read_csv(RAW_CSV, usecols=(lambda name: name in wanted) if columns else None)
+        df = _apply_filters(df, filters) if filters else df
+        return df[columns] if columns else df
+    df = read_dataset(RAW_DATASET, fmt, columns=columns, filters=filters)
+    if columns is None:
+        # year/month only exist on disk as partition keys for the raw data
+        df = df.drop(columns=PARTITION_COLS)
+    return df
+
+
+def iter_raw(chunksize, columns=None, fmt=STORAGE_FORMAT):
+    # yields raw frames of at most `chunksize` rows without loading the whole dataset
+    # (only `columns` when given; ones the data doesn't have are skipped)
+    if fmt == "csv":
+        yield from pd.read_csv(RAW_CSV, chunksize=chunksize,
+                               usecols=(lambda name: name in columns) if columns else None)
+        return
+    _require_arrow(fmt)
+    dataset = ds.dataset(RAW_DATASET, format="ipc" if fmt == "feather" else fmt, partitioning="hive")
+    columns = [name for name in dataset.schema.names if name not in PARTITION_COLS and (not columns or name in columns)]
+    for batch in dataset.to_batches(columns=columns, batch_size=chunksize):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def partition_dirs(path, depth=len(PARTITION_COLS)):
+    """
+    The partition directories of a dataset `depth` levels down (2: year=/month=,
+    1: year=), largest first, so a pool working through them finishes the long
+    ones early.
+    """
+    sizes = {}
+    for root, _, files in os.walk(path):
+        data = [name for name in files if not name.startswith((".", "_"))]
+        if not data:
+            continue
+        parts = os.path.relpath(root, path).split(os.sep)[:depth]
+        key = os.path.join(path, *parts)
+        sizes[key] = sizes.get(key, 0) + sum(os.path.getsize(os.path.join(root, name)) for name in data)
+    return sorted(sizes, key=lambda part: (-sizes[part], part))
+
+
+def raw_exists(fmt=STORAGE_FORMAT):
+    return os.path.exists(RAW_CSV if fmt == "csv" else RAW_DATASET)
+
+
+def save_clean(df, append=False, fmt=STORAGE_FORMAT):
+    if fmt == "csv":
+        df.to_csv(CLEAN_CSV, mode="a" if append else "w", header=not append, index=False)
+        return
+    write_dataset(df, CLEAN_DATASET, fmt, append=append)
+
+
+def load_clean(columns=None, filters=None, fmt=STORAGE_FORMAT):
+    if fmt == "csv":
+        dates = [col for col in ("time", "updated") if columns is None or col in columns]
+        df = pd.read_csv(CLEAN_CSV, usecols=columns, parse_dates=dates, low_memory=False)
+        return _apply_filters(df, filters) if filters else df
+    return read_dataset(CLEAN_DATASET, fmt, columns=columns, filters=filters)
+
+
+def clean_exists(fmt=STORAGE_FORMAT):
+    return os.path.exists(CLEAN_CSV if fmt == "csv" else CLEAN_DATASET)
+
+
+def clean_columns(fmt=STORAGE_FORMAT):
+    # column names of the cleaned data (partition keys included), without reading any rows
+    if fmt == "csv":
+        return list(pd.read_csv(CLEAN_CSV, nrows=0).columns)
+    _require_arrow(fmt)
+    return ds.dataset(CLEAN_DATASET, format="ipc" if fmt == "feather" else fmt, partitioning="hive").schema.names
+
+
+def path_version(*paths):
+    """
+    A cheap fingerprint of the files under `paths` (count, bytes, newest mtime):
+    it changes whenever any of them is written, appended to or removed.
+    """
+    count = size = newest = 0
+    for path in paths:
+        entries = [(path, [], [""])] if os.path.isfile(path) else os.walk(path)
+        for root, _, files in entries:
+            for name in files:
+                try:
+                    stat = os.stat(os.path.join(root, name) if name else root)
+                except OSError:
+                    continue
+                count, size, newest = count + 1, size + stat.st_size, max(newest, stat.st_mtime_ns)
+    return count, size, newest
+
+
+def table_path(directory, name, fmt=STORAGE_FORMAT):
+    return os.path.join(directory, f"{name}.{EXTENSIONS.get(fmt, 'csv')}")
+
+
+def save_table(df, directory, name, fmt=STORAGE_FORMAT):
+    # small unpartitioned frames (rollups, lookups) as a single file
+    os.makedirs(directory, exist_ok=True)
+    path = table_path(directory, name, fmt)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    elif fmt == "feather":
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_parquet(path, index=False)
+
+
+def load_table(directory, name, fmt=STORAGE_FORMAT):
+    path = table_path(directory, name, fmt)
+    if not os.path.exists(path):
+        return None
+    if fmt == "csv":
+        return pd.read_csv(path)
+    if fmt == "feather":
+        return pd.read_feather(path)
+    return pd.read_parquet(path)
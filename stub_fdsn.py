@@ -0,0 +1,205 @@
+# stub_fdsn.py
+# Local stand-in for the USGS FDSN event service, serving a synthetic catalogue (benchmarks, offline runs).
+# Run: python stub_fdsn.py --size 1M --port 8081
+#      then point USGS_URL / USGS_COUNT_URL at http://127.0.0.1:8081/fdsnws/event/1/query and /count
+import argparse
+import email.utils
+import gzip
+import hashlib
+import json
+import multiprocessing as mp
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from config import FDSN_MAX_EVENTS
+import synthetic
+
+STUB_CACHE_MB = 1024  # rendered response bodies kept in memory
+
+
+class Catalogue:
+    """
+    A raw synthetic catalogue indexed by time, answering FDSN query/count
+    parameters: starttime/endtime (inclusive), minmagnitude, updatedafter,
+    orderby (time, the default, is newest first) and limit.
+    """
+
+    def __init__(self, rows, seed=42, cache_mb=STUB_CACHE_MB):
+        self.frame = synthetic.raw_frame(rows, seed)
+        self.time = self.frame["time"].to_numpy()
+        self.updated = self.frame["updated"].to_numpy()
+        self.mag = self.frame["mag"].to_numpy()
+        self.version = f"{rows}-{seed}"
+        # rendered gzip bodies by ETag, so repeated runs measure the client rather than the stub
+        self.bodies = OrderedDict()
+        self.cached_bytes = 0
+        self.cache_bytes = cache_mb * 2**20
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _ms(value):
+        return int(np.datetime64(value.rstrip("Z"), "ms").astype("int64"))
+
+    def select(self, params):
+        lo, hi = 0, len(self.time)
+        if "starttime" in params:
+            lo = int(np.searchsorted(self.time, self._ms(params["starttime"]), side="left"))
+        if "endtime" in params:
+            hi = int(np.searchsorted(self.time, self._ms(params["endtime"]), side="right"))
+        rows = np.arange(lo, max(lo, hi))
+        if "minmagnitude" in params:
+            rows = rows[self.mag[rows] >= float(params["minmagnitude"])]
+        if "updatedafter" in params:
+            rows = rows[self.updated[rows] > self._ms(params["updatedafter"])]
+        if params.get("orderby", "time") == "time":
+            rows = rows[::-1]
+        if "limit" in params:
+            rows = rows[:int(params["limit"])]
+        return rows
+
+    def body(self, rows):
+        features = synthetic.features(self.frame.iloc[rows])
+        payload = {
+            "type": "FeatureCollection",
+            "metadata": {"generated": int(time.time() * 1000), "status": 200, "api": "1.14.1", "count": len(rows)},
+            "features": list(features),
+        }
+        return json.dumps(payload).encode()
+
+    def gzip_body(self, rows, etag):
+        with self.lock:
+            body = self.bodies.get(etag)
+            if body is not None:
+                self.bodies.move_to_end(etag)
+                return body
+        body = gzip.compress(self.body(rows), compresslevel=1)
+        with self.lock:
+            self.bodies[etag] = body
+            self.cached_bytes += len(body)
+            while self.cached_bytes > self.cache_bytes and self.bodies:
+                self.cached_bytes -= len(self.bodies.popitem(last=False)[1])
+        return body
+
+    def etag(self, rows):
+        return '"' + hashlib.sha1(f"{self.version}:{rows[:1]}:{rows[-1:]}:{len(rows)}".encode()).hexdigest() + '"'
+
+    def last_modified(self, rows):
+        newest = int(self.updated[rows].max()) / 1000 if len(rows) else 0
+        return email.utils.formatdate(newest, usegmt=True)
+
+
+def make_handler(catalogue, max_events=FDSN_MAX_EVENTS, latency_ms=0, error_rate=0.0, fail_first=0):
+    # fail_first: the first attempts at every distinct request get 429, then 503, ... (deterministic retries)
+    attempts, lock = {}, threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real service
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            if error_rate and random.random() < error_rate:
+                return self._send(503, b"Service Unavailable", "text/plain")
+            if fail_first:
+                with lock:
+                    attempt = attempts[self.path] = attempts.get(self.path, 0) + 1
+                if attempt <= fail_first:
+                    if attempt % 2:
+                        return self._send(429, b"Too Many Requests", "text/plain")
+                    return self._send(503, b"Service Unavailable", "text/plain")
+            try:
+                rows = catalogue.select(params)
+            except ValueError as exc:
+                return self._send(400, f"Error 400: Bad Request\n\n{exc}\n".encode(), "text/plain")
+
+            if url.path.endswith("/count"):
+                if params.get("format") == "geojson":
+                    return self._send(200, json.dumps({"count": len(rows), "maxAllowed": max_events}).encode())
+                return self._send(200, str(len(rows)).encode(), "text/plain")
+            if not url.path.endswith("/query"):
+                return self._send(404, b"Not Found", "text/plain")
+            if len(rows) > max_events:
+                message = (f"Error 400: Bad Request\n\n{len(rows)} matching events exceeds search limit of "
+                           f"{max_events}. Modify the search to match fewer events.\n")
+                return self._send(400, message.encode(), "text/plain")
+
+            etag = catalogue.etag(rows)
+            headers = {"ETag": etag, "Last-Modified": catalogue.last_modified(rows)}
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, b"", headers=headers)
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+                return self._send(200, catalogue.gzip_body(rows, etag), headers=headers)
+            self._send(200, catalogue.body(rows), headers=headers)
+
+        def _send(self, status, body, content_type="application/json", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(rows, seed=42, host="127.0.0.1", port=0, latency_ms=0, error_rate=0.0, fail_first=0, ready=None):
+    # blocks; `ready` (a queue) receives the base URL once the catalogue is built and the socket is bound
+    catalogue = Catalogue(rows, seed)
+    handler = make_handler(catalogue, latency_ms=latency_ms, error_rate=error_rate, fail_first=fail_first)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    base = f"http://{host}:{server.server_port}/fdsnws/event/1"
+    if ready is not None:
+        ready.put(base)
+    else:
+        print(f"🛰️ Stub FDSN serving {rows} events at {base}/query and {base}/count")
+    server.serve_forever()
+
+
+def start(rows, seed=42, latency_ms=0, error_rate=0.0, fail_first=0):
+    """
+    Run the stub in a child process (so it doesn't share the client's GIL).
+    Returns (process, base_url); stop it with process.terminate().
+    """
+    ctx = mp.get_context("spawn")
+    ready = ctx.Queue()
+    proc = ctx.Process(target=serve, args=(rows, seed), daemon=True,
+                       kwargs={"latency_ms": latency_ms, "error_rate": error_rate, "fail_first": fail_first,
+                               "ready": ready})
+    proc.start()
+    return proc, ready.get()
+
+
+def start_thread(rows, seed=42, **kwargs):
+    # in-process variant for quick checks; returns (server, base_url)
+    catalogue = Catalogue(rows, seed)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(catalogue, **kwargs))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/fdsnws/event/1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub FDSN event service")
+    parser.add_argument("--size", choices=list(synthetic.SIZES), default="10k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--fail-first", type=int, default=0, help="attempts per request answered 429/503 first")
+    args = parser.parse_args()
+    serve(synthetic.SIZES[args.size], args.seed, args.host, args.port, args.latency_ms, args.error_rate,
+          args.fail_first)
@@ -0,0 +1,312 @@
+# synthetic.py
+# Realistic synthetic USGS catalogues (raw frames, GeoJSON, partitioned datasets) for benchmarks and the stub server.
+# Run: python synthetic.py --size 1M --geojson ../data/synthetic_1M.geojson
+#      python synthetic.py --size 1M --dataset     (raw + cleaned datasets under ../data)
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+from config import STARTTIME, ENDTIME, MIN_MAGNITUDE
+import clean_data
+import fetch_api
+import geocode
+import storage
+
+SIZES = {"10k": 10_000, "1M": 1_000_000, "10M": 10_000_000}
+
+B_VALUE = 1.0               # Gutenberg-Richter b: ten times fewer events per magnitude unit
+MAX_MAGNITUDE = 9.5
+AFTERSHOCK_SHARE = 0.35     # events that belong to an aftershock sequence
+OMORI_C_DAYS = 0.05         # modified Omori law, rate ~ 1 / (c + t)^p
+OMORI_P = 1.1
+MAX_AFTERSHOCK_DAYS = 365
+ZONES = 300                 # seismic source zones: coastal (subduction-like) plus mid-ocean
+ZONE_SPREAD_DEG = 1.5
+CHUNK_ROWS = 500_000
+
+COMPASS = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
+SYLLABLES = ["ka", "lo", "mi", "ta", "ran", "su", "pe", "no", "vi", "hu", "ba", "sen", "to", "ri", "an", "ya"]
+OCEAN_REGIONS = [
+    "Mid-Atlantic Ridge", "South Sandwich Islands region", "Fiji region", "Kermadec Islands region",
+    "central East Pacific Rise", "Southwest Indian Ridge", "Carlsberg Ridge", "Macquarie Island region",
+    "Pacific-Antarctic Ridge", "Easter Island region",
+]
+
+# share of missing values per raw column, close to the M4.5+ feed
+MISSING = {"nst": 0.40, "dmin": 0.04, "rms": 0.001, "gap": 0.02, "magError": 0.35,
+           "depthError": 0.02, "magNst": 0.30}
+
+
+def _epoch_ms(value):
+    return int(np.datetime64(value, "ms").astype("int64"))
+
+
+def _zones(rng):
+    # zone centres on coastlines (where most large events are) and along ocean ridges
+    geocoder = geocode.get_geocoder()
+    coastal = int(ZONES * 0.85)
+    picks = rng.choice(len(geocoder.vertices), coastal, replace=False)
+    lat = np.r_[geocoder.vertices[picks, 0], rng.uniform(-60, 60, ZONES - coastal)]
+    lon = np.r_[geocoder.vertices[picks, 1], rng.uniform(-180, 180, ZONES - coastal)]
+    countries = list(geocoder.countries[geocoder.vertices[picks, 2].astype(int)])
+    countries += [OCEAN_REGIONS[k % len(OCEAN_REGIONS)] for k in range(ZONES - coastal)]
+    # a few zones produce most of the events
+    weight = rng.pareto(1.2, ZONES) + 0.05
+    towns = [[("".join(rng.choice(SYLLABLES, rng.integers(2, 4)))).capitalize() for _ in range(5)]
+             for _ in range(ZONES)]
+    return {"lat": lat, "lon": lon, "weight": weight / weight.sum(), "country": countries,
+            "ocean": np.arange(ZONES) >= coastal, "towns": towns}
+
+
+def _magnitudes(rng, n):
+    mag = MIN_MAGNITUDE + rng.exponential(1 / (B_VALUE * np.log(10)), n)
+    return np.round(np.minimum(mag, MAX_MAGNITUDE), 1)
+
+
+def _depths(rng, n):
+    # ~20% at the 10 km default depth, crustal/interface, intermediate and deep (300-700 km) slabs
+    kind = rng.choice(5, n, p=[0.20, 0.03, 0.45, 0.25, 0.07])
+    depth = np.select(
+        [kind == 0, kind == 1, kind == 2, kind == 3],
+        [np.full(n, 10.0), np.full(n, 35.0), rng.lognormal(np.log(25), 0.5, n),
+         70 + rng.exponential(60, n)],
+        default=rng.normal(550, 80, n),
+    )
+    return np.round(np.clip(depth, 0, 700), 3)
+
+
+def events(rows, seed=42, start=STARTTIME, end=ENDTIME):
+    """
+    The catalogue skeleton, sorted by time: time_ms, latitude, longitude,
+    depth_km, mag, zone, plus `parent` (row of the mainshock for aftershocks, -1 otherwise).
+
+    Mainshocks are spread over the period and over weighted source zones, with
+    Gutenberg-Richter magnitudes and a realistic depth mix. Aftershocks follow
+    their mainshock in time (modified Omori law), cluster within a rupture length
+    of it and are more numerous after larger events.
+    """
+    rng = np.random.default_rng(seed)
+    t0, t1 = _epoch_ms(start), _epoch_ms(end)
+    zones = _zones(rng)
+    n_after = int(rows * AFTERSHOCK_SHARE)
+    n_main = rows - n_after
+
+    zone = rng.choice(ZONES, n_main, p=zones["weight"])
+    lat = zones["lat"][zone] + rng.normal(0, ZONE_SPREAD_DEG, n_main)
+    lon = zones["lon"][zone] + rng.normal(0, ZONE_SPREAD_DEG, n_main) / np.maximum(np.cos(np.radians(lat)), 0.2)
+    time = rng.integers(t0, t1, n_main)
+    mag = _magnitudes(rng, n_main)
+    depth = _depths(rng, n_main)
+
+    # productivity grows with magnitude (alpha ~ b)
+    productivity = 10 ** (B_VALUE * (mag - MIN_MAGNITUDE))
+    parent = rng.choice(n_main, n_after, p=productivity / productivity.sum())
+    # inverse-CDF sample of a truncated modified Omori law
+    u = rng.random(n_after)
+    tmax = MAX_AFTERSHOCK_DAYS + OMORI_C_DAYS
+    q = 1 - OMORI_P
+    days = (OMORI_C_DAYS ** q + u * (tmax ** q - OMORI_C_DAYS ** q)) ** (1 / q) - OMORI_C_DAYS
+    after_time = time[parent] + (days * 86_400_000).astype("int64") + 1
+    late = after_time >= t1
+    after_time[late] = rng.integers(t0, t1, late.sum())
+    # within about one rupture length (Wells & Coppersmith) of the mainshock
+    rupture_km = 10 ** (0.5 * mag[parent] - 1.85)
+    dist = rng.exponential(rupture_km)
+    bearing = rng.uniform(0, 2 * np.pi, n_after)
+    after_lat = lat[parent] + dist * np.cos(bearing) / 111.2
+    after_lon = lon[parent] + dist * np.sin(bearing) / (111.2 * np.maximum(np.cos(np.radians(lat[parent])), 0.2))
+    after_mag = np.maximum(np.minimum(_magnitudes(rng, n_after), mag[parent] - 0.1), MIN_MAGNITUDE)
+    after_depth = np.round(np.clip(depth[parent] + rng.normal(0, 5, n_after), 0, 700), 3)
+
+    out = {
+        "time_ms": np.r_[time, after_time],
+        "latitude": np.r_[lat, after_lat],
+        "longitude": np.r_[lon, after_lon],
+        "depth_km": np.r_[depth, after_depth],
+        "mag": np.r_[mag, after_mag],
+        "zone": np.r_[zone, zone[parent]],
+        # aftershocks that would fall after `end` were moved to a random time: no longer tied to a parent
+        "parent": np.r_[np.full(n_main, -1), np.where(late, -1, parent)],
+    }
+    out["latitude"] = np.round(np.clip(out["latitude"], -89.9, 89.9), 4)
+    out["longitude"] = np.round((out["longitude"] + 180) % 360 - 180, 4)
+    order = np.argsort(out["time_ms"], kind="stable")
+    rank = np.empty(rows, dtype=np.int64)
+    rank[order] = np.arange(rows)
+    out = {key: values[order] for key, values in out.items()}
+    out["parent"] = np.where(out["parent"] >= 0, rank[np.maximum(out["parent"], 0)], -1)
+    out["zones"] = zones
+    return out
+
+
+def _sparse(rng, values, rate):
+    values = values.astype("float64")
+    values[rng.random(len(values)) < rate] = np.nan
+    return values
+
+
+def _frame(skeleton, lo, hi, rng, end_ms):
+    # raw columns (fetch_api.FIELDS layout, epoch-ms times) for skeleton rows lo:hi
+    n = hi - lo
+    zones = skeleton["zones"]
+    time = skeleton["time_ms"][lo:hi]
+    mag = skeleton["mag"][lo:hi]
+    zone = skeleton["zone"][lo:hi]
+    big = mag >= 5.5
+
+    net = rng.choice(["us", "ak", "pt", "at", "ci", "nc", "hv"], n, p=[.9, .03, .02, .02, .01, .01, .01])
+    code = [f"{0x70000000 + i:08x}" for i in range(lo, hi)]
+    ids = [f"{a}{b}" for a, b in zip(net, code)]
+
+    mag_type = np.where(
+        big, rng.choice(["mww", "mwc", "mwb", "mb"], n, p=[.85, .05, .05, .05]),
+        np.where(mag >= 5.0, rng.choice(["mb", "mww", "mwr", "ms_20"], n, p=[.45, .35, .15, .05]),
+                 rng.choice(["mb", "mwr", "mww", "ml"], n, p=[.8, .1, .05, .05])))
+
+    offshore = zones["ocean"][zone]
+    town = rng.integers(0, 5, n)
+    dist = rng.integers(1, 300, n)
+    heading = rng.integers(0, 16, n)
+    place = [
+        zones["country"][z] if ocean else
+        f"{d} km {COMPASS[h]} of {zones['towns'][z][t]}, {zones['country'][z]}"
+        for z, ocean, t, d, h in zip(zone, offshore, town, dist, heading)
+    ]
+
+    # recent events are still automatic, older ones reviewed
+    recent = time > end_ms - 14 * 86_400_000
+    status = np.where(recent | (rng.random(n) < 0.005), "automatic", "reviewed")
+    tsunami_p = np.where((mag >= 7) & (skeleton["depth_km"][lo:hi] < 100), 0.6, np.where(mag >= 6.5, 0.15, 0.005))
+    types = np.where(
+        big, rng.choice([",dyfi,losspager,moment-tensor,origin,phase-data,shakemap,",
+                         ",losspager,moment-tensor,origin,phase-data,shakemap,"], n),
+        rng.choice([",origin,phase-data,", ",dyfi,origin,phase-data,", ",moment-tensor,origin,phase-data,"],
+                   n, p=[.7, .2, .1]))
+
+    return pd.DataFrame({
+        "id": ids,
+        "time": time,
+        "updated": time + (rng.lognormal(np.log(3 * 86_400_000), 1.5, n)).astype("int64"),
+        "mag": mag,
+        "magType": mag_type,
+        "place": place,
+        "type": rng.choice(["earthquake", "explosion", "volcanic eruption", "mining explosion"],
+                           n, p=[.996, .002, .001, .001]),
+        "status": status,
+        "tsunami": (rng.random(n) < tsunami_p).astype("int64"),
+        "sig": np.round(mag * 100 * mag / 6.5).astype("int64") + rng.integers(0, 40, n),
+        "net": net,
+        "nst": _sparse(rng, np.round(rng.lognormal(np.log(40 + 60 * (mag - 4.5)), 0.6, n)), MISSING["nst"]),
+        "dmin": _sparse(rng, np.round(np.exp(rng.uniform(np.log(0.3), np.log(25), n)), 3), MISSING["dmin"]),
+        "rms": _sparse(rng, np.round(np.clip(rng.normal(0.8, 0.25, n), 0.05, 2.5), 2), MISSING["rms"]),
+        "gap": _sparse(rng, np.round(np.clip(rng.gamma(3, 20, n) + 40 * offshore, 8, 300)), MISSING["gap"]),
+        "magError": _sparse(rng, np.round(rng.uniform(0.03, 0.15, n), 3), MISSING["magError"]),
+        "depthError": _sparse(rng, np.round(rng.uniform(1.5, 10, n), 1), MISSING["depthError"]),
+        "magNst": _sparse(rng, np.round(rng.lognormal(np.log(60), 0.7, n)), MISSING["magNst"]),
+        "locationSource": net,
+        "magSource": net,
+        "types": types,
+        "ids": [f",{i}," for i in ids],
+        "sources": [f",{s}," for s in net],
+        "latitude": skeleton["latitude"][lo:hi],
+        "longitude": skeleton["longitude"][lo:hi],
+        "depth_km": skeleton["depth_km"][lo:hi],
+    })
+
+
+def iter_raw_frames(rows, seed=42, chunk=CHUNK_ROWS, start=STARTTIME, end=ENDTIME):
+    # raw frames of at most `chunk` rows, in time order; only the skeleton is held for the whole catalogue
+    skeleton = events(rows, seed, start, end)
+    end_ms = _epoch_ms(end)
+    for lo in range(0, rows, chunk):
+        rng = np.random.default_rng([seed, lo])
+        yield _frame(skeleton, lo, min(lo + chunk, rows), rng, end_ms)
+
+
+def raw_frame(rows, seed=42, start=STARTTIME, end=ENDTIME):
+    # the whole raw catalogue as fetch_simple() would return it
+    return pd.concat(list(iter_raw_frames(rows, seed, start=start, end=end)), ignore_index=True)
+
+
+def clean_frame(rows, seed=42):
+    return clean_data.clean_frame(raw_frame(rows, seed))
+
+
+def features(frame):
+    """
+    GeoJSON Feature dicts for raw rows, with the properties the USGS feed has
+    beyond fetch_api.FIELDS (title, url, code, alert, felt, ...) so parsers see real payloads.
+    """
+    fields = [(src, kind) for _, src, kind in fetch_api.FIELDS[1:] if not isinstance(src, int)]
+    props = [src for src, _ in fields]
+    columns = []
+    for name, kind in fields:
+        values = frame[name]
+        if kind == "int" and values.dtype.kind == "f":
+            values = values.astype("Int64")
+        # plain Python values (None for missing), as json.dumps wants them
+        values = values.astype(object).where(values.notna(), None) if values.hasnans else values
+        columns.append(values.tolist())
+    coords = frame[["longitude", "latitude", "depth_km"]].to_numpy(dtype="float64").tolist()
+    draw = np.random.default_rng(len(frame)).random(len(frame)).tolist()
+
+    for event_id, values, xyz, u in zip(frame["id"].tolist(), zip(*columns), coords, draw):
+        p = dict(zip(props, values))
+        mag, types = p["mag"], p["types"]
+        url = f"https://earthquake.usgs.gov/earthquakes/eventpage/{event_id}"
+        p.update({
+            "title": f"M {mag} - {p['place']}",
+            "code": event_id[2:],
+            "url": url,
+            "detail": url + ".geojson",
+            "tz": None,
+            "felt": int(u * 500) if "dyfi" in types else None,
+            "cdi": round(2 + u * 5, 1) if "dyfi" in types else None,
+            "mmi": round(3 + (mag - 5) * 1.5, 3) if "shakemap" in types else None,
+            "alert": (None if "losspager" not in types else "green" if u < 0.9 or mag < 6.5 else
+                      "yellow" if u < 0.97 else "orange" if u < 0.995 else "red"),
+        })
+        yield {"type": "Feature", "properties": p, "geometry": {"type": "Point", "coordinates": xyz}, "id": event_id}
+
+
+def write_geojson(path, rows, seed=42):
+    # a USGS-shaped FeatureCollection, written chunk by chunk
+    with open(path, "w") as fh:
+        fh.write('{"type":"FeatureCollection","metadata":{"generated":0,"title":"USGS Earthquakes",'
+                 '"status":200,"api":"1.14.1","count":%d},"features":[' % rows)
+        first = True
+        for frame in iter_raw_frames(rows, seed):
+            for feature in features(frame):
+                if not first:
+                    fh.write(",")
+                fh.write(json.dumps(feature))
+                first = False
+        fh.write("]}")
+
+
+def write_datasets(rows, seed=42, clean=True, chunk=CHUNK_ROWS):
+    """
+    Save the raw catalogue through the storage layer (RAW_DATASET or RAW_CSV)
+    and, with `clean`, its cleaned version via basic_clean's chunked path.
+    """
+    for k, frame in enumerate(iter_raw_frames(rows, seed, chunk=chunk)):
+        storage.save_raw(frame, append=k > 0)
+    if clean:
+        clean_data.basic_clean(chunksize=chunk)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic USGS catalogues")
+    parser.add_argument("--size", choices=list(SIZES), default="10k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--geojson", default=None, help="write a FeatureCollection to this path")
+    parser.add_argument("--dataset", action="store_true", help="write the raw and cleaned datasets under ../data")
+    args = parser.parse_args()
+
+    if args.geojson:
+        write_geojson(args.geojson, SIZES[args.size], args.seed)
+        print(f"✅ {SIZES[args.size]} features -> {args.geojson}")
+    if args.dataset:
+        write_datasets(SIZES[args.size], args.seed)
+        print(f"✅ {SIZES[args.size]} events -> raw and cleaned datasets")
@@ -0,0 +1,21 @@
+# tests/conftest.py
+# The modules live at the repo root and resolve their data paths (../data/...) against the working
+# directory, so every test runs from a scratch <tmp>/run directory with its own ../data.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="module")
+def workdir(tmp_path_factory):
+    run_dir = tmp_path_factory.mktemp("pipeline") / "run"
+    run_dir.mkdir()
+    previous = os.getcwd()
+    os.chdir(run_dir)
+    try:
+        yield run_dir
+    finally:
+        os.chdir(previous)
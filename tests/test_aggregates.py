@@ -0,0 +1,60 @@
+# tests/test_aggregates.py
+# The cubes and the tile pyramid updated incrementally (run_all(incremental=True)) against a full rebuild.
+import numpy as np
+import pandas as pd
+
+import aggregates
+import clean_data
+import storage
+import synthetic
+import tiles
+
+
+def _loads():
+    # two consecutive loads: the second adds events with larger rms/gap, which moves the median those
+    # columns are filled with, and revises a few of the first load's events
+    raw = synthetic.raw_frame(6000, seed=11)
+    first = clean_data.clean_frame(raw.iloc[:4000].copy())
+    second = raw.copy()
+    second.loc[4000:, ["rms", "gap"]] += [1.0, 100.0]
+    revised = second.index[:4000:50]
+    second.loc[revised, "mag"] += 0.3
+    second.loc[revised, "updated"] += 60_000
+    second = clean_data.clean_frame(second)
+    return first, second
+
+
+def _same(incremental, full, dims):
+    incremental = incremental.sort_values(dims).reset_index(drop=True)
+    full = full.sort_values(dims).reset_index(drop=True)
+    pd.testing.assert_frame_equal(incremental[full.columns], full, check_dtype=False, rtol=1e-9, atol=1e-6)
+
+
+def test_incremental_cubes_match_rebuild(workdir):
+    first, second = _loads()
+    # run_all's previous load comes back from the cleaned dataset; only the changed rows are re-applied
+    storage.save_clean(first)
+    first = storage.load_clean()
+    added, removed = aggregates.diff_loads(first, second)
+    assert len(added) < len(second) / 2 and len(removed) < len(first) / 10
+    aggregates.refresh_cubes(first)
+    cube, time_cube = aggregates.refresh_cubes(second, previous=first)
+    _same(cube, aggregates.build_cube(second), aggregates.DIMENSIONS)
+    _same(time_cube, aggregates.build_time_cube(second), aggregates.TIME_DIMENSIONS)
+
+
+def test_incremental_tiles_match_rebuild(workdir):
+    first, second = _loads()
+    tiles.refresh_tiles(first)
+    pyramid = tiles.refresh_tiles(second, previous=first)
+    full = tiles.build_pyramid(second)
+    for zoom in full:
+        _same(pyramid[zoom], full[zoom], tiles.TILE_DIMENSIONS)
+
+
+def test_tile_avg_mag_skips_missing_magnitudes():
+    events = pd.DataFrame({"latitude": [10.0, 10.0, 10.0], "longitude": [20.0, 20.0, 20.0],
+                           "time": pd.to_datetime(["2024-01-05", "2024-01-06", "2024-01-07"]),
+                           "mag": [5.0, 6.0, np.nan]})
+    counts = tiles.tile_counts(tiles.build_pyramid(events, max_zoom=3)[3], 3)
+    assert counts["events"].tolist() == [3] and counts["avg_mag"].tolist() == [5.5]
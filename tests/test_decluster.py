@@ -0,0 +1,62 @@
+# tests/test_decluster.py
+# Gardner-Knopoff labels on a hand-built catalogue with known mainshocks, aftershocks and foreshocks.
+import numpy as np
+import pandas as pd
+
+import decluster
+
+KM_DEG = 111.2
+T0 = pd.Timestamp("2024-01-01")
+
+# id, days after T0, lat, lon, mag, expected cluster_id
+EVENTS = [
+    ("A", 0, 0.0, 0.0, 7.0, "A"),                     # mainshock: ~71 km, ~918 days
+    ("A1", 10, 20 / KM_DEG, 0.0, 5.0, "A"),
+    ("A2", 100, -50 / KM_DEG, 0.0, 6.0, "A"),         # large aftershock, claimed before it can claim
+    ("A3", -5, 10 / KM_DEG, 0.0, 5.5, "A3"),          # foreshock: stays independent
+    ("C", 20, 0.0, 100 / KM_DEG, 4.8, "C"),           # outside A's radius
+    ("D", 1000, 0.0, 0.0, 5.0, "D"),                  # outside A's time window
+    ("B", 5, 10.0, 10.0, 6.0, "B"),                   # a second, distant sequence
+    ("B1", 6, 10.0 + 5 / KM_DEG, 10.0, 4.6, "B"),
+    ("E1", 50, -20.0, -20.0, 5.0, "E1"),              # equal magnitudes: the earlier one is the mainshock
+    ("E2", 51, -20.0 + 5 / KM_DEG, -20.0, 5.0, "E1"),
+]
+
+
+def _catalogue():
+    return pd.DataFrame({
+        "id": [e[0] for e in EVENTS],
+        "time": [T0 + pd.Timedelta(days=e[1]) for e in EVENTS],
+        "latitude": [e[2] for e in EVENTS],
+        "longitude": [e[3] for e in EVENTS],
+        "mag": [e[4] for e in EVENTS],
+    })
+
+
+def test_gk_window():
+    km, days = decluster.gk_window([5.0, 7.0])
+    np.testing.assert_allclose(km, [39.9, 70.7], atol=0.1)
+    np.testing.assert_allclose(days, [143.7, 918.1], atol=0.1)
+
+
+def test_hand_built_sequences():
+    labels = decluster.decluster(_catalogue())
+    assert dict(zip(labels["id"], labels["cluster_id"])) == {e[0]: e[5] for e in EVENTS}
+    assert labels["mainshock"].tolist() == [int(e[0] == e[5]) for e in EVENTS]
+
+
+def test_order_and_bins_do_not_matter():
+    # the same labels whatever the row order, and with every event in one magnitude bin
+    df = _catalogue()
+    shuffled = df.sample(frac=1, random_state=3)
+    for frame, step in ((shuffled, 0.5), (df, 10.0)):
+        labels = decluster.decluster(frame, mag_step=step)
+        assert dict(zip(labels["id"], labels["cluster_id"])) == {e[0]: e[5] for e in EVENTS}
+
+
+def test_events_without_location_stand_alone():
+    df = _catalogue()
+    df.loc[df["id"] == "A1", "latitude"] = np.nan
+    labels = decluster.decluster(df).set_index("id")
+    assert labels.loc["A1", "cluster_id"] == "A1" and labels.loc["A1", "mainshock"] == 1
+    assert labels.loc["A2", "cluster_id"] == "A"
@@ -0,0 +1,156 @@
+# tests/test_fetch.py
+# incremental fetch checkpoints, and fetch_simple against the stub FDSN server.
+import functools
+import json
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+import fetch_api
+import instrument
+import storage
+import stub_fdsn
+import synthetic
+
+
+def test_resume_from_run_start_minus_margin():
+    # a late-indexed event can carry an `updated` older than max(updated); resume from before the last run
+    newest = datetime(2025, 6, 1, 11, 59, tzinfo=timezone.utc)
+    checkpoint = {"last_fetch": "2025-06-01T12:00:00", "max_updated": int(newest.timestamp() * 1000)}
+    assert fetch_api.resume_from(checkpoint, margin_minutes=60) == datetime(2025, 6, 1, 11, 0, tzinfo=timezone.utc)
+
+
+def test_resume_from_keeps_an_older_high_water_mark():
+    old = datetime(2025, 5, 1, tzinfo=timezone.utc)
+    checkpoint = {"last_fetch": "2025-06-01T12:00:00", "max_updated": int(old.timestamp() * 1000)}
+    assert fetch_api.resume_from(checkpoint, margin_minutes=60) == old
+    # checkpoints written before last_fetch was read still work
+    assert fetch_api.resume_from({"max_updated": int(old.timestamp() * 1000)}) == old
+
+
+def test_checkpoint_records_run_start(tmp_path):
+    started = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+    frame = pd.DataFrame({"updated": [1, 5, 3]})
+    checkpoint = fetch_api.save_checkpoint(frame, tmp_path / "checkpoint.json", started=started)
+    assert checkpoint == {"last_fetch": "2025-06-01T12:00:00", "max_updated": 5}
+    assert fetch_api.load_checkpoint(tmp_path / "checkpoint.json") == checkpoint
+
+
+def test_concurrent_fetch_retries_against_stub(workdir, monkeypatch):
+    # every window is answered 429, then 503, before it succeeds: the pool must retry its way to the whole catalogue
+    rows = 2000
+    stub, base_url = stub_fdsn.start(rows, fail_first=2)
+    # fetch_simple's windows with a short backoff, so the retries don't take seconds each
+    monkeypatch.setattr(fetch_api, "fetch_window", functools.partial(fetch_api.fetch_window, backoff=0.01))
+    try:
+        with instrument.RunReport("test", report_dir="../reports") as run:
+            with run.stage("fetch"):
+                df = fetch_api.fetch_simple(concurrent=True, workers=4, url=f"{base_url}/query",
+                                            count_url=f"{base_url}/count", rate=50.0, save=False, cache=False)
+        # the one-window-at-a-time path against the same catalogue (its windows already failed twice)
+        sequential = fetch_api.fetch_simple(concurrent=False, url=f"{base_url}/query",
+                                            count_url=f"{base_url}/count", rate=50.0, save=False, cache=False)
+    finally:
+        stub.terminate()
+
+    catalogue = synthetic.raw_frame(rows)
+    assert len(df) == rows
+    assert set(df["id"]) == set(catalogue["id"])
+    pd.testing.assert_frame_equal(df, sequential)
+
+    windows = len(fetch_api.month_windows())
+    http = run.stages[0]["http"]
+    assert http["status"] == {"429": windows, "503": windows, "200": windows}
+    assert http["failed"] == 2 * windows
+
+
+def test_failed_windows_keep_the_stored_catalogue(workdir, monkeypatch):
+    # every window fails more times than it is retried: nothing may replace the raw dataset already stored
+    stored = synthetic.raw_frame(500, seed=3)
+    storage.save_raw(stored)
+    stub, base_url = stub_fdsn.start(2000, fail_first=2)
+    monkeypatch.setattr(fetch_api, "fetch_window",
+                        functools.partial(fetch_api.fetch_window, retries=1, backoff=0.01))
+    try:
+        with pytest.raises(RuntimeError, match="windows failed"):
+            fetch_api.fetch_simple(concurrent=True, workers=4, url=f"{base_url}/query",
+                                   count_url=f"{base_url}/count", rate=0, cache=False)
+    finally:
+        stub.terminate()
+
+    assert set(storage.load_raw(columns=["id"])["id"]) == set(stored["id"])
+
+
+def test_incremental_keeps_checkpoint_when_a_window_fails(workdir, monkeypatch, tmp_path):
+    stored = synthetic.raw_frame(500, seed=3)
+    storage.save_raw(stored)
+    path = tmp_path / "checkpoint.json"
+    since = datetime(2021, 6, 1, tzinfo=timezone.utc)
+    checkpoint = {"last_fetch": "2021-06-01T00:00:00", "max_updated": int(since.timestamp() * 1000)}
+    path.write_text(json.dumps(checkpoint))
+    # counts get through on their third attempt, the window itself is only tried twice
+    monkeypatch.setattr(fetch_api, "get_with_retry", functools.partial(fetch_api.get_with_retry, backoff=0.01))
+    monkeypatch.setattr(fetch_api, "fetch_window",
+                        functools.partial(fetch_api.fetch_window, retries=1, backoff=0.01))
+
+    for fail_first in (2, 0):
+        stub, base_url = stub_fdsn.start(2000, fail_first=fail_first)
+        try:
+            df = fetch_api.fetch_incremental(url=f"{base_url}/query", count_url=f"{base_url}/count",
+                                             rate=0, checkpoint_path=path)
+        finally:
+            stub.terminate()
+        if fail_first:
+            assert fetch_api.load_checkpoint(path) == checkpoint
+            assert set(df["id"]) == set(stored["id"])
+
+    # once the window arrives, the events it held are merged and the checkpoint moves on
+    assert fetch_api.load_checkpoint(path)["last_fetch"] > checkpoint["last_fetch"]
+    assert len(df) > len(stored)
+
+
+def test_plan_splits_dense_windows_and_merges_quiet_ones(workdir):
+    # a cap just under the busiest month: the stub answers 400 for that month as a single query
+    rows = 2000
+    catalogue = synthetic.raw_frame(rows)
+    monthly = pd.to_datetime(catalogue["time"], unit="ms").dt.to_period("M").value_counts()
+    cap = int(monthly.max()) - 1
+    server, base_url = stub_fdsn.start_thread(rows, max_events=cap)
+    try:
+        session = fetch_api.make_session()
+        plan = fetch_api.plan_windows(session=session, count_url=f"{base_url}/count", max_events=cap)
+        assert all(n is not None and n <= cap for _, _, n in plan)
+        # the busiest month is split, quiet months are fetched together
+        months = fetch_api.month_windows()
+        assert len(plan) < len(months)
+        lengths = [pd.Timestamp(end) - pd.Timestamp(start) for start, end, _ in plan]
+        assert min(lengths) < pd.Timedelta(days=28) and max(lengths) > pd.Timedelta(days=62)
+
+        fetched = [fetch_api.fetch_window(session, start, end, url=f"{base_url}/query") for start, end, _ in plan]
+        session.close()
+    finally:
+        server.shutdown()
+    assert all(cols is not None for cols in fetched)
+    ids = pd.concat([cols.to_frame()["id"] for cols in fetched])
+    assert set(ids) == set(catalogue["id"])
+
+
+def test_merge_quiet_keeps_windows_under_target():
+    plan = [("a", "b", 10), ("b", "c", 5), ("c", "d", 30), ("d", "e", 4), ("e", "f", None), ("f", "g", 1)]
+    assert fetch_api.merge_quiet(plan, 20) == [("a", "c", 15), ("c", "d", 30), ("d", "e", 4), ("e", "f", None),
+                                               ("f", "g", 1)]
+
+
+def test_stdlib_stream_parser_matches_json_load(tmp_path):
+    # tiny read sizes put chunk boundaries inside keys, strings and numbers
+    path = tmp_path / "events.geojson"
+    synthetic.write_geojson(path, 300, seed=4)
+    with open(path) as fh:
+        expected = fetch_api.parse_features(json.load(fh)).to_frame()
+    for chunk in (1, 7, 4096):
+        with open(path, "rb") as fh:
+            cols = fetch_api.FeatureColumns()
+            for feature in fetch_api.iter_features(fh, chunk=chunk):
+                cols.add(feature)
+        pd.testing.assert_frame_equal(cols.to_frame(), expected)
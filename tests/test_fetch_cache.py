@@ -0,0 +1,102 @@
+# tests/test_fetch_cache.py
+# fetch_simple resuming from the window cache against the stub FDSN server, revalidation of recent
+# windows, and least-recently-used eviction.
+import gzip
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+import fetch_api
+import instrument
+import stub_fdsn
+from fetch_cache import WindowCache
+
+ROWS = 2000
+
+
+@pytest.fixture(scope="module")
+def stub():
+    server, base_url = stub_fdsn.start_thread(ROWS)
+    yield base_url
+    server.shutdown()
+
+
+def _fetch(base_url, cache):
+    with instrument.RunReport("test", report_dir="../reports") as run:
+        with run.stage("fetch"):
+            df = fetch_api.fetch_simple(url=f"{base_url}/query", rate=0, save=False, cache=cache)
+    return df, run.stages[0].get("http", {}).get("status", {})
+
+
+def test_resume_downloads_only_missing_windows(workdir, stub, tmp_path):
+    windows = len(fetch_api.month_windows())
+    first, _ = _fetch(stub, WindowCache(directory=tmp_path))
+    assert len(first) == ROWS
+
+    # an interrupted run: three windows never made it into the cache
+    for name in sorted(name for name in os.listdir(tmp_path) if name.endswith(".json"))[:3]:
+        os.remove(tmp_path / name)
+    cache = WindowCache(directory=tmp_path)
+    second, status = _fetch(stub, cache)
+    assert cache.summary() == {"hits": windows - 3, "revalidated": 0, "downloaded": 3}
+    assert status == {"200": 3}
+    assert list(second["id"]) == list(first["id"])
+
+
+def test_unreadable_entries_are_downloaded_again(workdir, stub, tmp_path):
+    windows = len(fetch_api.month_windows())
+    first, _ = _fetch(stub, WindowCache(directory=tmp_path))
+    # one entry pickled by older code, whose class no longer exists, and one truncated
+    data = sorted(name for name in os.listdir(tmp_path) if name.endswith(".pkl.gz"))
+    with gzip.open(tmp_path / data[0], "wb") as fh:
+        fh.write(b"cfetch_api\nRemovedColumns\n.")
+    with open(tmp_path / data[1], "wb") as fh:
+        fh.write(b"\x1f\x8b")
+    cache = WindowCache(directory=tmp_path)
+    second, status = _fetch(stub, cache)
+    assert cache.summary() == {"hits": windows - 2, "revalidated": 0, "downloaded": 2}
+    assert status == {"200": 2}
+    assert list(second["id"]) == list(first["id"])
+
+
+def test_recent_windows_are_revalidated_after_ttl(workdir, stub, tmp_path):
+    windows = len(fetch_api.month_windows())
+    # nothing has settled yet and the TTL is over: every entry is asked about, and the stub answers 304
+    _fetch(stub, WindowCache(directory=tmp_path, settle_days=100_000, ttl_hours=0))
+    cache = WindowCache(directory=tmp_path, settle_days=100_000, ttl_hours=0)
+    df, status = _fetch(stub, cache)
+    assert len(df) == ROWS
+    assert cache.summary() == {"hits": 0, "revalidated": windows, "downloaded": 0}
+    assert status == {"304": windows}
+
+    # within the TTL they are reused without a request
+    cache = WindowCache(directory=tmp_path, settle_days=100_000, ttl_hours=1)
+    _, status = _fetch(stub, cache)
+    assert cache.summary()["hits"] == windows and status == {}
+
+
+def test_only_windows_past_the_settle_period_are_final(tmp_path):
+    cache = WindowCache(directory=tmp_path, settle_days=30)
+    now = datetime(2025, 6, 1, tzinfo=timezone.utc)
+    assert cache.settled("2025-04-30T23:59:59.999", now=now)
+    assert not cache.settled("2025-05-31T23:59:59.999", now=now)
+
+
+def test_evicts_least_recently_used(workdir, tmp_path):
+    cache = WindowCache(directory=tmp_path)
+    cols = fetch_api.FeatureColumns()
+    params = [{"starttime": f"2024-{month:02d}-01", "endtime": f"2024-{month:02d}-28"} for month in (1, 2, 3, 4)]
+    for age, p in enumerate(reversed(params)):
+        cache.store("http://stub/query", p, cols)
+        # January is the oldest entry, April the newest
+        data_path = cache._paths(cache.key("http://stub/query", p))[0]
+        os.utime(data_path, (1_000_000 - age * 1000, 1_000_000 - age * 1000))
+    # reading January makes February the least recently used
+    assert cache.load(cache.lookup("http://stub/query", params[0])) is not None
+
+    size = os.path.getsize(cache._paths(cache.key("http://stub/query", params[0]))[0])
+    cache.max_bytes = 2 * size
+    assert cache.evict() == 2
+    kept = [p["starttime"] for p in params if cache.lookup("http://stub/query", p) is not None]
+    assert kept == ["2024-01-01", "2024-04-01"]
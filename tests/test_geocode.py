@@ -0,0 +1,39 @@
+# tests/test_geocode.py
+# Reverse geocoding against the bundled Natural Earth boundaries at a few fixed points.
+import numpy as np
+
+import geocode
+
+POINTS = [
+    # (lat, lon, country, continent)
+    (48.86, 2.35, "France", "Europe"),                      # Paris
+    (35.68, 139.69, "Japan", "Asia"),                      # Tokyo
+    (-33.87, 151.21, "Australia", "Oceania"),              # Sydney
+    (-33.45, -70.67, "Chile", "South America"),            # Santiago
+    (40.71, -74.00, "United States of America", "North America"),
+    (-1.29, 36.82, "Kenya", "Africa"),                     # Nairobi
+    (38.30, 142.40, "Japan", "Asia"),                      # Tohoku offshore epicentre: nearest country
+    (0.0, -140.0, geocode.OCEAN, geocode.OCEAN),           # central Pacific, far from any coast
+    (np.nan, 10.0, geocode.UNKNOWN, geocode.UNKNOWN),
+]
+
+
+def test_fixed_points():
+    lat = np.array([p[0] for p in POINTS])
+    lon = np.array([p[1] for p in POINTS])
+    country, continent = geocode.reverse_geocode(lat, lon)
+    assert list(country) == [p[2] for p in POINTS]
+    assert list(continent) == [p[3] for p in POINTS]
+
+
+def test_cached_cells_give_the_same_answer():
+    # the second call is served from the per-cell memo
+    lat, lon = np.array([48.86, 35.68]), np.array([2.35, 139.69])
+    first = geocode.reverse_geocode(lat, lon)[0]
+    assert list(geocode.reverse_geocode(lat, lon)[0]) == list(first) == ["France", "Japan"]
+
+
+def test_lookup_table_covers_every_country():
+    table = geocode.country_continent()
+    assert table["country"].is_unique
+    assert dict(zip(table["country"], table["continent"]))["Kenya"] == "Africa"
@@ -0,0 +1,72 @@
+# tests/test_live_feed.py
+# LiveFeed's micro-batches, fed canned summary-feed responses instead of the USGS feed.
+import glob
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+import clean_data
+import fetch_api
+import live_feed
+import storage
+import synthetic
+from config import CLEAN_DATASET
+
+
+class FakeResponse:
+    def __init__(self, frame):
+        body = {"type": "FeatureCollection", "features": list(synthetic.features(frame))}
+        self.raw = io.BytesIO(json.dumps(body).encode())
+        self.status_code = 200
+        self.headers = {}
+
+    def close(self):
+        pass
+
+
+def test_revision_replaces_the_queued_version(workdir, tmp_path, monkeypatch):
+    raw = synthetic.raw_frame(50)
+    # one a minute over the last 50 minutes, inside the live window
+    raw["time"] = live_feed._now_ms() - 60_000 * np.arange(1, 51)
+    raw["updated"] = raw["time"] + 30_000
+    revised = raw.iloc[:5].copy()
+    revised["mag"] = revised["mag"] + 1.0
+    revised["updated"] = revised["updated"] + 60_000
+    polls = iter([raw, pd.concat([raw.iloc[5:], revised], ignore_index=True)])
+    monkeypatch.setattr(fetch_api, "get_with_retry", lambda *args, **kwargs: FakeResponse(next(polls)))
+
+    feed = live_feed.LiveFeed(batch_rows=1000, flush_seconds=3600, snapshot_dir=str(tmp_path / "live"))
+    assert feed.poll() == 50
+    assert feed.poll() == 5
+    assert feed.pending() == 50
+    assert feed.flush(force=True) == 50
+
+    stored = storage.load_raw()
+    assert stored["id"].is_unique and len(stored) == 50
+    stored = stored.set_index("id").loc[revised["id"]]
+    assert (stored["mag"].to_numpy() == revised["mag"].to_numpy()).all()
+    assert (pd.to_numeric(stored["updated"]).to_numpy() == revised["updated"].to_numpy()).all()
+    assert storage.load_clean()["id"].is_unique
+
+
+def test_batches_take_the_stored_integer_dtypes(workdir, tmp_path, monkeypatch):
+    # the stored data needs int16 for magNst; a batch of small values alone would pick int8
+    stored = synthetic.raw_frame(200, seed=3)
+    stored["magNst"] = 300.0
+    storage.save_raw(stored)
+    clean_data.basic_clean(workers=1)
+    live = synthetic.raw_frame(20, seed=4)
+    live["id"] = "live" + live["id"]
+    live["time"] = live_feed._now_ms() - 60_000 * np.arange(1, 21)
+    live["updated"] = live["time"] + 30_000
+    live["magNst"] = 5.0
+    monkeypatch.setattr(fetch_api, "get_with_retry", lambda *args, **kwargs: FakeResponse(live))
+
+    feed = live_feed.LiveFeed(batch_rows=1000, flush_seconds=3600, snapshot_dir=str(tmp_path / "live"))
+    assert feed.poll() == 20 and feed.flush(force=True) == 20
+    files = glob.glob(os.path.join(CLEAN_DATASET, "**", "*.parquet"), recursive=True)
+    assert {str(pq.read_schema(path).field("magNst").type) for path in files} == {"int16"}
@@ -0,0 +1,80 @@
+# tests/test_queries.py
+# Every registered query's pandas compute() against its analysis_queries.sql statement run by DuckDB,
+# on the same synthetic catalogue.
+import numpy as np
+import pandas as pd
+import pytest
+
+import decluster
+import queries
+import query_engine
+import storage
+import synthetic
+
+ROWS = 20_000
+
+pytestmark = pytest.mark.skipif(query_engine.duckdb is None, reason="needs duckdb")
+
+
+@pytest.fixture(scope="module")
+def catalogue(workdir):
+    # the USGS feed has no alert/casualties/economic_loss for most events; give some rows values
+    raw = synthetic.raw_frame(ROWS, seed=7)
+    rng = np.random.default_rng(7)
+    raw["alert"] = rng.choice(["green", "yellow", "orange", "red", None], ROWS, p=[.05, .02, .01, .005, .915])
+    raw["economic_loss"] = np.where(rng.random(ROWS) < 0.1, np.round(rng.lognormal(15, 2, ROWS)), np.nan)
+    raw["casualties"] = np.where(rng.random(ROWS) < 0.05, rng.integers(0, 500, ROWS), np.nan)
+    clean = synthetic.clean_data.clean_frame(raw)
+    storage.save_clean(clean)
+    decluster.refresh_clusters(clean)
+    return clean
+
+
+def _normalized(frame):
+    # one dtype per kind of value, so DuckDB's and the compact pandas frame's results compare equal
+    out = {}
+    for col in frame.columns:
+        values = frame[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.astype("datetime64[ns]")
+        elif pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values):
+            values = values.astype("float64")
+        else:
+            values = values.astype(object).where(values.notna(), None)
+        out[col] = values
+    out = pd.DataFrame(out)
+    return out.sort_values(list(out.columns), na_position="last", kind="stable").reset_index(drop=True)
+
+
+# LIMIT queries whose ORDER BY ties at the cut (clipped depths, NULL ratios, equal counts): which of the
+# tied rows make it is up to the engine, so only the ordered values are compared
+TIES = {"Q1": ["mag"], "Q2": ["depth_km"], "Q26": ["shallow_deep_ratio"], "Q28": ["error_score"],
+        "Q30": ["deep_count"]}
+
+
+@pytest.mark.parametrize("qid", list(queries.REGISTRY))
+def test_pandas_matches_sql(catalogue, qid):
+    sql = queries.run(qid, sql=True)
+    pandas = queries.run(qid, sql=False)
+    assert list(pandas.columns) == list(sql.columns)
+    if qid in TIES:
+        pandas, sql = pandas[TIES[qid]], sql[TIES[qid]]
+    # the registry holds coordinates as float32 (event_store.compact_frame, under a metre per coordinate),
+    # so Q29 distances agree to a few metres; the feed's own coordinates are only good to ~10 m
+    atol = 5e-3 if qid == "Q29" else 0.0
+    pd.testing.assert_frame_equal(_normalized(pandas), _normalized(sql), check_exact=False, rtol=1e-6, atol=atol)
+
+
+def test_registry_covers_the_sql():
+    assert list(queries.REGISTRY) == list(query_engine.load_queries())
+
+
+def test_default_path_keeps_prebuilt_structures(catalogue, monkeypatch):
+    # cube, token-set and indexed queries take their compute path unless SQL is asked for
+    ran = []
+    queries._RESULTS.clear()  # earlier tests memoized these
+    run_query = query_engine.run_query
+    monkeypatch.setattr(query_engine, "run_query", lambda qid, params: ran.append(qid) or run_query(qid, params))
+    for qid in ("Q1", "Q6", "Q16", "Q29", "Q31"):
+        queries.run(qid)
+    assert ran == ["Q1"]
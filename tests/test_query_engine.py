@@ -0,0 +1,28 @@
+# tests/test_query_engine.py
+# The per-thread DuckDB connection after the cleaned data or the cluster labels change on disk.
+import pytest
+
+import decluster
+import query_engine
+import storage
+import synthetic
+
+pytestmark = pytest.mark.skipif(query_engine.duckdb is None, reason="needs duckdb")
+
+
+def _count(table):
+    return query_engine.query(f"SELECT COUNT(*) AS n FROM {table}")["n"].iloc[0]
+
+
+def test_connection_follows_rewrites_and_new_labels(workdir):
+    clean = synthetic.clean_frame(3000, seed=9)
+    storage.save_clean(clean.iloc[:2000])
+    assert _count("earthquakes") == 2000
+    with pytest.raises(query_engine.duckdb.Error):
+        _count(decluster.CLUSTER_TABLE)
+
+    # a rewrite and a later declustering run, on the thread that already holds a connection
+    storage.save_clean(clean)
+    decluster.refresh_clusters(clean)
+    assert _count("earthquakes") == 3000
+    assert _count(decluster.CLUSTER_TABLE) == 3000
@@ -0,0 +1,63 @@
+# tests/test_save_mysql.py
+# save_dataframe's upserts against SQLite (the same ON CONFLICT path as benchmark.py db).
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import save_mysql
+import synthetic
+from config import TABLE_NAME
+
+
+def _count(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT COUNT(*), COUNT(DISTINCT id) FROM {TABLE_NAME}")).fetchone()
+
+
+def test_upsert_is_idempotent(workdir, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'keyed.db'}")
+    df = synthetic.clean_frame(500)
+    assert save_mysql.save_dataframe(df, engine, only_changed=False) == 500
+    assert save_mysql.save_dataframe(df, engine, only_changed=False) == 500
+    assert tuple(_count(engine)) == (500, 500)
+
+
+def test_unkeyed_table_is_refused(workdir, tmp_path):
+    # what the first version of the pipeline left behind: df.to_sql(..., if_exists="replace"), no PRIMARY KEY
+    engine = create_engine(f"sqlite:///{tmp_path / 'unkeyed.db'}")
+    df = synthetic.clean_frame(100)
+    df.astype({col: str for col in df.columns if df[col].dtype == "category"}).to_sql(TABLE_NAME, engine, index=False)
+    with pytest.raises(RuntimeError, match="PRIMARY KEY"):
+        save_mysql.save_dataframe(df, engine, only_changed=False)
+    assert tuple(_count(engine)) == (100, 100)
+
+
+def test_rerun_writes_only_rows_whose_values_changed(workdir, tmp_path):
+    # a new load re-fills and re-geocodes events whose `updated` stayed the same: those must be rewritten too
+    engine = create_engine(f"sqlite:///{tmp_path / 'diff.db'}")
+    df = synthetic.clean_frame(500)
+    assert save_mysql.save_dataframe(df, engine) == 500
+    assert save_mysql.save_dataframe(df, engine) == 0
+
+    refilled = df.copy()
+    refilled["country"] = refilled["country"].astype(object)
+    refilled.loc[refilled.index[:7], "country"] = "Atlantis"
+    refilled.loc[refilled.index[7:10], "dmin"] += 0.5
+    assert save_mysql.save_dataframe(refilled, engine) == 10
+    with engine.connect() as conn:
+        stored = conn.execute(text(f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE country = 'Atlantis'")).scalar()
+    assert stored == 7
+
+
+def test_migration_copy_uses_the_declared_schema():
+    # the keyed copy an unkeyed MySQL table is migrated into: create_table.sql's key and types, not to_sql's
+    stmt = save_mysql.table_definition(TABLE_NAME, f"{TABLE_NAME}_keyed")
+    assert stmt.startswith(f"CREATE TABLE {TABLE_NAME}_keyed (")
+    assert "id VARCHAR(100) PRIMARY KEY" in stmt and "row_hash BIGINT" in stmt
+    assert "earthquake_clusters" not in stmt
+
+
+def test_schema_indexes_are_created_once(workdir, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'indexed.db'}")
+    save_mysql.ensure_schema(engine)
+    save_mysql.ensure_schema(engine)
+    assert "idx_earthquakes_time" in {index["name"] for index in inspect(engine).get_indexes(TABLE_NAME)}
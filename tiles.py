@@ -0,0 +1,215 @@
+# tiles.py
+# Precomputed map/timeline pyramid: event counts per Web Mercator tile (quadkey) and zoom level,
+# by month and magnitude bin, so the dashboard's map only ever receives aggregated tiles.
+import numpy as np
+import pandas as pd
+from config import TILE_DIR, TILE_MAX_ZOOM, TILE_MAG_STEP, TILE_MAX_CELLS
+import aggregates
+import storage
+
+# grain of every level: tile x/y at that zoom, month (year * 12 + month - 1), magnitude bin
+TILE_DIMENSIONS = ["x", "y", "period", "mag_bin"]
+MAX_LAT = 85.05112878  # Web Mercator's latitude limit
+WORLD = (-90.0, 90.0, -180.0, 180.0)  # (lat_min, lat_max, lon_min, lon_max)
+
+
+def tile_xy(lat, lon, zoom):
+    # slippy-map tile of each point at `zoom` (y grows southwards); -1 where a coordinate is missing
+    lat = pd.to_numeric(pd.Series(lat), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    lon = pd.to_numeric(pd.Series(lon), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+    n = 2 ** zoom
+    valid = np.isfinite(lat) & np.isfinite(lon)
+    phi = np.radians(np.clip(lat[valid], -MAX_LAT, MAX_LAT))
+    x = np.full(len(lat), -1, dtype=np.int32)
+    y = np.full(len(lat), -1, dtype=np.int32)
+    x[valid] = np.clip(((lon[valid] + 180) / 360 * n).astype(np.int64), 0, n - 1)
+    y[valid] = np.clip(((1 - np.arcsinh(np.tan(phi)) / np.pi) / 2 * n).astype(np.int64), 0, n - 1)
+    return x, y
+
+
+def tile_bounds(x, y, zoom):
+    # (lat_min, lat_max, lon_min, lon_max) of tiles
+    n = 2 ** zoom
+    lon_min = np.asarray(x) / n * 360 - 180
+    lon_max = (np.asarray(x) + 1) / n * 360 - 180
+    lat_max = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(y) / n))))
+    lat_min = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (np.asarray(y) + 1) / n))))
+    return lat_min, lat_max, lon_min, lon_max
+
+
+def quadkeys(x, y, zoom):
+    # Bing-style quadkey strings ("0231..."), one digit per zoom level
+    x, y = np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64)
+    digits = np.zeros((len(x), zoom), dtype=np.uint8)
+    for i in range(zoom):
+        bit = zoom - 1 - i
+        digits[:, i] = ((x >> bit) & 1) + 2 * ((y >> bit) & 1)
+    return ["".join(map(str, row)) for row in digits] if zoom else [""] * len(x)
+
+
+def quadkey_xy(keys):
+    # (x, y, zoom) of quadkeys from one level, the inverse of quadkeys()
+    keys = list(keys)
+    zoom = len(keys[0]) if keys else 0
+    if any(len(key) != zoom for key in keys):
+        raise ValueError("quadkeys from different zoom levels")
+    digits = np.array([list(map(int, key)) for key in keys], dtype=np.int64).reshape(len(keys), zoom)
+    shifts = np.arange(zoom - 1, -1, -1)
+    x = ((digits & 1) << shifts).sum(axis=1)
+    y = ((digits >> 1) << shifts).sum(axis=1)
+    return x, y, zoom
+
+
+def period_of(dates):
+    # month index (year * 12 + month - 1) of timestamps, as in build_level
+    dates = pd.DatetimeIndex(np.atleast_1d(dates))
+    return (dates.year * 12 + dates.month - 1).to_numpy()
+
+
+def build_level(df, zoom=TILE_MAX_ZOOM):
+    """
+    Roll the cleaned events up to TILE_DIMENSIONS at `zoom`: events, mag_sum and
+    mag_n, the events with a magnitude (additive, so levels can be merged and
+    updated like the cubes). Events without
+    coordinates aren't on the map; events without a time get period -1.
+    """
+    x, y = tile_xy(df["latitude"], df["longitude"], zoom)
+    time = df["time"]
+    period = (time.dt.year * 12 + time.dt.month - 1).fillna(-1).astype("int32")
+    mag = pd.to_numeric(df["mag"], errors="coerce")
+    frame = pd.DataFrame({
+        "x": x, "y": y,
+        "period": period.to_numpy(),
+        "mag_bin": np.floor(mag / TILE_MAG_STEP).fillna(-1).astype("int16").to_numpy(),
+        "events": 1,
+        "mag_sum": mag.fillna(0).to_numpy(dtype="float64"),
+        "mag_n": mag.notna().to_numpy(dtype="int64"),
+    })
+    frame = frame[frame["x"] >= 0]
+    return frame.groupby(TILE_DIMENSIONS, sort=True).sum().reset_index()
+
+
+def coarser(level):
+    # the next zoom level out: every 2x2 block of tiles merged
+    return level.assign(x=level["x"] // 2, y=level["y"] // 2).groupby(TILE_DIMENSIONS, sort=True).sum().reset_index()
+
+
+def build_pyramid(df, max_zoom=TILE_MAX_ZOOM):
+    # {zoom: level} for zoom 0..max_zoom, the finest built from the events and each coarser one from the next
+    pyramid = {max_zoom: build_level(df, max_zoom)}
+    for zoom in range(max_zoom - 1, -1, -1):
+        pyramid[zoom] = coarser(pyramid[zoom + 1])
+    return pyramid
+
+
+def save_pyramid(pyramid):
+    for zoom, level in pyramid.items():
+        storage.save_table(level, TILE_DIR, f"tiles_z{zoom}")
+
+
+def load_pyramid(max_zoom=TILE_MAX_ZOOM):
+    # {zoom: level}, or None if it hasn't been built (or was built for another max zoom)
+    pyramid = {}
+    for zoom in range(max_zoom + 1):
+        level = storage.load_table(TILE_DIR, f"tiles_z{zoom}")
+        # a level from before mag_n can't be updated in place
+        if level is None or "mag_n" not in level.columns:
+            return None
+        pyramid[zoom] = level
+    if storage.load_table(TILE_DIR, f"tiles_z{max_zoom + 1}") is not None:
+        return None
+    return pyramid
+
+
+def refresh_tiles(df_clean, previous=None):
+    """
+    Rebuild the pyramid from the cleaned frame, or, when the previous cleaned load
+    and a stored pyramid are available, apply only the rows that changed.
+    """
+    pyramid = load_pyramid()
+    if previous is None or pyramid is None:
+        pyramid = build_pyramid(df_clean)
+    else:
+        added, removed = aggregates.diff_loads(previous, df_clean)
+        for zoom in pyramid:
+            pyramid[zoom] = aggregates.update_cube(pyramid[zoom], TILE_DIMENSIONS, added, removed,
+                                                   builder=lambda d, z=zoom: build_level(d, z))
+    save_pyramid(pyramid)
+    return pyramid
+
+
+def bbox_tiles(bbox, zoom):
+    # (x0, x1, y0, y1), inclusive, of the tiles covering bbox = (lat_min, lat_max, lon_min, lon_max)
+    lat_min, lat_max, lon_min, lon_max = bbox
+    x, y = tile_xy([lat_max, lat_min], [lon_min, lon_max], zoom)
+    return int(x[0]), int(x[1]), int(y[0]), int(y[1])
+
+
+def choose_zoom(bbox, max_cells=TILE_MAX_CELLS, max_zoom=TILE_MAX_ZOOM):
+    # the finest level at which bbox spans at most max_cells tiles
+    for zoom in range(max_zoom, -1, -1):
+        x0, x1, y0, y1 = bbox_tiles(bbox, zoom)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= max_cells:
+            return zoom
+    return 0
+
+
+def _mask(level, zoom, bbox=None, periods=None, min_mag=None, cells=None):
+    mask = np.ones(len(level), dtype=bool)
+    if cells is not None:
+        # only these tiles, (x, y) arrays at `zoom`
+        n = 2 ** zoom
+        keys = level["x"].to_numpy(dtype=np.int64) * n + level["y"].to_numpy(dtype=np.int64)
+        mask &= np.isin(keys, np.asarray(cells[0], dtype=np.int64) * n + np.asarray(cells[1], dtype=np.int64))
+    if bbox is not None:
+        x0, x1, y0, y1 = bbox_tiles(bbox, zoom)
+        x, y = level["x"].to_numpy(), level["y"].to_numpy()
+        mask &= (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+    if periods is not None:
+        period = level["period"].to_numpy()
+        mask &= (period >= periods[0]) & (period <= periods[1])
+    if min_mag is not None:
+        # bins are floor(mag / step): a threshold on a bin edge is exact
+        mask &= level["mag_bin"].to_numpy() >= np.floor(min_mag / TILE_MAG_STEP)
+    return mask
+
+
+def tile_counts(level, zoom, bbox=None, periods=None, min_mag=None):
+    """
+    One row per tile of `level` (the pyramid at `zoom`) in bbox, for the months in
+    `periods` (first, last) and bins at or above `min_mag`: quadkey, events, avg_mag
+    and the tile centre.
+    """
+    cells = level[_mask(level, zoom, bbox, periods, min_mag)]
+    cells = cells.groupby(["x", "y"], sort=False)[["events", "mag_sum", "mag_n"]].sum().reset_index()
+    lat_min, lat_max, lon_min, lon_max = tile_bounds(cells["x"], cells["y"], zoom)
+    return pd.DataFrame({
+        "quadkey": quadkeys(cells["x"], cells["y"], zoom),
+        "events": cells["events"].to_numpy(),
+        # over the events with a magnitude only; NaN for a tile that has none
+        "avg_mag": (cells["mag_sum"] / cells["mag_n"].replace(0, np.nan)).round(2).to_numpy(),
+        "lat": (lat_min + lat_max) / 2,
+        "lon": (lon_min + lon_max) / 2,
+    })
+
+
+def time_histogram(level, zoom, bbox=None, min_mag=None, cells=None):
+    # events per month inside bbox (at the tiles of `zoom`; only `cells`, (x, y), if given),
+    # every month from the first to the last
+    hist = level[_mask(level, zoom, bbox, None, min_mag, cells)]
+    hist = hist[hist["period"] >= 0].groupby("period")["events"].sum()
+    if hist.empty:
+        return pd.DataFrame({"period": [], "month": [], "events": []})
+    hist = hist.reindex(range(hist.index.min(), hist.index.max() + 1), fill_value=0)
+    return pd.DataFrame({"period": hist.index, "month": period_label(hist.index), "events": hist.to_numpy()})
+
+
+def period_label(period):
+    period = np.asarray(period)
+    return [f"{p // 12:04d}-{p % 12 + 1:02d}" for p in period]
+
+
+def periods(pyramid):
+    # the months present in the data, oldest first
+    values = pyramid[0]["period"].to_numpy()
+    return np.unique(values[values >= 0])